@@ -0,0 +1,69 @@
+from time import perf_counter
+
+import numpy as np
+from composer.utils import get_routes_with_bindings
+from django.core.management.base import BaseCommand
+from routing.matching import get_matches
+from routing.matching.context import match_context
+from routing.matching.crossings import CrossingExecutor
+from routing.matching.dijkstra import DijkstraMatcher
+from routing.matching.markov import MarkovMatcher
+from routing.matching.proximity import ProximityMatcher
+from tqdm import tqdm
+
+
+class Command(BaseCommand):
+    help = """
+        Compare the duration of the crossing-based matchers (Dijkstra and Markov)
+        when the crossings are processed serially, on threads and on processes.
+    """
+
+    def add_arguments(self, parser):
+        # Add an argument to the parser that
+        # specifies whether bindings based on OSM or DRN routes should be used.
+        parser.add_argument("--route_data", type=str, default="osm")
+        parser.add_argument("--workers", type=int, default=4)
+        # Only benchmark routes with at least this number of crossings
+        parser.add_argument("--min_crossings", type=int, default=1)
+
+    def handle(self, *args, **options):
+        route_data = options["route_data"]
+        if route_data != "osm" and route_data != "drn":
+            raise Exception(
+                "Please provide a valid value for the route_data option ('osm' or 'drn').")
+
+        routes = get_routes_with_bindings(route_data)
+        if not routes:
+            print("No routes with bindings found.")
+            return
+
+        for matcher_cls in (DijkstraMatcher, MarkovMatcher):
+            for mode in ("serial", "threads", "processes"):
+                executor = CrossingExecutor(mode, options["workers"])
+                matchers = [ProximityMatcher(search_radius_m=20), matcher_cls(executor=executor)]
+
+                n_routes = 0
+                route_durations = []
+                crossing_durations = []
+                for route in tqdm(routes, desc=f"Benchmarking {matcher_cls.__name__} ({mode})"):
+                    with match_context(route.geometry) as context:
+                        start = perf_counter()
+                        # Evaluate the matched LSAs within the measurement
+                        list(get_matches(route.geometry, matchers))
+                        duration = perf_counter() - start
+                    if len(context.crossing_timings) < options["min_crossings"]:
+                        continue
+                    n_routes += 1
+                    route_durations.append(duration)
+                    crossing_durations.extend(duration_s for _, _, duration_s in context.crossing_timings)
+                executor.shutdown()
+
+                if not route_durations:
+                    print(f"{matcher_cls.__name__} ({mode}): no routes with at least {options['min_crossings']} crossings.")
+                    continue
+
+                print(f"{matcher_cls.__name__} ({mode}, {options['workers']} workers) on {n_routes} routes:")
+                print(f"Duration per route: {np.mean(route_durations) * 1000:.1f}ms (max {np.max(route_durations) * 1000:.1f}ms)")
+                print(f"Crossings per route: {len(crossing_durations) / n_routes:.1f}")
+                print(f"Duration per crossing: {np.mean(crossing_durations) * 1000:.1f}ms "
+                      f"(p95 {np.percentile(crossing_durations, 95) * 1000:.1f}ms)")
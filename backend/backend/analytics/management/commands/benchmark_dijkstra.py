@@ -0,0 +1,123 @@
+import heapq
+import random
+from collections import defaultdict
+from time import perf_counter
+
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.geos import LineString
+from django.core.management.base import BaseCommand
+from routing.matching.dijkstra import DijkstraMatcher, StrictDijkstraMatcher
+from routing.models import LSA
+
+
+def legacy_dijkstra(graph, start, end):
+    """
+    The previous Dijkstra implementation, which copies the path into each heap entry.
+    """
+    heap = [(0, start, [])]
+    visited = {start: 0}
+    while heap:
+        (cost, current, path) = heapq.heappop(heap)
+        if current == end:
+            return path + [current]
+        for neighbor, neighbor_cost in graph[current]:
+            if neighbor not in visited or visited[neighbor] > cost + neighbor_cost:
+                visited[neighbor] = cost + neighbor_cost
+                heapq.heappush(heap, (cost + neighbor_cost, neighbor, path + [current]))
+    return []
+
+
+def legacy_create_graph(matcher, lsas, route, system=settings.METRICAL):
+    """
+    The previous graph construction of the strict matcher, with GEOS calls for each edge.
+    """
+    graph = defaultdict(list)
+    system_route = route.transform(system, clone=True)
+    for lsa in lsas:
+        lsa_geometry = lsa.geometry.transform(system, clone=True)
+        lsa_start_point = lsa_geometry.interpolate_normalized(0)
+        lsa_end_point = lsa_geometry.interpolate_normalized(1)
+        graph["start"].append((lsa.id,
+            system_route.project(lsa_start_point) * matcher.offlsa_penalty
+            + system_route.distance(lsa_start_point) * matcher.offlsa_penalty
+            + lsa_geometry.length))
+        graph[lsa.id].append(("end",
+            lsa_end_point.distance(system_route) * matcher.offlsa_penalty
+            + (system_route.length - system_route.project(lsa_end_point)) * matcher.offlsa_penalty))
+        for other_lsa in lsas:
+            if other_lsa == lsa:
+                continue
+            other_lsa_geometry = other_lsa.geometry.transform(system, clone=True)
+            other_lsa_start_point = other_lsa_geometry.interpolate_normalized(0)
+            graph[lsa.id].append((other_lsa.id,
+                lsa_end_point.distance(system_route) * matcher.offlsa_penalty
+                + abs(system_route.project(other_lsa_start_point) - system_route.project(lsa_end_point)) * matcher.offlsa_penalty
+                + system_route.distance(other_lsa_start_point) * matcher.offlsa_penalty
+                + other_lsa_geometry.length))
+    graph["start"].append(("end", system_route.length * matcher.offlsa_penalty))
+    return graph
+
+
+def synthetic_crossing(n_lsas: int):
+    """
+    Create a crossing with the given number of (unsaved) LSAs around Hamburg and a route through it.
+    """
+    lsas = []
+    for i in range(n_lsas):
+        # Connections from one of four arms into another arm of the crossing
+        angle_in, angle_out = random.sample([0, np.pi / 2, np.pi, 3 * np.pi / 2], 2)
+        offset = random.uniform(-1e-4, 1e-4)
+        coords = [
+            (9.99 + 3e-4 * np.cos(angle_in) + offset, 53.56 + 2e-4 * np.sin(angle_in)),
+            (9.99 + offset, 53.56 + offset),
+            (9.99 + 3e-4 * np.cos(angle_out) + offset, 53.56 + 2e-4 * np.sin(angle_out)),
+        ]
+        geometry = LineString(coords, srid=settings.LONLAT)
+        lsas.append(LSA(id=str(1000 + i), geometry=geometry, ingress_geometry=geometry, egress_geometry=geometry))
+    route = LineString([(9.9896, 53.56), (9.99, 53.56), (9.99, 53.5604)], srid=settings.LONLAT)
+    return lsas, route.transform(settings.METRICAL, clone=True)
+
+
+class Command(BaseCommand):
+    help = """
+        Compare the duration of the graph construction and the shortest path search
+        of the Dijkstra matchers with the previous implementation, on synthetic crossings.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repetitions", type=int, default=20)
+        parser.add_argument("--sizes", type=int, nargs="+", default=[10, 30, 60])
+
+    def measure(self, function, repetitions):
+        durations = []
+        for _ in range(repetitions):
+            start = perf_counter()
+            result = function()
+            durations.append(perf_counter() - start)
+        return result, np.median(durations) * 1000
+
+    def handle(self, *args, **options):
+        random.seed(42)
+        repetitions = options["repetitions"]
+        for n_lsas in options["sizes"]:
+            lsas, route = synthetic_crossing(n_lsas)
+            for matcher in (DijkstraMatcher(), StrictDijkstraMatcher()):
+                name = type(matcher).__name__
+
+                graph, graph_ms = self.measure(lambda: matcher.create_graph(lsas, route), repetitions)
+                path, path_ms = self.measure(graph.shortest_path, repetitions)
+
+                adjacency_list = graph.as_adjacency_list()
+                legacy_path, legacy_path_ms = self.measure(
+                    lambda: legacy_dijkstra(adjacency_list, "start", "end"), repetitions)
+                if path != legacy_path:
+                    print(f"{name} ({n_lsas} LSAs): the paths differ: {path} != {legacy_path}")
+
+                print(f"{name} with {n_lsas} LSAs:")
+                print(f"Graph construction: {graph_ms:.2f}ms")
+                print(f"Shortest path: {path_ms:.3f}ms (previous Dijkstra {legacy_path_ms:.3f}ms)")
+
+            _, legacy_graph_ms = self.measure(
+                lambda: legacy_create_graph(StrictDijkstraMatcher(), lsas, route), repetitions)
+            print(f"Previous graph construction (StrictDijkstraMatcher) with {n_lsas} LSAs: {legacy_graph_ms:.2f}ms")
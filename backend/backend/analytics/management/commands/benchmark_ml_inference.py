@@ -0,0 +1,99 @@
+from time import perf_counter
+
+import numpy as np
+from composer.utils import get_routes_with_bindings
+from django.core.management.base import BaseCommand
+from routing.matching.context import match_context
+from routing.matching.ml.features import get_feature_matrix
+from routing.matching.ml.matcher import MLMatcher
+from routing.matching.proximity import ProximityMatcher
+from routing.models import LSA
+from tqdm import tqdm
+
+
+class Command(BaseCommand):
+    help = """
+        Compare the latency per candidate of the batched ML inference
+        with the inference that classifies one candidate after another.
+    """
+
+    def add_arguments(self, parser):
+        # Add an argument to the parser that
+        # specifies whether bindings based on OSM or DRN routes should be used.
+        parser.add_argument("--route_data", type=str, default="osm")
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def time_inference(self, matcher, X, repeat):
+        """
+        Time the classification of a feature matrix, with and without batching.
+        """
+        if matcher.transformer is not None:
+            X = matcher.transformer.transform(X)
+        start = perf_counter()
+        for _ in range(repeat):
+            # Before: predict and predict_proba as two passes over a list
+            X_list = X.tolist()
+            matcher.clf.predict(X_list)
+            matcher.clf.predict_proba(X_list)
+        unbatched = (perf_counter() - start) / repeat
+        start = perf_counter()
+        for _ in range(repeat):
+            # After: a single predict_proba pass over the array
+            matcher.clf.predict_proba(X)
+        batched = (perf_counter() - start) / repeat
+        return unbatched, batched
+
+    def handle(self, *args, **options):
+        route_data = options["route_data"]
+        if route_data != "osm" and route_data != "drn":
+            raise Exception(
+                "Please provide a valid value for the route_data option ('osm' or 'drn').")
+        repeat = options["repeat"]
+
+        routes = get_routes_with_bindings(route_data)
+        if not routes:
+            print("No routes with bindings found.")
+            return
+
+        matcher = MLMatcher(route_data)
+        config = matcher.get_data_features_config()
+        proximity_matcher = ProximityMatcher(search_radius_m=20)
+        bike_lsas = LSA.objects \
+            .select_related("lsametadata") \
+            .filter(lsametadata__lane_type__icontains="Radfahrer")
+
+        n_candidates = 0
+        n_mismatches = 0
+        durations = {"matches_unbatched": 0.0, "matches_batched": 0.0, "inference_unbatched": 0.0, "inference_batched": 0.0}
+        for route in tqdm(routes, desc="Benchmarking ML inference"):
+            candidates, _ = proximity_matcher.matches(bike_lsas, route.geometry)
+            candidates = list(candidates)
+            if not candidates:
+                continue
+            n_candidates += len(candidates)
+
+            for _ in range(repeat):
+                with match_context(route.geometry):
+                    start = perf_counter()
+                    unbatched, _ = matcher.matches_per_candidate(candidates, route.geometry)
+                    durations["matches_unbatched"] += (perf_counter() - start) / repeat
+                with match_context(route.geometry):
+                    start = perf_counter()
+                    batched, _ = matcher.matches(candidates, route.geometry)
+                    durations["matches_batched"] += (perf_counter() - start) / repeat
+            if sorted(lsa.pk for lsa in unbatched) != sorted(lsa.pk for lsa in batched):
+                n_mismatches += 1
+
+            X = get_feature_matrix(candidates, route.geometry, config)
+            unbatched_inference, batched_inference = self.time_inference(matcher, np.array(X), repeat)
+            durations["inference_unbatched"] += unbatched_inference
+            durations["inference_batched"] += batched_inference
+
+        if n_candidates == 0:
+            print("No candidates found.")
+            return
+
+        print(f"Benchmarked {n_candidates} candidates on {len(routes)} routes:")
+        for name, duration in durations.items():
+            print(f"{name}: {duration / n_candidates * 1e6:.1f}us per candidate")
+        print(f"Routes with different matches: {n_mismatches}")
@@ -0,0 +1,44 @@
+from composer.utils import get_routes_with_bindings
+from django.core.management.base import BaseCommand
+from routing.matching import get_matches
+from routing.matching.context import match_context
+from routing.matching.registry import PIPELINES
+from tqdm import tqdm
+
+
+class Command(BaseCommand):
+    help = """
+        Count how many geometry transformations the matching
+        performs per route, with and without the shared match context.
+    """
+
+    def add_arguments(self, parser):
+        # Add an argument to the parser that
+        # specifies whether bindings based on OSM or DRN routes should be used.
+        parser.add_argument("--route_data", type=str, default="osm")
+
+    def handle(self, *args, **options):
+        route_data = options["route_data"]
+        if route_data != "osm" and route_data != "drn":
+            raise Exception(
+                "Please provide a valid value for the route_data option ('osm' or 'drn').")
+
+        routes = get_routes_with_bindings(route_data)
+        if not routes:
+            print("No routes with bindings found.")
+            return
+
+        for matcher_name, build_pipeline in PIPELINES.items():
+            matchers = build_pipeline(route_data)
+            n_requested = 0
+            n_performed = 0
+            for route in tqdm(routes, desc=f"Counting transforms of {matcher_name}"):
+                with match_context(route.geometry) as context:
+                    get_matches(route.geometry, matchers)
+                # Without the context, every requested transformation is performed
+                n_requested += context.n_transforms + context.n_reused
+                n_performed += context.n_transforms
+
+            print(f"Matcher {matcher_name} ({len(routes)} routes):")
+            print(f"Transforms per route before: {n_requested / len(routes):.1f}")
+            print(f"Transforms per route after: {n_performed / len(routes):.1f}")
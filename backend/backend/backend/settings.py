@@ -167,6 +167,61 @@ METRICAL = MERCATOR_SRID
 # The initial search radius in meters
 SEARCH_RADIUS_M = 20
 
+# The directory of the stamp files, which are used to signal
+# data and model changes to all gunicorn workers
+STAMP_DIR = os.environ.get('STAMP_DIR', os.path.join(BASE_DIR, 'stamps'))
+
+# The directory in which each gunicorn worker writes its metrics, which the
+# /metrics endpoint sums up. It should be cleared before the server is started.
+METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(BASE_DIR, 'metrics'))
+
+# The minimum time between two writes of the metrics of a worker, in seconds.
+# The /metrics endpoint always writes the metrics of its own worker first.
+METRICS_FLUSH_INTERVAL_S = float(os.environ.get('METRICS_FLUSH_INTERVAL_S', 1.0))
+
+# How the crossings are processed by the Dijkstra and Markov matchers,
+# either 'serial', 'threads' or 'processes' (see `CrossingExecutor`)
+CROSSING_EXECUTOR = os.environ.get('CROSSING_EXECUTOR', 'serial')
+
+# The number of workers of the crossing executor
+CROSSING_WORKERS = int(os.environ.get('CROSSING_WORKERS', os.cpu_count() or 1))
+
+# The padding in meters of the stored crossing envelopes (see `CrossingEnvelope`)
+CROSSING_ENVELOPE_PADDING_M = 20
+
+# The backend that resolves the street names for the ML features,
+# either 'graphhopper' (map matching) or 'postgis' (planet_osm_line table)
+STREET_NAME_RESOLVER = os.environ.get('STREET_NAME_RESOLVER', 'graphhopper')
+
+# The GraphHopper instance that is used for the map matching
+GRAPHHOPPER_URL = os.environ.get('GRAPHHOPPER_URL', 'http://graphhopper:8989')
+
+# The SQLite file in which the map matched street names are cached
+STREET_NAME_CACHE = os.environ.get('STREET_NAME_CACHE', os.path.join(BASE_DIR, 'street_names.sqlite3'))
+
+# The number of /routing/select responses that each worker keeps in memory
+SELECTION_CACHE_SIZE = int(os.environ.get('SELECTION_CACHE_SIZE', 512))
+
+# The redis server that shares the /routing/select responses between all workers,
+# e.g. 'redis://redis:6379/0'. If empty, the responses are only cached per worker.
+SELECTION_CACHE_REDIS_URL = os.environ.get('SELECTION_CACHE_REDIS_URL', '')
+
+# How long the shared /routing/select responses are kept, in seconds
+SELECTION_CACHE_TTL_S = int(os.environ.get('SELECTION_CACHE_TTL_S', 3600))
+
+# When a route is rematched against a previous route (see `routing.rematching`), the vertices
+# within this distance (in meters) are considered the same, and the changed part of the
+# route is padded by the margin (in meters) on both sides
+REMATCH_TOLERANCE_M = 1
+REMATCH_MARGIN_M = 100
+
+# The number of encoded signal groups that each worker keeps in memory (see `routing.encoding`)
+SIGNAL_GROUP_FRAGMENT_CACHE_SIZE = int(os.environ.get('SIGNAL_GROUP_FRAGMENT_CACHE_SIZE', 4096))
+
+# Responses with at least this many waypoints (or signal groups, for the multi lane
+# selection) are streamed to the client while they are encoded
+RESPONSE_STREAMING_MIN_ITEMS = int(os.environ.get('RESPONSE_STREAMING_MIN_ITEMS', 5000))
+
 if DEBUG:
     SHELL_PLUS = "ipython"
 
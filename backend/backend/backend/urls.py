@@ -2,12 +2,13 @@ from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 
-from backend.views import HealthcheckView, StatusView
+from backend.views import HealthcheckView, MetricsView, StatusView
 
 urlpatterns = [
     path('routing/', include('routing.urls')),
     path('status', StatusView.as_view(), name='status'),
     path('healthcheck', HealthcheckView.as_view(), name='healthcheck'),
+    path('metrics', MetricsView.as_view(), name='metrics'),
 ]
 
 if settings.DEBUG:
@@ -1,11 +1,13 @@
 from datetime import datetime
 
-from django.apps import apps
 from django.conf import settings
-from django.http import JsonResponse
+from django.db import connection
+from django.http import HttpResponse, JsonResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
+from routing import metrics
+from routing.warmup import warmup
 
 
 class StatusView(View):
@@ -20,6 +22,18 @@ class StatusView(View):
         return JsonResponse({'status': 'ok'})
 
 
+class MetricsView(View):
+    """
+    View to get the metrics of all workers in the Prometheus text format.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handle the GET request.
+        """
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class HealthcheckView(View):
     """
@@ -34,13 +48,22 @@ class HealthcheckView(View):
         if token and token != request.GET.get('token'):
             return JsonResponse({'status': 'unauthorized'}, status=401)
         
-        # Fetch all objects from all models.
-        # This will heat the cache and make sure 
-        # the database is available.
+        # Make sure the database is available.
         now = datetime.now()
-        for model in apps.get_models():
-            model.objects.all()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+
+        # Warm up this worker, if it wasn't warmed up when it was started
+        # (e.g. by the development server, which doesn't run the gunicorn hooks)
+        # or if the warm-up failed before
+        if warmup.state in ('pending', 'preloaded', 'failed'):
+            warmup.run()
         time = (datetime.now() - now).total_seconds()
+
+        # The worker is only healthy once all pipelines ran
+        if warmup.state != 'done':
+            print(f'NOT OK: Warm-up is {warmup.state}')
+            return JsonResponse({'status': 'warming up' if warmup.state == 'running' else 'error', 'time': time, 'warmup': warmup.describe()}, status=503)
         print(f'OK: Healthcheck took {time} seconds')
         
-        return JsonResponse({'status': 'ok', 'time': time})
+        return JsonResponse({'status': 'ok', 'time': time, 'warmup': warmup.describe()})
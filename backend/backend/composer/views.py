@@ -2,15 +2,11 @@ import json
 import os
 
 from django.conf import settings
-from django.contrib.gis.db.models import Extent, LineStringField
 from django.contrib.gis.geos import LineString, Point
 from django.contrib.gis.measure import D
 from django.core.serializers import serialize
 from django.forms.models import model_to_dict
 from django.db import transaction
-from django.db.models import F
-from django.db.models.aggregates import Count
-from django.db.models.functions import Cast
 from django.http.response import HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
@@ -19,6 +15,7 @@ from django.views.generic import View
 from composer.utils import check_binding_exists
 from routing.matching.projection import project_onto_route
 from routing.matching import get_matches
+from routing.matching.crossings import fetch_crossings
 from routing.matching.hypermodel import get_best_hypermodel
 from routing.models import LSA, LSAMetadata
 
@@ -253,27 +250,17 @@ class RouteCrossingsResource(View):
         lsas = LSA.objects \
             .filter(geometry__dwithin=(route.geometry, D(m=settings.SEARCH_RADIUS_M)))
 
-        # Group by the associated crossing
-        crossings = lsas \
-            .select_related("lsametadata") \
-            .annotate(crossing_id=F("lsametadata__traffic_lights_id")) \
-            .values("crossing_id") \
-            .annotate(count=Count("crossing_id")) \
-            .order_by("crossing_id")
-
-        results = []
-        for crossing in crossings:
-            # Use the Extent query to annotate the extent of each crossing
-            # Note: the cast is necessary because the geometry is a geography type
-            extent = lsas \
-                .filter(lsametadata__traffic_lights_id=crossing["crossing_id"]) \
-                .annotate(cast_geometry=Cast("geometry", LineStringField())) \
-                .aggregate(extent=Extent("cast_geometry"))
-            results.append({
-                "id": crossing["crossing_id"],
-                "lsas": crossing["count"],
-                "extent": extent["extent"]
-            })
+        # Group by the associated crossing, in two queries. Like for the matchers, the stored
+        # envelope of a crossing is only used if it spans exactly the LSAs within reach,
+        # otherwise the extent is calculated from the fetched LSA geometries.
+        results = [
+            {
+                "id": crossing.crossing_id,
+                "lsas": len(crossing.lsas),
+                "extent": crossing.envelope.extent,
+            }
+            for crossing in fetch_crossings(lsas)
+        ]
 
         return cross_origin(JsonResponse(results, safe=False))
 
@@ -0,0 +1,26 @@
+"""
+The gunicorn configuration of the production server, see run-prod.sh.
+
+The application is loaded in the master process, which also builds the matchers
+and the LSA snapshot, so that the workers share them copy-on-write instead of
+each loading them on their first request. Each worker then runs every pipeline
+once against a synthetic route before it handles requests (see `routing.warmup`).
+"""
+import gc
+
+preload_app = True
+
+
+def on_starting(server):
+    # Called in the master process, after the application was preloaded
+    from routing.warmup import warmup
+    warmup.preload()
+    # Keep the preloaded objects out of the garbage collection,
+    # which would otherwise copy their memory pages into each worker
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    # Called in each worker, before it handles requests
+    from routing.warmup import warmup
+    warmup.run(notify=worker.notify)
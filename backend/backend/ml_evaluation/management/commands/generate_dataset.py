@@ -9,7 +9,7 @@ from django.conf import settings
 from django.contrib.gis.geos import Point
 from django.core.management.base import BaseCommand
 from routing.matching import get_matches
-from routing.matching.ml.features import get_features
+from routing.matching.ml.features import complete_deferred, get_features
 from routing.matching.proximity import ProximityMatcher
 from ml_evaluation.utils import get_feature_names
 from tqdm import tqdm
@@ -75,10 +75,13 @@ def process_route(route, config):
     total_normal_projection_timings = []
     total_extended_projection_timings = []
 
+    # Features that rely on external services are extracted for all LSAs of the route at once
+    deferred = {}
+
     X, y, constellations, route_errors = [], [], [], []
     for index, lsa in enumerate(selected_lsas):
         features, projection_duplicate, original_map_topology_duplicate, feature_timings, normal_projection_timings, extended_projection_timings = get_features(
-            lsa, route.geometry, config)
+            lsa, route.geometry, config, timed=True, deferred=deferred)
 
         if projection_duplicate:
             projection_duplicates += 1
@@ -99,7 +102,7 @@ def process_route(route, config):
         route_errors.append(selected_lsas_route_errors[index])
     for lsa in nonselected_lsas:
         features, projection_duplicate, original_map_topology_duplicate, feature_timings, normal_projection_timings, extended_projection_timings = get_features(
-            lsa, route.geometry, config)
+            lsa, route.geometry, config, timed=True, deferred=deferred)
 
         if projection_duplicate:
             projection_duplicates += 1
@@ -119,6 +122,9 @@ def process_route(route, config):
         constellations.append("NOT_SELECTED")
         route_errors.append("NOT_SELECTED")
 
+    # Write the deferred features into the feature rows in X
+    complete_deferred(deferred)
+
     return X, y, constellations, route_errors, projection_duplicates, projection_no_duplicates, original_map_topology_duplicates, original_map_topology_no_duplicates,\
         total_feature_timings, total_normal_projection_timings, total_extended_projection_timings
 
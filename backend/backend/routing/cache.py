@@ -0,0 +1,230 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.gis.geos import LineString
+from routing import metrics, stamps
+from routing.matching.ml.path_configs import (models_production_path_drn,
+                                              models_production_path_osm)
+
+# The files from which the matchers are built, relative to the base directory
+MODEL_DIRS = [models_production_path_osm, models_production_path_drn]
+MODEL_FILES = ["config/topologic.hypermodel.osm.updated.json", "config/topologic.hypermodel.drn.updated.json"]
+
+
+def get_model_files() -> List[str]:
+    """
+    Return the paths of the files from which the matchers are built.
+    """
+    paths = [os.path.join(settings.BASE_DIR, path) for path in MODEL_FILES]
+    for directory in MODEL_DIRS:
+        directory = os.path.join(settings.BASE_DIR, directory)
+        if os.path.isdir(directory):
+            paths += [os.path.join(directory, name) for name in sorted(os.listdir(directory))]
+    return paths
+
+
+def get_data_version() -> str:
+    """
+    Return the version of the data that the selection results depend on.
+
+    The version changes whenever the LSAs or crossings are reloaded (see `stamps.LSAS_STAMP`),
+    a matcher reload is requested (see `stamps.MATCHERS_STAMP`) or a model file is changed.
+    """
+    parts = [str(stamps.read(stamps.LSAS_STAMP)), str(stamps.read(stamps.MATCHERS_STAMP))]
+    for path in get_model_files():
+        try:
+            stat = os.stat(path)
+            parts.append(f"{path}:{stat.st_mtime_ns}:{stat.st_size}")
+        except FileNotFoundError:
+            parts.append(f"{path}:missing")
+    return hashlib.sha1("|".join(parts).encode("utf8")).hexdigest()
+
+
+def make_key(route: LineString, matcher: str, route_data: str, version: str, format_version: int = 1) -> str:
+    """
+    Return the content address of the selection result for the route.
+
+    The route is normalized to its binary coordinates, so that the same route
+    has the same key regardless of the formatting of the request body.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"{matcher}|{route_data}|{format_version}|{version}|".encode("utf8"))
+    digest.update(bytes(route.ewkb))
+    return f"select:{digest.hexdigest()}"
+
+
+class LRUCache:
+    """
+    A thread-safe in-memory cache, which drops the least recently used entries.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: OrderedDict = OrderedDict()
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            value = self.entries.get(key)
+            if value is not None:
+                self.entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: bytes):
+        if self.maxsize <= 0:
+            return
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class RedisCache:
+    """
+    A cache that is shared by all workers (and hosts), stored in redis.
+
+    The entries expire after the given time. Connection errors are logged
+    and treated like misses, so that the selection still works without redis.
+    """
+
+    def __init__(self, client, ttl_s: int):
+        """
+        Initialize the redis cache.
+
+        :param client: The redis client (or a stand-in with `get` and `set`).
+        :param ttl_s: The time after which the entries expire, in seconds.
+        """
+        self.client = client
+        self.ttl_s = ttl_s
+
+    @classmethod
+    def from_url(cls, url: str, ttl_s: int) -> 'RedisCache':
+        import redis
+        return cls(redis.Redis.from_url(url, socket_timeout=0.5), ttl_s)
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.client.get(key)
+        except Exception as e:
+            logging.warning(f"Could not read from the shared selection cache: {e}")
+            return None
+
+    def set(self, key: str, value: bytes):
+        try:
+            self.client.set(key, value, ex=self.ttl_s)
+        except Exception as e:
+            logging.warning(f"Could not write to the shared selection cache: {e}")
+
+
+class SelectionCache:
+    """
+    A content-addressed cache of the `/routing/select` responses.
+
+    The responses are looked up in the worker-local LRU cache first and then
+    in the shared cache, if there is one. The keys contain the data version
+    (see `get_data_version`), so that the results of outdated LSAs, crossings
+    or models are never returned. When the version changes, the local entries
+    are dropped and the shared entries expire eventually.
+    """
+
+    def __init__(self, local: LRUCache, shared: Optional[RedisCache] = None):
+        self.local = local
+        self.shared = shared
+        self.version = None
+        self.lock = threading.Lock()
+        self.counters = {"localHits": 0, "sharedHits": 0, "misses": 0, "invalidations": 0}
+
+    def count(self, counter: str):
+        with self.lock:
+            self.counters[counter] += 1
+
+    def key(self, route: LineString, matcher: str, route_data: str, format_version: int = 1) -> str:
+        """
+        Return the key of the response for the route, for the current data version
+        and the given response format (see `routing.encoding`).
+        """
+        version = get_data_version()
+        with self.lock:
+            if version != self.version:
+                if self.version is not None:
+                    logging.info("The data version changed, dropping the cached selections.")
+                    self.counters["invalidations"] += 1
+                self.local.clear()
+                self.version = version
+        return make_key(route, matcher, route_data, version, format_version)
+
+    def lookup(self, key: str) -> Tuple[Optional[bytes], Optional[str]]:
+        """
+        Return the cached value and the tier ("local" or "shared") it was found in, without counting.
+        """
+        value = self.local.get(key)
+        if value is not None:
+            return value, "local"
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+                return value, "shared"
+        return None, None
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        Return the cached response, or None if it is not cached.
+        """
+        value, tier = self.lookup(key)
+        self.count({"local": "localHits", "shared": "sharedHits", None: "misses"}[tier])
+        return value
+
+    def set(self, key: str, value: bytes):
+        """
+        Cache the response in all tiers.
+        """
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def describe(self) -> Dict:
+        """
+        Describe the cache and its counters, for introspection.
+        """
+        with self.lock:
+            counters = dict(self.counters)
+        return {
+            **counters,
+            "size": len(self.local),
+            "maxSize": self.local.maxsize,
+            "shared": self.shared is not None,
+        }
+
+
+_selection_cache = None
+
+
+def get_selection_cache() -> SelectionCache:
+    """
+    Return the selection cache of this process, as configured in the settings.
+    """
+    global _selection_cache
+    if _selection_cache is None:
+        shared = None
+        if settings.SELECTION_CACHE_REDIS_URL:
+            shared = RedisCache.from_url(settings.SELECTION_CACHE_REDIS_URL, settings.SELECTION_CACHE_TTL_S)
+        _selection_cache = SelectionCache(LRUCache(settings.SELECTION_CACHE_SIZE), shared)
+        metrics.SELECTION_CACHE_EVENTS.callback = lambda: {
+            event: count for event, count in _selection_cache.describe().items()
+            if event in ("localHits", "sharedHits", "misses", "invalidations")
+        }
+    return _selection_cache
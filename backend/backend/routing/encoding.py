@@ -0,0 +1,236 @@
+import json
+import time
+from collections import namedtuple
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
+
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from routing import metrics
+from routing.cache import LRUCache
+from routing.models import LSA
+
+# The versions of the response format:
+# - 1: The waypoints of the route as objects (the default)
+# - 2: The waypoints of the route as arrays of their fields, without whitespace
+FORMAT_VERSIONS = (1, 2)
+
+# The fields of the waypoints, in the order of the arrays of format version 2 (see `make_waypoints`)
+WAYPOINT_FIELDS = ["lon", "lat", "alt", "distanceOnRoute", "distanceToNextSignal", "signalGroupId"]
+
+# JSON text that is inserted into the encoded response as is
+RawJSON = namedtuple("RawJSON", ["text"])
+
+
+def make_signal_group(lsa: LSA) -> dict:
+    """
+    Make the signal group data of the LSA, as returned by the selection views.
+    """
+    return {
+        "label": lsa.lsametadata.signal_group_id,
+        "position": {
+            "lon": lsa.start_point.x,
+            "lat": lsa.start_point.y,
+        },
+        "bearing": lsa.bearing,
+        "geometry": lsa.geometry.coords,
+        # Used to subscribe to the signal group
+        "id": lsa.lsametadata.signal_group_id,
+        "lsaId": lsa.id,
+        "connectionId": lsa.lsametadata.connection_id,
+        "laneType": lsa.lsametadata.lane_type,
+        # Used by the app to subscribe to live data streams
+        "datastreamDetectorCar": lsa.lsametadata.datastream_detector_car_id,
+        "datastreamDetectorCyclists": lsa.lsametadata.datastream_detector_cyclists_id,
+        "datastreamCycleSecond": lsa.lsametadata.datastream_cycle_second_id,
+        "datastreamPrimarySignal": lsa.lsametadata.datastream_primary_signal_id,
+        "datastreamSignalProgram": lsa.lsametadata.datastream_signal_program_id,
+    }
+
+
+class ResponseEncoder:
+    """
+    Encodes the responses of the selection views.
+
+    The encoder produces the same text as `json.dumps(value, indent=indent, ensure_ascii=False)`
+    for format version 1, but:
+    - The signal groups are inserted as pre-serialized fragments (see `signal_groups`),
+      which are cached per LSA, since they only depend on the LSA.
+    - The responses are encoded in chunks, so that very large responses can be streamed.
+    Format version 2 encodes the waypoints of the route as arrays and leaves out all whitespace.
+    The indentation is only used for format version 1.
+    """
+
+    # The fragments of the signal groups, shared by all encoders of this process
+    fragments = LRUCache(settings.SIGNAL_GROUP_FRAGMENT_CACHE_SIZE)
+
+    def __init__(self, format_version: int = 1, indent: Optional[int] = None, chunk_size: int = 1000):
+        """
+        Initialize the response encoder.
+
+        :param format_version: The version of the response format (see `FORMAT_VERSIONS`).
+        :param indent: The indentation of the JSON text, if any (only for format version 1).
+        :param chunk_size: The number of list items that are encoded at once.
+        """
+        if format_version not in FORMAT_VERSIONS:
+            raise ValueError(f"Unsupported format version: {format_version}")
+        self.format_version = format_version
+        self.compact = format_version >= 2
+        self.indent = None if self.compact else indent
+        # The default separators of json.dumps without indentation
+        self.item_separator, self.key_separator = (",", ":") if self.compact else (", ", ": ")
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def from_request(cls, request) -> 'ResponseEncoder':
+        """
+        Create the encoder for the `formatVersion` parameter of the request.
+
+        Raises a ValueError if the format version is not supported.
+        """
+        try:
+            format_version = int(request.GET.get("formatVersion", 1))
+        except ValueError:
+            raise ValueError("The parameter 'formatVersion' must be an integer.")
+        return cls(format_version, indent=2 if settings.DEBUG else None)
+
+    def dumps(self, value) -> str:
+        if self.compact:
+            return json.dumps(value, separators=(self.item_separator, self.key_separator), ensure_ascii=False)
+        return json.dumps(value, indent=self.indent, ensure_ascii=False)
+
+    def dumps_key(self, key) -> str:
+        # Like json.dumps, keys that aren't strings are encoded as strings
+        return self.dumps(key if isinstance(key, str) else json.dumps(key))
+
+    def route(self, waypoints: List[dict]) -> Union[List[dict], Dict[str, list]]:
+        """
+        Return the waypoints of the route in the format of the response.
+
+        In format version 2, the route is an object of arrays, with one array per waypoint field.
+        Fields that a waypoint doesn't have are null.
+        """
+        if not self.compact:
+            return waypoints
+        return {field: [waypoint.get(field) for waypoint in waypoints] for field in WAYPOINT_FIELDS}
+
+    def fragment(self, lsa: LSA) -> str:
+        """
+        Return the encoded signal group of the LSA.
+
+        The fragments are cached for the LSA instances, which are kept by the snapshot
+        until the LSAs are reloaded. Other instances of the same LSA are encoded again.
+        """
+        key = (lsa.pk, self.item_separator, self.key_separator)
+        cached = self.fragments.get(key)
+        if cached is not None and cached[0] is lsa:
+            return cached[1]
+        fragment = self.dumps(make_signal_group(lsa))
+        self.fragments.set(key, (lsa, fragment))
+        return fragment
+
+    def signal_groups(self, lsas: Iterable[LSA]) -> Union[Dict[str, dict], RawJSON]:
+        """
+        Return the signal groups of the LSAs by their signal group id, in the format of the response.
+
+        Without indentation, the signal groups are returned as a pre-serialized fragment.
+        """
+        lsas_by_signal_group = {}
+        for lsa in lsas:
+            lsas_by_signal_group[lsa.lsametadata.signal_group_id] = lsa
+        if self.indent is not None:
+            return {signal_group_id: make_signal_group(lsa) for signal_group_id, lsa in lsas_by_signal_group.items()}
+        return RawJSON("{" + self.item_separator.join(
+            self.dumps_key(signal_group_id) + self.key_separator + self.fragment(lsa)
+            for signal_group_id, lsa in lsas_by_signal_group.items()
+        ) + "}")
+
+    def embed(self, value):
+        """
+        Prepare the value to be inserted into another value, e.g. into a list of results.
+
+        Without indentation, the value is encoded right away and inserted as is.
+        With indentation, the value is returned unchanged, as the response is encoded as a whole.
+        """
+        if self.indent is not None:
+            return value
+        return RawJSON("".join(self.iterencode(value)))
+
+    def iterencode(self, value) -> Iterator[str]:
+        """
+        Encode the value in chunks.
+
+        Dicts are encoded item by item, lists in chunks of `chunk_size` items.
+        Raw JSON is inserted as is, within dicts and lists.
+        """
+        if isinstance(value, RawJSON):
+            yield value.text
+        elif self.indent is not None:
+            yield self.dumps(value)
+        elif isinstance(value, dict):
+            yield "{"
+            for i, (key, item) in enumerate(value.items()):
+                yield (self.item_separator if i else "") + self.dumps_key(key) + self.key_separator
+                yield from self.iterencode(item)
+            yield "}"
+        elif isinstance(value, list):
+            yield "["
+            separator = ""
+            chunk = []
+            for item in value:
+                if isinstance(item, RawJSON):
+                    if chunk:
+                        yield separator + self.dumps(chunk)[1:-1]
+                        separator, chunk = self.item_separator, []
+                    yield separator + item.text
+                    separator = self.item_separator
+                    continue
+                chunk.append(item)
+                if len(chunk) == self.chunk_size:
+                    yield separator + self.dumps(chunk)[1:-1]
+                    separator, chunk = self.item_separator, []
+            if chunk:
+                yield separator + self.dumps(chunk)[1:-1]
+            yield "]"
+        else:
+            yield self.dumps(value)
+
+    def response(
+        self,
+        value,
+        stream: bool = False,
+        on_complete: Callable[[bytes], None] = None,
+        **kwargs
+    ) -> HttpResponse:
+        """
+        Return the encoded value as a JSON response.
+
+        :param stream: Whether to send the response in chunks, as they are encoded.
+        :param on_complete: Called with the complete response body, e.g. to cache it.
+            For streamed responses, it is only called if the response was sent completely.
+        """
+        if not stream:
+            with metrics.stage("serialization"):
+                content = "".join(self.iterencode(value)).encode("utf8")
+            if on_complete is not None:
+                on_complete(content)
+            return HttpResponse(content, content_type="application/json", **kwargs)
+
+        # The response is encoded after the view returned, but still belongs to its request
+        request = metrics.get_request()
+
+        def chunks():
+            parts = []
+            duration_s = 0.0
+            start = time.perf_counter()
+            for chunk in self.iterencode(value):
+                duration_s += time.perf_counter() - start
+                parts.append(chunk)
+                yield chunk
+                start = time.perf_counter()
+            if request is not None:
+                request.add_duration("serialization", duration_s)
+                metrics.flush()
+            if on_complete is not None:
+                on_complete("".join(parts).encode("utf8"))
+
+        return StreamingHttpResponse(chunks(), content_type="application/json", **kwargs)
@@ -11,6 +11,10 @@ class Command(BaseCommand):
     Dump all bike SGs in DB to a gzipped file in the static directory.
     """
 
+    # The system checks import the URL configurations and thereby all views and
+    # matchers, which this command doesn't need
+    requires_system_checks = []
+
     def handle(self, *args, **options):
         sgs = LSA.objects.filter(lsametadata__lane_type__icontains="Radfahrer")
             
@@ -3,6 +3,7 @@ from xml.etree import ElementTree
 from django.conf import settings
 from django.contrib.gis.geos import Point
 from django.core.management.base import BaseCommand
+from routing import stamps
 from routing.models import LSACrossing
 
 
@@ -71,5 +72,9 @@ class Command(BaseCommand):
             x, y = gml_pos.split(' ')
             # Convert to WKT format
             crossing.point = Point(float(x), float(y), srid=25832).transform(settings.LONLAT, clone=True)
+            crossing.update_metric_point()
             crossing.save()
         print(f'Loaded {len(members)} crossings.')
+
+        # Let the workers rebuild their snapshot of the LSAs and crossings
+        stamps.touch(stamps.LSAS_STAMP)
@@ -2,7 +2,9 @@ import json
 
 from django.contrib.gis.geos import LineString
 from django.core.management.base import BaseCommand
+from routing import stamps
 from routing.matching.bearing import get_bearing
+from routing.matching.crossings import rebuild_crossing_envelopes
 from routing.models import LSA, LSAMetadata
 from tqdm import tqdm
 
@@ -43,6 +45,7 @@ class Command(BaseCommand):
         lon2, lat2 = lsa.geometry.coords[1][:2]
         bearing = get_bearing(lon1, lat1, lon2, lat2)
         lsa.bearing = bearing
+        lsa.update_metric_geometries()
 
         properties = thing["properties"]
         lsa_metadata = LSAMetadata(
@@ -99,3 +102,10 @@ class Command(BaseCommand):
                 print(f"Could not create LSA {thing['name']}: {e}")
 
         print(f"Done processing. {LSA.objects.count()} Things in DB.")
+
+        # The stored envelopes would still span the geometries of the previous LSAs
+        n_envelopes = rebuild_crossing_envelopes()
+        print(f"Rebuilt {n_envelopes} crossing envelopes.")
+
+        # Let the workers rebuild their snapshot of the LSAs and crossings
+        stamps.touch(stamps.LSAS_STAMP)
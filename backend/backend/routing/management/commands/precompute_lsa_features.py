@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from routing import stamps
+from routing.matching.ml.features.precomputed import compute_lsa_features
+from routing.models import LSA, LSAFeatures
+from tqdm import tqdm
+
+
+class Command(BaseCommand):
+    """
+    Precompute the route-independent ML features of all LSAs.
+
+    Make sure to call this after the LSAs were loaded.
+    """
+
+    def handle(self, *args, **options):
+        lsas = LSA.objects.select_related("lsametadata").order_by("pk")
+
+        features = []
+        n_failed = 0
+        for lsa in tqdm(lsas, desc="Precomputing LSA features"):
+            try:
+                features.append(compute_lsa_features(lsa))
+            except Exception as e:
+                n_failed += 1
+                print(f"Could not compute the features of LSA {lsa.id}: {e}")
+
+        with transaction.atomic():
+            LSAFeatures.objects.all().delete()
+            LSAFeatures.objects.bulk_create(features, batch_size=1000)
+
+        print(f"Precomputed the features of {len(features)} LSAs ({n_failed} failed).")
+
+        # Let the workers rebuild their snapshot, which includes the features
+        stamps.touch(stamps.LSAS_STAMP)
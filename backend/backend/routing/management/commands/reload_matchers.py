@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from routing import stamps
+
+
+class Command(BaseCommand):
+    """
+    Signal all workers to rebuild their matchers.
+
+    Call this command after the ML models or the hypermodel configs changed.
+    Each worker will rebuild its matchers on the next request.
+    """
+
+    def handle(self, *args, **options):
+        stamps.touch(stamps.MATCHERS_STAMP)
+        print("Requested a reload of the matchers.")
@@ -1,5 +1,7 @@
 from django.contrib.gis.measure import D
 from django.core.management.base import BaseCommand
+from routing import stamps
+from routing.matching.crossings import rebuild_crossing_envelopes
 from routing.models import LSA, LSACrossing
 
 
@@ -10,6 +12,8 @@ class Command(BaseCommand):
     For each traffic light, check if there is a crossing in less than <distance>, set that 
     crossing as connected. If there is no crossing in less than <distance>, create a new crossing.
 
+    Afterwards, rebuild the envelopes of the LSAs of each traffic light.
+
     Make sure to call load_crossings before.
     """
 
@@ -32,6 +36,7 @@ class Command(BaseCommand):
             else:
                 # Create a new crossing
                 crossing = LSACrossing(point=lsa.start_point, connected=True, name=f"LSA {lsa.id}")
+                crossing.update_metric_point()
                 crossing.save()
                 print(f"Creating new crossing {crossing.name} by LSA {lsa.id} at {crossing.point}")
         
@@ -44,3 +49,10 @@ class Command(BaseCommand):
         print(f"{n_crossings_connected} Crossings are connected.")
         print(f"{n_crossings_after - n_crossings_connected} Crossings are not connected.")
 
+        print("Rebuilding crossing envelopes...")
+        n_envelopes = rebuild_crossing_envelopes()
+        print(f"Rebuilt {n_envelopes} crossing envelopes.")
+
+        # Let the workers rebuild their snapshot of the LSAs and crossings
+        stamps.touch(stamps.LSAS_STAMP)
+
@@ -1,10 +1,36 @@
-from typing import Iterable, List, Tuple
+from typing import Iterable, List, Optional, Tuple, Union
 
 from django.conf import settings
 from django.contrib.gis.geos import LineString
 from django.db.models.query import QuerySet
+from routing import metrics
+from routing.matching.context import match_context, transform
 from routing.models import LSA
 
+# The matchers accept either a queryset or a list of LSAs,
+# e.g. the LSAs from the in-memory snapshot.
+LSACollection = Union[QuerySet, List[LSA]]
+
+
+def filter_by_pks(lsas: LSACollection, pks: Iterable) -> LSACollection:
+    """
+    Return the LSAs with the given primary keys.
+    """
+    if isinstance(lsas, QuerySet):
+        return lsas.filter(pk__in=pks)
+    pks = set(pks)
+    return [lsa for lsa in lsas if lsa.pk in pks]
+
+
+def exclude_by_pks(lsas: LSACollection, pks: Iterable) -> LSACollection:
+    """
+    Return the LSAs without the given primary keys.
+    """
+    if isinstance(lsas, QuerySet):
+        return lsas.exclude(pk__in=pks)
+    pks = set(pks)
+    return [lsa for lsa in lsas if lsa.pk not in pks]
+
 
 class RouteMatcher:
     def __init__(self, system=settings.LONLAT, *args, **kwargs):
@@ -15,13 +41,31 @@ class RouteMatcher:
         """
         self.system = system
 
+    @property
+    def stage_name(self) -> Optional[str]:
+        """
+        The name of the stage of this matcher in the request metrics.
+
+        None for matchers that record the stages of the matchers they apply,
+        so that the durations of a request are not counted twice.
+        """
+        return f"matcher:{type(self).__name__}"
+
     def matches(self, lsas: QuerySet, route: LineString) -> Tuple[QuerySet, LineString]:
         """
         Return the LSAs that match the route, as a queryset.
         """
-        route = route.transform(self.system, clone=True)
+        route = transform(route, self.system)
         return lsas, route
 
+    def matches_batch(self, batch: List[Tuple[LSACollection, LineString]]) -> List[Tuple[LSACollection, LineString]]:
+        """
+        Return the LSAs that match each route of the batch, like `matches`.
+
+        Matchers that can share work between the routes override this.
+        """
+        return [self.matches(lsas, route) for lsas, route in batch]
+
 
 class ElementwiseRouteMatcher(RouteMatcher):
     def match(self, lsa: LSA, route: LineString) -> bool:
@@ -36,15 +80,48 @@ class ElementwiseRouteMatcher(RouteMatcher):
         """
         lsas, route = super().matches(lsas, route)
         pks_to_include = [lsa.pk for lsa in lsas if self.match(lsa, route)]
-        return lsas.filter(pk__in=pks_to_include), route
+        return filter_by_pks(lsas, pks_to_include), route
 
 
-def get_matches(route: LineString, matchers: List[RouteMatcher]) -> Iterable[LSA]:
+def get_matches(route: LineString, matchers: List[RouteMatcher], lsas: Optional[LSACollection] = None) -> Iterable[LSA]:
     """
     Return all LSA's that match the route.
+
+    :param lsas: The LSAs to match. Defaults to all LSAs for cyclists in the database.
+    """
+    if lsas is None:
+        # Only consider LSA's that are also for cyclists
+        lsas = LSA.objects.filter(lsametadata__lane_type__icontains="Radfahrer")
+    # Share the transformed geometries between all matchers
+    with match_context(route):
+        for matcher in matchers:
+            with metrics.stage(matcher.stage_name):
+                lsas, _ = matcher.matches(lsas, route)
+            metrics.record_lsas(type(matcher).__name__, lsas)
+    return lsas
+
+
+def get_matches_batch(routes: List[LineString], matchers: List[RouteMatcher], lsas: Optional[LSACollection] = None) -> List[Iterable[LSA]]:
+    """
+    Return the LSAs that match each of the routes, in the order of the routes.
+
+    Each matcher processes all routes at once, see `RouteMatcher.matches_batch`.
+    The routes share one match context, so that the transformed LSA geometries
+    are reused between them.
+
+    :param lsas: The LSAs to match. Defaults to all LSAs for cyclists in the database.
     """
-    # Only consider LSA's that are also for cyclists
-    matched_lsas = LSA.objects.filter(lsametadata__lane_type__icontains="Radfahrer")
-    for matcher in matchers:
-        matched_lsas, _ = matcher.matches(matched_lsas, route)
-    return matched_lsas
+    if not routes:
+        return []
+    if lsas is None:
+        # Only consider LSA's that are also for cyclists
+        lsas = LSA.objects.filter(lsametadata__lane_type__icontains="Radfahrer")
+    with match_context(routes[0]):
+        matched = [lsas for _ in routes]
+        for matcher in matchers:
+            with metrics.stage(matcher.stage_name):
+                batch = matcher.matches_batch(list(zip(matched, routes)))
+            matched = [lsas for lsas, _ in batch]
+            for lsas in matched:
+                metrics.record_lsas(type(matcher).__name__, lsas)
+    return matched
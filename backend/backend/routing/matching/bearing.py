@@ -5,6 +5,7 @@ import numpy as np
 from django.conf import settings
 from django.contrib.gis.geos import LineString
 from routing.matching import ElementwiseRouteMatcher
+from routing.matching.context import lsa_geometry, transform
 from routing.matching.length import calc_segment_lengths, normalize_sum
 from routing.matching.projection import project_onto_route
 from routing.models import LSA
@@ -17,7 +18,7 @@ def get_linestring_bearing(linestring: LineString) -> float:
     The bearing is the direction the linestring is pointing in.
     The bearing is in the interval [0, 360].
     """
-    linestring_transformed = linestring.transform(settings.LONLAT, clone=True)
+    linestring_transformed = transform(linestring, settings.LONLAT)
     if len(linestring_transformed.coords) < 2:
         raise ValueError("LineString must have at least 2 coordinates")
 
@@ -58,27 +59,34 @@ def get_bearing(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
     return compass_bearing
 
 
-def calc_bearing_diffs(l1: LineString, l2: LineString) -> List[float]:
+def calc_segment_bearings(linestring: LineString) -> List[float]:
+    """
+    Calculates the bearings of the line segments of a linestring.
+
+    The bearings will be in the interval [0, 360].
+    """
+    coords = transform(linestring, settings.LONLAT).coords
+    return [
+        get_bearing(*last_p[:2], *p[:2])
+        for last_p, p in zip(coords[:-1], coords[1:])
+    ]
+
+
+def calc_bearing_diffs(l1: LineString, l2: LineString, bearings_l1: List[float] = None) -> List[float]:
     """
     Calculates the bearing differences between two linestrings.
 
     The bearing differences will be in the interval [0, 360].
+    The segment bearings of `l1` can be passed if they are already known.
     """
-    system = settings.LONLAT
-    system_l1 = l1.transform(system, clone=True)
-    system_l2 = l2.transform(system, clone=True)
-
-    last_p1, last_p2 = None, None
-    diffs = []
-    for (p1, p2) in zip(system_l1.coords, system_l2.coords):
-        if last_p1 is not None and last_p2 is not None:
-            bearing_1 = get_bearing(*last_p1[:2], *p1[:2])
-            bearing_2 = get_bearing(*last_p2[:2], *p2[:2])
-            bearing_diff = np.abs(bearing_1 - bearing_2)
-            diffs.append(bearing_diff)
-        last_p1, last_p2 = p1, p2
+    if bearings_l1 is None:
+        bearings_l1 = calc_segment_bearings(l1)
+    bearings_l2 = calc_segment_bearings(l2)
 
-    return diffs
+    return [
+        np.abs(bearing_1 - bearing_2)
+        for bearing_1, bearing_2 in zip(bearings_l1, bearings_l2)
+    ]
 
 
 def calc_side(l1: LineString, l2: LineString) -> str:
@@ -106,8 +114,8 @@ def calc_side(l1: LineString, l2: LineString) -> str:
 
     system = settings.LONLAT
 
-    system_l1 = l1.transform(system, clone=True)
-    system_l2 = l2.transform(system, clone=True)
+    system_l1 = transform(l1, system)
+    system_l2 = transform(l2, system)
     nearest_point_on_l2 = system_l2.interpolate(system_l2.project(system_l1.interpolate_normalized(0)))
 
     transition_bearing = get_bearing(*system_l1.coords[0][:2], *nearest_point_on_l2[:2])
@@ -176,7 +184,7 @@ class BearingMatcher(ElementwiseRouteMatcher):
         segment_lengths = []
         bearing_diffs = []
 
-        original_linestring = lsa.geometry.transform(self.system, clone=True)
+        original_linestring = lsa_geometry(lsa, self.system)
         projected_linestring = project_onto_route(original_linestring, route)
         segment_lengths += calc_segment_lengths(original_linestring)
         bearing_diffs += calc_bearing_diffs(original_linestring, projected_linestring)
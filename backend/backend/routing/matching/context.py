@@ -0,0 +1,172 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry, LineString, Point
+from pyproj import Transformer
+from routing.models import LSA
+
+
+@lru_cache(maxsize=None)
+def get_transformer(source_srid: int, target_srid: int) -> Transformer:
+    """
+    Return the (cached) transformer between two projection systems.
+    """
+    return Transformer.from_crs(f"EPSG:{source_srid}", f"EPSG:{target_srid}", always_xy=True)
+
+
+def transform_coords(coords: np.ndarray, source_srid: int, target_srid: int) -> np.ndarray:
+    """
+    Transform an array of coordinates of shape (n, 2) or (n, 3) between two projection systems.
+
+    The z coordinate is kept as is.
+    """
+    coords = np.array(coords, dtype=np.float64)
+    x, y = get_transformer(source_srid, target_srid).transform(coords[:, 0], coords[:, 1])
+    coords[:, 0] = x
+    coords[:, 1] = y
+    return coords
+
+
+def transform_geometry(geometry: GEOSGeometry, srid: int) -> GEOSGeometry:
+    """
+    Transform a point or linestring with a vectorized transformer.
+
+    Other geometry types are transformed with GEOS.
+    """
+    if isinstance(geometry, LineString):
+        return LineString(transform_coords(geometry.coords, geometry.srid, srid), srid=srid)
+    if isinstance(geometry, Point):
+        return Point(*transform_coords([geometry.coords], geometry.srid, srid)[0], srid=srid)
+    return geometry.transform(srid, clone=True)
+
+
+class MatchContext:
+    """
+    The geometries of one matching request, in all projection systems.
+
+    The route and the candidate LSA geometries are transformed once per
+    projection system and then shared by all matchers and features.
+    Note that the returned geometries are shared and must not be modified.
+    """
+
+    def __init__(self, route: LineString):
+        self.route = route
+        # The transformed geometries by the id of the original geometry and the target srid.
+        # The original geometry is kept as well, so that its id cannot be reused.
+        self.geometries: Dict[Tuple[int, int], Tuple[GEOSGeometry, GEOSGeometry]] = {}
+        # The original and transformed LSA geometries by the LSA id and the target srid
+        self.lsa_geometries: Dict[Tuple[str, int], Tuple[LineString, LineString]] = {}
+        # The linear routes by the id of the route and the srid, see `get_linear_route`
+        self.linear_routes: Dict[Tuple[int, int], tuple] = {}
+        # The number of transformations that were performed
+        self.n_transforms = 0
+        # The number of transformations that were served from the cache
+        self.n_reused = 0
+        # The processing durations of the crossings, as (matcher name, crossing id, seconds)
+        self.crossing_timings: List[Tuple[str, str, float]] = []
+
+    def transform(self, geometry: GEOSGeometry, srid: int) -> GEOSGeometry:
+        """
+        Return the geometry in the given projection system.
+        """
+        if geometry.srid == srid:
+            return geometry
+        key = (id(geometry), srid)
+        cached = self.geometries.get(key)
+        if cached is not None:
+            self.n_reused += 1
+            return cached[1]
+        transformed = transform_geometry(geometry, srid)
+        self.n_transforms += 1
+        self.geometries[key] = (geometry, transformed)
+        # Transforming back yields the original geometry
+        self.geometries[(id(transformed), geometry.srid)] = (transformed, geometry)
+        return transformed
+
+    def lsa_geometry(self, lsa: LSA, srid: int) -> LineString:
+        """
+        Return the connection geometry of the LSA in the given projection system.
+        """
+        metric_geometry = stored_metric_geometry(lsa, srid)
+        if metric_geometry is not None:
+            self.n_reused += 1
+            return metric_geometry
+        key = (lsa.pk, srid)
+        cached = self.lsa_geometries.get(key)
+        # The LSA may be a different instance of the same row (or a modified copy)
+        if cached is not None and (cached[0] is lsa.geometry or cached[0] == lsa.geometry):
+            self.n_reused += 1
+            return cached[1]
+        geometry = self.transform(lsa.geometry, srid)
+        self.lsa_geometries[key] = (lsa.geometry, geometry)
+        return geometry
+
+
+def stored_metric_geometry(lsa: LSA, srid: int) -> Optional[LineString]:
+    """
+    Return the pre-projected connection geometry of the LSA, if it can be used.
+    """
+    if srid != settings.METRICAL:
+        return None
+    # The geometry is missing if the LSA was not created by the load commands
+    metric_geometry = getattr(lsa, "metric_geometry", None)
+    return metric_geometry if isinstance(metric_geometry, LineString) else None
+
+
+_current_context: ContextVar[Optional[MatchContext]] = ContextVar("match_context", default=None)
+
+
+def get_context() -> Optional[MatchContext]:
+    """
+    Return the match context of the current request, if any.
+    """
+    return _current_context.get()
+
+
+@contextmanager
+def match_context(route: LineString):
+    """
+    Use a match context for the given route within this block.
+
+    If a context is already active, it is reused.
+    """
+    context = _current_context.get()
+    if context is not None:
+        yield context
+        return
+    context = MatchContext(route)
+    token = _current_context.set(context)
+    try:
+        yield context
+    finally:
+        _current_context.reset(token)
+
+
+def transform(geometry: GEOSGeometry, srid: int) -> GEOSGeometry:
+    """
+    Return the geometry in the given projection system.
+
+    Within a match context, the transformation is cached and the result must not
+    be modified. Otherwise, this is the same as `geometry.transform(srid, clone=True)`.
+    """
+    context = _current_context.get()
+    if context is None:
+        return geometry.transform(srid, clone=True)
+    return context.transform(geometry, srid)
+
+
+def lsa_geometry(lsa: LSA, srid: int) -> LineString:
+    """
+    Return the connection geometry of the LSA in the given projection system.
+    """
+    context = _current_context.get()
+    if context is None:
+        metric_geometry = stored_metric_geometry(lsa, srid)
+        if metric_geometry is not None:
+            return metric_geometry.clone()
+        return lsa.geometry.transform(srid, clone=True)
+    return context.lsa_geometry(lsa, srid)
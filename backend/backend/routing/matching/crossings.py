@@ -0,0 +1,229 @@
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry, LineString, MultiLineString, Polygon
+from django.db import transaction
+from django.db.models.query import QuerySet
+from routing.matching import LSACollection, RouteMatcher, filter_by_pks
+from routing.matching.context import get_context, transform
+from routing.models import LSA, CrossingEnvelope
+
+# The LSAs of a crossing, with the envelope of their geometries (in the LONLAT system).
+# If the LSAs are all LSAs of the crossing, the stored crossing envelope is given as well.
+Crossing = namedtuple("Crossing", ["crossing_id", "lsas", "envelope", "stored"])
+
+# The LSA ids that were selected for a crossing and the processing duration in seconds
+CrossingResult = namedtuple("CrossingResult", ["crossing_id", "lsa_ids", "duration_s"])
+
+
+def calc_envelope(lsas: List[LSA]) -> GEOSGeometry:
+    """
+    Calculate the envelope of the connection geometries of the LSAs, in the LONLAT system.
+    """
+    geometries = MultiLineString(
+        [transform(lsa.geometry, settings.LONLAT) for lsa in lsas], srid=settings.LONLAT)
+    return geometries.envelope
+
+
+def calc_buffered_envelope(envelope: GEOSGeometry, padding: float) -> Polygon:
+    """
+    Buffer the envelope by the padding (in meters), in the metrical system.
+    """
+    return envelope.transform(settings.METRICAL, clone=True).buffer(padding)
+
+
+def build_crossing_envelopes(padding: float = None) -> List[CrossingEnvelope]:
+    """
+    Build the (unsaved) envelopes of all crossings, from all LSAs.
+    """
+    if padding is None:
+        padding = settings.CROSSING_ENVELOPE_PADDING_M
+
+    lsas_by_crossing = defaultdict(list)
+    for lsa in LSA.objects.select_related("lsametadata").order_by("pk"):
+        lsas_by_crossing[lsa.lsametadata.traffic_lights_id].append(lsa)
+
+    envelopes = []
+    for crossing_id, crossing_lsas in lsas_by_crossing.items():
+        envelope = calc_envelope(crossing_lsas)
+        envelopes.append(CrossingEnvelope(
+            traffic_lights_id=crossing_id,
+            envelope=envelope,
+            buffered_geometry=calc_buffered_envelope(envelope, padding),
+            padding=padding,
+            lsa_ids=[lsa.pk for lsa in crossing_lsas],
+        ))
+    return envelopes
+
+
+def rebuild_crossing_envelopes(padding: float = None) -> int:
+    """
+    Replace the stored envelopes of all crossings with envelopes built from the current LSAs.
+
+    Must be called whenever the LSAs were (re)loaded, since the envelopes are not
+    linked to the LSAs. Returns the number of envelopes.
+    """
+    envelopes = build_crossing_envelopes(padding)
+    with transaction.atomic():
+        CrossingEnvelope.objects.all().delete()
+        CrossingEnvelope.objects.bulk_create(envelopes)
+    return len(envelopes)
+
+
+def fetch_crossings(lsas: LSACollection) -> List[Crossing]:
+    """
+    Group the LSAs by their crossing (traffic lights), ordered by the crossing id.
+
+    If the LSAs are a queryset, they are fetched with their crossing in a single query.
+    The stored envelopes of the crossings are looked up with another query.
+    """
+    if isinstance(lsas, QuerySet):
+        lsas = lsas.select_related("lsametadata")
+
+    lsas_by_crossing = defaultdict(list)
+    for lsa in lsas:
+        lsas_by_crossing[lsa.lsametadata.traffic_lights_id].append(lsa)
+    if not lsas_by_crossing:
+        return []
+
+    stored_envelopes = CrossingEnvelope.objects.in_bulk(list(lsas_by_crossing))
+
+    crossings = []
+    for crossing_id in sorted(lsas_by_crossing):
+        crossing_lsas = lsas_by_crossing[crossing_id]
+        stored = stored_envelopes.get(crossing_id)
+        # The stored envelope can only be used if it spans exactly the same LSAs
+        if stored is not None and set(stored.lsa_ids) == {lsa.pk for lsa in crossing_lsas}:
+            crossings.append(Crossing(crossing_id, crossing_lsas, stored.envelope, stored))
+        else:
+            crossings.append(Crossing(crossing_id, crossing_lsas, calc_envelope(crossing_lsas), None))
+    return crossings
+
+
+def process_timed(process_crossing: Callable, crossing: Crossing, route: LineString) -> Tuple[List[str], float]:
+    """
+    Process the crossing and measure the duration.
+    """
+    start = time.perf_counter()
+    lsa_ids = process_crossing(crossing, route)
+    return lsa_ids, time.perf_counter() - start
+
+
+class CrossingExecutor:
+    """
+    Processes the crossings of a route, either one after another or on a pool of workers.
+
+    The modes are:
+    - "serial": in the calling thread
+    - "threads": on a thread pool, which runs in parallel where the GIL is released (GEOS, NumPy)
+    - "processes": on a process pool, to which the crossings and the matcher are sent pickled
+
+    The pools are kept for the lifetime of the executor. Note that the workers
+    don't share the match context of the calling thread.
+    """
+
+    def __init__(self, mode: str = "serial", workers: int = 1):
+        if mode not in ("serial", "threads", "processes"):
+            raise ValueError(f"Unknown crossing executor mode: {mode}")
+        self.mode = mode
+        self.workers = workers
+        self.pool = None
+
+    def get_pool(self):
+        if self.pool is None:
+            if self.mode == "threads":
+                self.pool = ThreadPoolExecutor(max_workers=self.workers)
+            else:
+                self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self.pool
+
+    def map(self, process_crossing: Callable, crossings: List[Crossing], route: LineString) -> List[CrossingResult]:
+        """
+        Process all crossings with the given function and return the results in order.
+        """
+        if self.mode == "serial" or self.workers <= 1 or len(crossings) <= 1:
+            outcomes = [process_timed(process_crossing, crossing, route) for crossing in crossings]
+        else:
+            futures = [
+                self.get_pool().submit(process_timed, process_crossing, crossing, route)
+                for crossing in crossings
+            ]
+            outcomes = [future.result() for future in futures]
+        return [
+            CrossingResult(crossing.crossing_id, lsa_ids, duration_s)
+            for crossing, (lsa_ids, duration_s) in zip(crossings, outcomes)
+        ]
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+_executors: Dict[Tuple[str, int], CrossingExecutor] = {}
+
+
+def get_crossing_executor(mode: Optional[str] = None, workers: Optional[int] = None) -> CrossingExecutor:
+    """
+    Return the (shared) crossing executor, by default as configured in the settings.
+    """
+    key = (mode or settings.CROSSING_EXECUTOR, workers or settings.CROSSING_WORKERS)
+    executor = _executors.get(key)
+    if executor is None:
+        executor = CrossingExecutor(*key)
+        _executors[key] = executor
+    return executor
+
+
+class CrossingMatcher(RouteMatcher):
+    """
+    A matcher that selects the LSAs of each crossing separately.
+
+    All crossings are fetched at once and then processed by the crossing executor.
+    The duration of each crossing is recorded in the match context, if there is one.
+    """
+
+    def __init__(self, crossing_padding=20, executor: CrossingExecutor = None, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.crossing_padding = crossing_padding
+        self.executor = executor
+
+    def __getstate__(self):
+        # The executor is not needed (and can't be pickled) in the worker processes
+        state = self.__dict__.copy()
+        state["executor"] = None
+        return state
+
+    def get_crossing_bound(self, crossing: Crossing) -> Polygon:
+        """
+        Return the envelope of the crossing, padded by the crossing padding (in meters).
+        """
+        if crossing.stored is not None and crossing.stored.padding == self.crossing_padding:
+            buffered_envelope = crossing.stored.buffered_geometry
+        else:
+            buffered_envelope = calc_buffered_envelope(crossing.envelope, self.crossing_padding)
+        return buffered_envelope.transform(self.system, clone=True)
+
+    def process_crossing(self, crossing: Crossing, route: LineString) -> List[str]:
+        """
+        Return the ids of the LSAs of the crossing that match the route.
+        """
+        raise NotImplementedError()
+
+    def matches(self, lsas: LSACollection, route: LineString) -> Tuple[LSACollection, LineString]:
+        lsas, route = super().matches(lsas, route)
+
+        crossings = fetch_crossings(lsas)
+        executor = self.executor or get_crossing_executor()
+        results = executor.map(self.process_crossing, crossings, route)
+
+        context = get_context()
+        if context is not None:
+            context.crossing_timings.extend(
+                (type(self).__name__, result.crossing_id, result.duration_s) for result in results)
+
+        lsa_ids = [lsa_id for result in results for lsa_id in result.lsa_ids]
+        return filter_by_pks(lsas, lsa_ids), route
@@ -1,18 +1,14 @@
 import heapq
 import json
 import os
-from collections import defaultdict
-from multiprocessing.pool import ThreadPool
 from typing import Dict, List, Tuple, Union
 
+import numpy as np
 from django.conf import settings
-from django.contrib.gis.db.models.aggregates import Collect
-from django.contrib.gis.db.models.fields import LineStringField
-from django.contrib.gis.geos import LineString, MultiLineString
-from django.db.models import F
-from django.db.models.functions.comparison import Cast
-from django.db.models.query import QuerySet
-from routing.matching import RouteMatcher
+from django.contrib.gis.geos import LineString, MultiLineString, Point
+from routing.matching.context import lsa_geometry
+from routing.matching.crossings import Crossing, CrossingMatcher
+from routing.matching.linear_referencing import LinearRoute
 from routing.models import LSA
 
 
@@ -21,8 +17,8 @@ def dijkstra(graph: Dict[str, List[Tuple[str, float]]], start: str, end: str) ->
     heap = [(0, start)]
     # The visited nodes are stored as: id -> cost
     visited = {start: 0}
-    # The path ist stored as: id -> [id, ...]
-    path = {start: [start]}
+    # The predecessors are stored as: id -> id
+    predecessors = {start: None}
 
     while heap:
         cost, current = heapq.heappop(heap)
@@ -31,13 +27,131 @@ def dijkstra(graph: Dict[str, List[Tuple[str, float]]], start: str, end: str) ->
         for neighbor, neighbor_cost in graph[current]:
             if neighbor not in visited or visited[neighbor] > cost + neighbor_cost:
                 visited[neighbor] = cost + neighbor_cost
-                path[neighbor] = path[current] + [neighbor]
+                predecessors[neighbor] = current
                 heapq.heappush(heap, (visited[neighbor], neighbor))
-    
-    return path[end]
 
+    # Reconstruct the path from the end
+    path = [end]
+    while predecessors[path[-1]] is not None:
+        path.append(predecessors[path[-1]])
+    return path[::-1]
 
-class DijkstraMatcher(RouteMatcher):
+
+def dijkstra_dense(costs: np.ndarray, start: int, end: int) -> List[int]:
+    """
+    Find the shortest path in a graph that is given as a dense cost matrix.
+
+    The cost matrix contains the cost of the edge from the i-th to the j-th node
+    in costs[i, j], or infinity if there is no edge. Like in `dijkstra`, equally
+    cheap nodes are visited in the order of their indices.
+    """
+    n_nodes = len(costs)
+    distances = np.full(n_nodes, np.inf)
+    distances[start] = 0
+    predecessors = np.full(n_nodes, -1, dtype=np.intp)
+    unvisited = np.ones(n_nodes, dtype=bool)
+
+    while True:
+        current = int(np.argmin(np.where(unvisited, distances, np.inf)))
+        if not unvisited[current] or distances[current] == np.inf or current == end:
+            break
+        unvisited[current] = False
+        # Relax all edges of the current node at once
+        new_distances = distances[current] + costs[current]
+        improved = new_distances < distances
+        distances[improved] = new_distances[improved]
+        predecessors[improved] = current
+
+    # Reconstruct the path from the end
+    path = [end]
+    while predecessors[path[-1]] >= 0:
+        path.append(int(predecessors[path[-1]]))
+    return path[::-1]
+
+
+class CrossingGraph:
+    """
+    A graph between the start of a route section, the LSAs of a crossing and the end of the route section.
+
+    The graph is stored as a dense cost matrix, see `dijkstra_dense`.
+    The nodes are sorted by their ids, so that the shortest path is the same as with `dijkstra`.
+    """
+
+    # Graphs up to this number of nodes are solved on the dense matrix
+    dense_max_nodes = 64
+
+    def __init__(self, lsa_ids: List[str], start_costs: np.ndarray, end_costs: np.ndarray, lsa_costs: np.ndarray, start_end_cost: float):
+        """
+        Initialize the crossing graph.
+
+        :param lsa_ids: The ids of the LSAs.
+        :param start_costs: The costs from the start node to each LSA, of shape (n_lsas,).
+        :param end_costs: The costs from each LSA to the end node, of shape (n_lsas,).
+        :param lsa_costs: The costs from each LSA to each other LSA, of shape (n_lsas, n_lsas).
+        The diagonal is ignored, since the LSAs are not connected to themselves.
+        :param start_end_cost: The cost from the start node to the end node.
+        """
+        ids = ["start", *lsa_ids, "end"]
+        # The order of the nodes in the matrix, and the position of each node in the ids
+        self.ids = sorted(ids)
+        order = np.array([ids.index(node_id) for node_id in self.ids], dtype=np.intp)
+
+        n_lsas = len(lsa_ids)
+        costs = np.full((n_lsas + 2, n_lsas + 2), np.inf)
+        lsas = slice(1, n_lsas + 1)
+        costs[0, lsas] = start_costs
+        costs[0, -1] = start_end_cost
+        costs[lsas, -1] = end_costs
+        costs[lsas, lsas] = lsa_costs
+        costs[np.arange(1, n_lsas + 1), np.arange(1, n_lsas + 1)] = np.inf
+        self.costs = costs[np.ix_(order, order)]
+
+    def as_adjacency_list(self) -> Dict[str, List[Tuple[str, float]]]:
+        """
+        Return the graph as an adjacency list, as used by `dijkstra`: id -> [(id, cost)]
+        """
+        graph = {}
+        for i, node_id in enumerate(self.ids):
+            targets = np.flatnonzero(np.isfinite(self.costs[i]))
+            graph[node_id] = [(self.ids[j], float(self.costs[i, j])) for j in targets]
+        return graph
+
+    def shortest_path(self) -> List[str]:
+        """
+        Find the shortest path from the start node to the end node, as a list of node ids.
+        """
+        if len(self.ids) <= self.dense_max_nodes:
+            path = dijkstra_dense(self.costs, self.ids.index("start"), self.ids.index("end"))
+            return [self.ids[i] for i in path]
+        return dijkstra(self.as_adjacency_list(), "start", "end")
+
+
+def get_lsa_endpoints(lsas: List[LSA], system=settings.METRICAL) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return the start points, end points and lengths of the LSA geometries as arrays.
+    """
+    starts = np.zeros((len(lsas), 2))
+    ends = np.zeros((len(lsas), 2))
+    lengths = np.zeros(len(lsas))
+    for i, lsa in enumerate(lsas):
+        geometry = lsa_geometry(lsa, system)
+        coords = geometry.coords
+        starts[i] = coords[0][:2]
+        ends[i] = coords[-1][:2]
+        lengths[i] = geometry.length
+    return starts, ends, lengths
+
+
+def calc_distances(points_1: np.ndarray, points_2: np.ndarray) -> np.ndarray:
+    """
+    Calculate the (2D) distances between the points, with broadcasting.
+    """
+    dx = points_1[..., 0] - points_2[..., 0]
+    dy = points_1[..., 1] - points_2[..., 1]
+    return np.sqrt(dx * dx + dy * dy)
+
+
+class DijkstraMatcher(CrossingMatcher):
     """
     A Dijkstra matcher with a simple approach to the cost calculation.
 
@@ -53,22 +167,11 @@ class DijkstraMatcher(RouteMatcher):
     """
 
     def __init__(self, crossing_padding=20, offlsa_penalty=2, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.crossing_padding = crossing_padding
+        super().__init__(crossing_padding, *args, **kwargs)
         self.offlsa_penalty = offlsa_penalty
 
-    def process_crossing(self, crossing, lsas, route) -> List[str]:
-        # Use the Extent query to annotate the extent of each crossing
-        # Note: the cast is necessary because the geometry is a geography type
-        crossing_id = crossing["crossing_id"]
-        crossing_lsas = lsas.filter(lsametadata__traffic_lights_id=crossing_id)
-        crossing_geom = crossing_lsas \
-            .annotate(cast_geometry=Cast("geometry", LineStringField())) \
-            .aggregate(geom=Collect("cast_geometry"))
-        crossing_bound = crossing_geom["geom"].envelope \
-            .transform(settings.METRICAL, clone=True) \
-            .buffer(self.crossing_padding) \
-            .transform(self.system, clone=True)
+    def process_crossing(self, crossing: Crossing, route: LineString) -> List[str]:
+        crossing_bound = self.get_crossing_bound(crossing)
 
         # Get the route section that is within the crossing bound
         route_section = crossing_bound.intersection(route).transform(settings.METRICAL, clone=True)
@@ -76,75 +179,36 @@ class DijkstraMatcher(RouteMatcher):
         if len(route_section.coords) < 2:
             return []
 
-        graph = self.create_graph(crossing_lsas, route_section)
-        shortest_path = dijkstra(graph, "start", "end")
+        graph = self.create_graph(crossing.lsas, route_section)
+        shortest_path = graph.shortest_path()
         return shortest_path[1:-1] # Remove start and end
 
-    def matches(self, lsas: QuerySet, route: LineString) -> Tuple[QuerySet, LineString]:
-        lsas, route = super().matches(lsas, route)
-
-        # Group by the associated crossing
-        crossings = lsas \
-            .select_related("lsametadata") \
-            .annotate(crossing_id=F("lsametadata__traffic_lights_id")) \
-            .values("crossing_id") \
-            .distinct() \
-            .order_by("crossing_id")
-
-        lsa_ids = []
-
-        pool = ThreadPool(processes=1)
-        threads = []
-        for crossing in crossings:
-            thread = pool.apply_async(self.process_crossing, (crossing, lsas, route))
-            threads.append(thread)
-        for thread in threads:
-            lsa_ids.extend(thread.get())
-
-        return lsas.filter(id__in=lsa_ids), route
-
-    def create_graph(self, lsas: List[LSA], route: Union[LineString, MultiLineString], system=settings.METRICAL):
-        # The graph ist structured as: id -> [(id, cost)]
-        # Note that id is "start" or "end" for the start and end node
-        graph = defaultdict(list)
-
+    def create_graph(self, lsas: List[LSA], route: Union[LineString, MultiLineString], system=settings.METRICAL) -> CrossingGraph:
         system_route = route.transform(system, clone=True)
 
-        route_start_point = system_route.interpolate_normalized(0)
-        route_end_point = system_route.interpolate_normalized(1)
-
-        for lsa in lsas:
-            lsa_geometry = lsa.geometry.transform(system, clone=True)
-            lsa_start_point = lsa_geometry.interpolate_normalized(0)
-            lsa_end_point = lsa_geometry.interpolate_normalized(1)
+        route_start_point = np.array(system_route.interpolate_normalized(0).coords[:2])
+        route_end_point = np.array(system_route.interpolate_normalized(1).coords[:2])
 
-            # The route start point is connected to all lsas
-            # Cost is: route_start_point -> lsa_start_point -> lsa_end_point
-            start_point_to_lsa_cost = (self.offlsa_penalty * lsa_start_point.distance(route_start_point)) + lsa_geometry.length
-            graph["start"].append((lsa.id, start_point_to_lsa_cost))
+        lsa_start_points, lsa_end_points, lsa_lengths = get_lsa_endpoints(lsas, system)
 
-            # All lsas are connected to the route end point
-            # Cost is: lsa_end_point -> route_end_point
-            lsa_to_end_point_cost = self.offlsa_penalty * lsa_end_point.distance(route_end_point)
-            graph[lsa.id].append(("end", lsa_to_end_point_cost))
+        # The route start point is connected to all lsas
+        # Cost is: route_start_point -> lsa_start_point -> lsa_end_point
+        start_costs = (self.offlsa_penalty * calc_distances(lsa_start_points, route_start_point)) + lsa_lengths
 
-            for other_lsa in lsas:
-                if other_lsa == lsa:
-                    continue
+        # All lsas are connected to the route end point
+        # Cost is: lsa_end_point -> route_end_point
+        end_costs = self.offlsa_penalty * calc_distances(lsa_end_points, route_end_point)
 
-                other_lsa_geometry = other_lsa.geometry.transform(system, clone=True)
-                other_lsa_start_point = other_lsa_geometry.interpolate_normalized(0)
-
-                # The lsas are connected to each other
-                # Cost is: lsa_end_point -> other_lsa_start_point -> other_lsa_end_point
-                lsa_to_other_lsa_cost = (self.offlsa_penalty * lsa_end_point.distance(other_lsa_start_point)) + other_lsa_geometry.length
-                graph[lsa.id].append((other_lsa.id, lsa_to_other_lsa_cost))      
+        # The lsas are connected to each other
+        # Cost is: lsa_end_point -> other_lsa_start_point -> other_lsa_end_point
+        lsa_costs = (self.offlsa_penalty * calc_distances(lsa_end_points[:, np.newaxis], lsa_start_points[np.newaxis])) \
+            + lsa_lengths[np.newaxis]
 
         # The start point is connected to the end point
         # Cost is: route_start_point -> route_end_point
-        graph["start"].append(("end", self.offlsa_penalty * system_route.length))
-        
-        return graph
+        start_end_cost = self.offlsa_penalty * system_route.length
+
+        return CrossingGraph([lsa.id for lsa in lsas], start_costs, end_costs, lsa_costs, start_end_cost)
 
 
 class StrictDijkstraMatcher(DijkstraMatcher):
@@ -161,52 +225,51 @@ class StrictDijkstraMatcher(DijkstraMatcher):
     will presumably be lower, but the number of false negatives will be higher.
     """
 
-    def create_graph(self, lsas: List[LSA], route: Union[LineString, MultiLineString], system=settings.METRICAL):
-        # The graph ist structured as: id -> [(id, cost)]
-        # Note that id is "start" or "end" for the start and end node
-        graph = defaultdict(list)
-
+    @staticmethod
+    def project_onto_route(points: np.ndarray, route: Union[LineString, MultiLineString]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Return the distances along the route which are closest to the points, and the distances to the route.
+        """
+        if isinstance(route, LineString):
+            linear_route = LinearRoute.from_linestring(route)
+            return linear_route.project(points), linear_route.distance(points)
+        # Route sections with multiple parts are projected with GEOS
+        points = [Point(*point, srid=route.srid) for point in points]
+        return np.array([route.project(point) for point in points]), np.array([route.distance(point) for point in points])
+
+    def create_graph(self, lsas: List[LSA], route: Union[LineString, MultiLineString], system=settings.METRICAL) -> CrossingGraph:
         system_route = route.transform(system, clone=True)
 
-        for lsa in lsas:
-            lsa_geometry = lsa.geometry.transform(system, clone=True)
-            lsa_start_point = lsa_geometry.interpolate_normalized(0)
-            lsa_end_point = lsa_geometry.interpolate_normalized(1)
-
-            # 1. The route start point is connected to all lsas
-            # Cost is: route_start_point -1> closest_point_on_route -2> lsa_start_point -3> lsa_end_point
-            _1_distance_1 = system_route.project(lsa_start_point) * self.offlsa_penalty
-            _1_distance_2 = system_route.distance(lsa_start_point) * self.offlsa_penalty
-            _1_distance_3 = lsa_geometry.length
-            graph["start"].append((lsa.id, _1_distance_1 + _1_distance_2 + _1_distance_3))
-
-            # 2. All lsas are connected to the route end point
-            # Cost is: lsa_end_point -1> closest_point_on_route -2> route_end_point
-            _2_distance_1 = lsa_end_point.distance(system_route) * self.offlsa_penalty
-            _2_distance_2 = (system_route.length - system_route.project(lsa_end_point)) * self.offlsa_penalty
-            graph[lsa.id].append(("end", _2_distance_1 + _2_distance_2))
-
-            for other_lsa in lsas:
-                if other_lsa == lsa:
-                    continue
-
-                other_lsa_geometry = other_lsa.geometry.transform(system, clone=True)
-                other_lsa_start_point = other_lsa_geometry.interpolate_normalized(0)
-
-                # 3. The lsas are connected to each other
-                # Cost is: lsa_end_point -1> closest_point_on_route -2> closest_point_on_route -3> other_lsa_start_point -4> other_lsa_end_point
-                _3_distance_1 = lsa_end_point.distance(system_route) * self.offlsa_penalty
-                _3_distance_2 = abs(system_route.project(other_lsa_start_point) - system_route.project(lsa_end_point)) * self.offlsa_penalty
-                _3_distance_3 = system_route.distance(other_lsa_start_point) * self.offlsa_penalty
-                _3_distance_4 = other_lsa_geometry.length
-
-                graph[lsa.id].append((other_lsa.id, _3_distance_1 + _3_distance_2 + _3_distance_3 + _3_distance_4))      
+        lsa_start_points, lsa_end_points, lsa_lengths = get_lsa_endpoints(lsas, system)
+        start_projections, start_distances = self.project_onto_route(lsa_start_points, system_route)
+        end_projections, end_distances = self.project_onto_route(lsa_end_points, system_route)
+
+        # 1. The route start point is connected to all lsas
+        # Cost is: route_start_point -1> closest_point_on_route -2> lsa_start_point -3> lsa_end_point
+        _1_distance_1 = start_projections * self.offlsa_penalty
+        _1_distance_2 = start_distances * self.offlsa_penalty
+        _1_distance_3 = lsa_lengths
+        start_costs = _1_distance_1 + _1_distance_2 + _1_distance_3
+
+        # 2. All lsas are connected to the route end point
+        # Cost is: lsa_end_point -1> closest_point_on_route -2> route_end_point
+        _2_distance_1 = end_distances * self.offlsa_penalty
+        _2_distance_2 = (system_route.length - end_projections) * self.offlsa_penalty
+        end_costs = _2_distance_1 + _2_distance_2
+
+        # 3. The lsas are connected to each other
+        # Cost is: lsa_end_point -1> closest_point_on_route -2> closest_point_on_route -3> other_lsa_start_point -4> other_lsa_end_point
+        _3_distance_1 = (end_distances * self.offlsa_penalty)[:, np.newaxis]
+        _3_distance_2 = np.abs(start_projections[np.newaxis] - end_projections[:, np.newaxis]) * self.offlsa_penalty
+        _3_distance_3 = (start_distances * self.offlsa_penalty)[np.newaxis]
+        _3_distance_4 = lsa_lengths[np.newaxis]
+        lsa_costs = _3_distance_1 + _3_distance_2 + _3_distance_3 + _3_distance_4
 
         # The start point is connected to the end point
         # Cost is: route_start_point -> route_end_point
-        graph["start"].append(("end", system_route.length * self.offlsa_penalty))
-        
-        return graph
+        start_end_cost = system_route.length * self.offlsa_penalty
+
+        return CrossingGraph([lsa.id for lsa in lsas], start_costs, end_costs, lsa_costs, start_end_cost)
 
 
 def _write_debug_geojson(route_section, crossing_id, crossing_bound, crossing_lsas, filtered_crossing_lsas, route_hash):
@@ -5,18 +5,23 @@ from typing import List, Tuple
 from django.conf import settings
 from django.contrib.gis.geos.linestring import LineString
 from django.db.models.query import QuerySet
+from routing import metrics
 from routing.matching import RouteMatcher
-from routing.matching.bearing import BearingMatcher
-from routing.matching.dijkstra import DijkstraMatcher, StrictDijkstraMatcher
-from routing.matching.length import LengthMatcher
-from routing.matching.markov import MarkovMatcher
-from routing.matching.overlap import OverlapMatcher
-from routing.matching.proximity import ProximityMatcher
 
 
 class HypermodelMatcher(RouteMatcher):
+    """
+    A matcher which applies a sequential model of matchers, with parameters from a config file.
+
+    The matchers are imported when the sequential model is built, so that
+    importing this module doesn't load all matchers (e.g. the graph based ones).
+    """
+
     conf_file_path = os.path.join(settings.BASE_DIR, 'config/hypermodel.json')
 
+    # Each matcher of the sequential model is a stage of its own, see `matches`
+    stage_name = None
+
     def __init__(self, config, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.config = config
@@ -69,7 +74,9 @@ class HypermodelMatcher(RouteMatcher):
     def matches(self, lsas: QuerySet, route: LineString) -> Tuple[QuerySet, LineString]:
         lsas, route = super().matches(lsas, route)
         for m in self.matchers:
-            lsas, route = m.matches(lsas, route)
+            with metrics.stage(m.stage_name):
+                lsas, route = m.matches(lsas, route)
+            metrics.record_lsas(type(m).__name__, lsas)
         return lsas, route
 
 
@@ -86,6 +93,7 @@ class ProximityHypermodelMatcher(HypermodelMatcher):
 
     @classmethod
     def get_sequential_model(cls, config):
+        from routing.matching.proximity import ProximityMatcher
         return [ ProximityMatcher(**config) ]
 
     @classmethod
@@ -98,6 +106,7 @@ class BearingHypermodelMatcher(HypermodelMatcher):
 
     @classmethod
     def get_sequential_model(cls, config):
+        from routing.matching.bearing import BearingMatcher
         return [ BearingMatcher(**config) ]
 
     @classmethod
@@ -114,6 +123,7 @@ class LengthHypermodelMatcher(HypermodelMatcher):
 
     @classmethod
     def get_sequential_model(cls, config):
+        from routing.matching.length import LengthMatcher
         return [ LengthMatcher(**config) ]
 
     @classmethod
@@ -129,6 +139,7 @@ class OverlapHypermodelMatcher(HypermodelMatcher):
 
     @classmethod
     def get_sequential_model(cls, config):
+        from routing.matching.overlap import OverlapMatcher
         return [ OverlapMatcher(**config) ]
 
     @classmethod
@@ -145,6 +156,7 @@ class MarkovHypermodelMatcher(HypermodelMatcher):
 
     @classmethod
     def get_sequential_model(cls, config):
+        from routing.matching.markov import MarkovMatcher
         return [ MarkovMatcher(**config) ]
 
     @classmethod
@@ -161,6 +173,7 @@ class DijkstraHypermodelMatcher(HypermodelMatcher):
 
     @classmethod
     def get_sequential_model(cls, config):
+        from routing.matching.dijkstra import DijkstraMatcher
         return [ DijkstraMatcher(**config) ]
 
     @classmethod
@@ -176,6 +189,7 @@ class StrictDijkstraHypermodelMatcher(HypermodelMatcher):
 
     @classmethod
     def get_sequential_model(cls, config):
+        from routing.matching.dijkstra import StrictDijkstraMatcher
         return [ StrictDijkstraMatcher(**config) ]
 
     @classmethod
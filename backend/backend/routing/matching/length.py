@@ -4,6 +4,7 @@ import numpy as np
 from django.conf import settings
 from django.contrib.gis.geos import LineString, Point
 from routing.matching import ElementwiseRouteMatcher
+from routing.matching.context import lsa_geometry, transform
 from routing.matching.projection import project_onto_route
 from routing.models import LSA
 
@@ -15,7 +16,7 @@ def calc_segment_lengths(linestring: LineString, system=settings.METRICAL) -> Li
     The output format will depend on the system. Use the Mercator projection
     to obtain the lengths in meters.
     """
-    system_linestring = linestring.transform(system, clone=True)
+    system_linestring = transform(linestring, system)
 
     lengths = []
     last_point = None
@@ -29,20 +30,22 @@ def calc_segment_lengths(linestring: LineString, system=settings.METRICAL) -> Li
     return lengths
 
 
-def calc_length_diffs(l1: LineString, l2: LineString, system=settings.METRICAL) -> List[float]:
+def calc_length_diffs(l1: LineString, l2: LineString, system=settings.METRICAL, lengths_l1: List[float] = None) -> List[float]:
     """
     Calculates the segmentwise length differences between two linestrings.
 
+    The segment lengths of `l1` can be passed if they are already known.
+
     The length differences will be one of the following:
     - 0.0: Exclusively one of both linestrings has a length of 0
     - 1.0: Both linestrings have the same length or both have a length of 0
     - <float>: Otherwise
     """
 
-    system_l1 = l1.transform(system, clone=True)
-    system_l2 = l2.transform(system, clone=True)
+    system_l2 = transform(l2, system)
 
-    lengths_l1 = calc_segment_lengths(system_l1, system=system)
+    if lengths_l1 is None:
+        lengths_l1 = calc_segment_lengths(transform(l1, system), system=system)
     lengths_l2 = calc_segment_lengths(system_l2, system=system)
 
     diffs = []
@@ -103,7 +106,7 @@ class LengthMatcher(ElementwiseRouteMatcher):
         segment_lengths = []
         length_diffs = []
 
-        original_linestring = lsa.geometry.transform(self.system, clone=True)
+        original_linestring = lsa_geometry(lsa, self.system)
         projected_linestring = project_onto_route(original_linestring, route)
         segment_lengths += calc_segment_lengths(original_linestring)
         length_diffs += calc_length_diffs(original_linestring, projected_linestring)
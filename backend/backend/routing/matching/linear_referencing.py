@@ -0,0 +1,219 @@
+from functools import lru_cache
+
+import numpy as np
+from django.contrib.gis.geos import GEOSGeometry, LineString
+from routing.matching.context import get_context
+
+# The maximum number of (point, segment) pairs that are compared at once.
+# The projection creates about ten temporary arrays of this size (8 bytes per pair),
+# so this bounds its memory to a few tens of megabytes, however long the route is.
+NEAREST_CHUNK_PAIRS = 2 ** 18
+
+
+class LinearRoute:
+    """
+    A route linestring with precomputed segments, for linear referencing.
+
+    The segment vectors and the cumulative lengths are computed once,
+    so that whole coordinate arrays can be projected onto the route and
+    interpolated along the route in a single vectorized call.
+
+    The results replicate GEOS (`project`, `project_normalized`,
+    `interpolate`, `interpolate_normalized`): distances are measured
+    in 2D, the first of multiple equally near segments wins, and the
+    z coordinate is interpolated along with x and y.
+    """
+
+    def __init__(self, coords: np.ndarray, srid: int = None):
+        """
+        Initialize the linear route.
+
+        :param coords: The coordinates of the route, as an array of shape (n, 2) or (n, 3).
+        :param srid: The projection system of the coordinates.
+        """
+        self.coords = np.asarray(coords, dtype=np.float64)
+        self.srid = srid
+
+        self.starts = self.coords[:-1, :2]
+        self.ends = self.coords[1:, :2]
+        self.vectors = self.ends - self.starts
+        self.squared_lengths = self.vectors[:, 0] * self.vectors[:, 0] + self.vectors[:, 1] * self.vectors[:, 1]
+        self.segment_lengths = np.sqrt(self.squared_lengths)
+        # Accumulate sequentially (like GEOS) to get bitwise identical measures
+        self.cum_ends = np.cumsum(self.segment_lengths)
+        self.cum_starts = np.concatenate(([0.0], self.cum_ends))[:-1]
+        self.length = float(self.cum_ends[-1]) if len(self.cum_ends) else 0.0
+
+    @classmethod
+    def from_linestring(cls, linestring: LineString) -> 'LinearRoute':
+        """
+        Create a linear route from a linestring, in the system of the linestring.
+        """
+        return cls(np.array(linestring.coords, dtype=np.float64), linestring.srid)
+
+    def _nearest(self, points: np.ndarray):
+        """
+        Return the distances of the points to their nearest segments, and the measures
+        of the nearest points on these segments.
+
+        The points are compared with all segments in chunks of points,
+        so that the memory use is bounded (see `NEAREST_CHUNK_PAIRS`).
+        """
+        points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+        chunk_size = max(1, NEAREST_CHUNK_PAIRS // max(1, len(self.segment_lengths)))
+        if len(points) <= chunk_size:
+            return self._nearest_chunk(points)
+
+        distances = np.empty(len(points))
+        measures = np.empty(len(points))
+        for i in range(0, len(points), chunk_size):
+            distances[i:i + chunk_size], measures[i:i + chunk_size] = self._nearest_chunk(points[i:i + chunk_size])
+        return distances, measures
+
+    def _nearest_chunk(self, points: np.ndarray):
+        """
+        Return the nearest distances and measures of a chunk of points, like `_nearest`.
+        """
+        px = points[:, 0, np.newaxis]
+        py = points[:, 1, np.newaxis]
+        ax, ay = self.starts[:, 0], self.starts[:, 1]
+        bx, by = self.ends[:, 0], self.ends[:, 1]
+        dx, dy = self.vectors[:, 0], self.vectors[:, 1]
+        len2 = self.squared_lengths
+        degenerate = len2 <= 0
+        safe_len2 = np.where(degenerate, 1.0, len2)
+
+        with np.errstate(invalid="ignore"):
+            r = ((px - ax) * dx + (py - ay) * dy) / safe_len2
+
+            # The distance from each point to each segment
+            dist_a = np.sqrt((px - ax) * (px - ax) + (py - ay) * (py - ay))
+            dist_b = np.sqrt((px - bx) * (px - bx) + (py - by) * (py - by))
+            s = ((ay - py) * dx - (ax - px) * dy) / safe_len2
+            dist_perp = np.abs(s) * np.sqrt(len2)
+            distances = np.where(
+                degenerate | (r <= 0), dist_a,
+                np.where(r >= 1, dist_b, dist_perp)
+            )
+
+            # The measure of the nearest point on each segment
+            on_a = (px == ax) & (py == ay)
+            on_b = (px == bx) & (py == by)
+            factors = np.where(on_a, 0.0, np.where(on_b, 1.0, np.where(degenerate, np.nan, r)))
+            measures = np.where(
+                factors <= 0, self.cum_starts,
+                np.where(factors <= 1, self.cum_starts + factors * self.segment_lengths,
+                         self.cum_starts + self.segment_lengths)
+            )
+
+        # Take the first segment with the smallest distance
+        nearest = np.argmin(distances, axis=1)
+        rows = np.arange(len(points))
+        return distances[rows, nearest], measures[rows, nearest]
+
+    def project(self, points: np.ndarray) -> np.ndarray:
+        """
+        Return the distances along the route which are closest to the points.
+
+        :param points: The points, as an array of shape (m, 2) or (m, 3).
+        """
+        if len(self.segment_lengths) == 0:
+            return np.full(len(np.atleast_2d(points)), -1.0)
+        return self._nearest(points)[1]
+
+    def distance(self, points: np.ndarray) -> np.ndarray:
+        """
+        Return the (2D) distances of the points to the route.
+
+        :param points: The points, as an array of shape (m, 2) or (m, 3).
+        """
+        if len(self.segment_lengths) == 0:
+            points = np.atleast_2d(np.asarray(points, dtype=np.float64))
+            return np.sqrt(((points[:, :2] - self.coords[0, :2]) ** 2).sum(axis=1))
+        return self._nearest(points)[0]
+
+    def project_normalized(self, points: np.ndarray) -> np.ndarray:
+        """
+        Return the fractions of the route which are closest to the points.
+        """
+        distances = self.project(points)
+        if self.length == 0:
+            return np.zeros_like(distances)
+        return distances / self.length
+
+    def interpolate(self, distances: np.ndarray) -> np.ndarray:
+        """
+        Return the points at the given distances along the route.
+
+        Negative distances are measured from the end of the route.
+        The points have the same dimension as the route coordinates.
+        """
+        distances = np.asarray(distances, dtype=np.float64).reshape(-1)
+        distances = np.where(distances < 0, self.length + distances, distances)
+
+        if len(self.segment_lengths) == 0:
+            return np.repeat(self.coords[:1], len(distances), axis=0)
+
+        # The first segment that ends after the distance
+        indices = np.searchsorted(self.cum_ends, distances, side="right")
+        past_end = indices >= len(self.segment_lengths)
+        indices = np.minimum(indices, len(self.segment_lengths) - 1)
+
+        p0 = self.coords[indices]
+        p1 = self.coords[indices + 1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            fractions = (distances - self.cum_starts[indices]) / self.segment_lengths[indices]
+            fractions = fractions[:, np.newaxis]
+            points = np.where(
+                fractions <= 0, p0,
+                np.where(fractions >= 1, p1, (p1 - p0) * fractions + p0)
+            )
+
+        points[past_end] = self.coords[-1]
+        points[distances <= 0] = self.coords[0]
+        return points
+
+    def interpolate_normalized(self, fractions: np.ndarray) -> np.ndarray:
+        """
+        Return the points at the given fractions of the route.
+        """
+        return self.interpolate(np.asarray(fractions, dtype=np.float64) * self.length)
+
+    def substring(self, start: float, end: float) -> np.ndarray:
+        """
+        Return the coordinates of the part of the route between the given distances along the route.
+
+        The part starts and ends with the interpolated points and contains all route vertices in between.
+        """
+        start = min(max(start, 0.0), self.length)
+        end = min(max(end, start), self.length)
+        measures = np.concatenate(([0.0], self.cum_ends))
+        inner = (measures > start) & (measures < end)
+        start_point, end_point = self.interpolate([start, end])
+        return np.concatenate(([start_point], self.coords[inner], [end_point]))
+
+
+@lru_cache(maxsize=32)
+def _get_linear_route(hexewkb: bytes, system: int) -> LinearRoute:
+    route = GEOSGeometry(hexewkb)
+    return LinearRoute.from_linestring(route.transform(system, clone=True))
+
+
+def get_linear_route(route: LineString, system: int) -> LinearRoute:
+    """
+    Return the linear route for the route in the given projection system.
+
+    The linear routes of recently used routes are cached, so that the
+    matchers can project many linestrings onto the same route cheaply.
+    """
+    context = get_context()
+    if context is None:
+        return _get_linear_route(route.hexewkb, system)
+
+    # Within a match context, cache by the route instance and share the transformed route
+    key = (id(route), system)
+    cached = context.linear_routes.get(key)
+    if cached is None:
+        cached = (route, LinearRoute.from_linestring(context.transform(route, system)))
+        context.linear_routes[key] = cached
+    return cached[1]
@@ -2,21 +2,17 @@ import hashlib
 import heapq
 import json
 import math
-from multiprocessing.pool import ThreadPool
 import os
-from collections import defaultdict
 from functools import cached_property
-from typing import Dict, List, Tuple, Union
+from typing import List, Union
 
+import numpy as np
 from django.conf import settings
-from django.contrib.gis.db.models.aggregates import Collect
-from django.contrib.gis.db.models.fields import LineStringField
 from django.contrib.gis.geos import LineString, MultiLineString
 from django.contrib.gis.geos.point import Point
-from django.db.models import F
-from django.db.models.functions.comparison import Cast
-from django.db.models.query import QuerySet
-from routing.matching import RouteMatcher
+from routing.matching.context import lsa_geometry
+from routing.matching.crossings import Crossing, CrossingMatcher
+from routing.matching.linear_referencing import LinearRoute
 from routing.models import LSA
 
 
@@ -90,8 +86,8 @@ def calc_route_distance(origin: MarkovModelNode, target: MarkovModelNode) -> flo
 
     # Make sure we use the correct projection
     projection = settings.METRICAL
-    origin_lsa_geom = origin.lsa.geometry.transform(projection, clone=True) if origin.lsa else None
-    target_lsa_geom = target.lsa.geometry.transform(projection, clone=True) if target.lsa else None
+    origin_lsa_geom = lsa_geometry(origin.lsa, projection) if origin.lsa else None
+    target_lsa_geom = lsa_geometry(target.lsa, projection) if target.lsa else None
 
     if origin.lsa is not None and target.lsa is not None:
         if origin.lsa.id == target.lsa.id:
@@ -188,125 +184,139 @@ class MarkovModelEdge:
 
 
 class MarkovModel:
-    def __init__(self, beta: float, nodes: List[MarkovModelNode]):
-        self.beta = beta
-
-        assert len(nodes[0]) == 1
-        self.start_node = nodes[0][0]
-        assert(len(nodes[-1])) == 1
-        self.end_node = nodes[-1][0]
-
-        self.nodes = nodes
+    def __init__(
+        self,
+        lsa_ids: List[str],
+        log_emissions: np.ndarray,
+        log_transitions: np.ndarray,
+        log_start_transitions: np.ndarray,
+        log_end_transitions: np.ndarray,
+        log_start_end_emission: float,
+    ):
+        """
+        Initialize the Markov model (DAG).
+
+        The DAG has a start layer with the start point of the route, a layer for
+        each route point with one node per LSA, and an end layer with the end point
+        of the route. Consecutive layers are fully connected. All probabilities are
+        given as log-probabilities, so that long route sections don't underflow.
+
+        :param lsa_ids: The LSA ids of the nodes in each route point layer.
+        :param log_emissions: The emission log-probabilities, of shape (n_points, n_lsas).
+        :param log_transitions: The transition log-probabilities between the route point
+        layers, of shape (n_points - 1, n_lsas, n_lsas), indexed by [layer, origin, target].
+        :param log_start_transitions: The transition log-probabilities from the start node, of shape (n_lsas,).
+        :param log_end_transitions: The transition log-probabilities to the end node, of shape (n_lsas,).
+        :param log_start_end_emission: The emission log-probability of the start and end node.
+        """
+        self.lsa_ids = lsa_ids
+        self.log_emissions = log_emissions
+        self.log_transitions = log_transitions
+        self.log_start_transitions = log_start_transitions
+        self.log_end_transitions = log_end_transitions
+        self.log_start_end_emission = log_start_end_emission
 
     @classmethod
     def build_model(cls, sigma_z: float, beta: float, route_points: List[Point], crossing_lsas: List[LSA]) -> 'MarkovModel':
         """
         Build a Markov model (DAG) from the given route points and crossing LSAs.
-        """
-        # See https://github.com/valhalla/valhalla/blob/master/docs/meili/algorithms.md
-        nodes = []
-        # Add the route start point to the DAG as the initial layer
-        start_point = MarkovModelNode("start", None, sigma_z, route_points[0], route_points[0])
-        nodes.append([start_point])
-
-        for point_on_route in route_points:
-            # Project the point onto each LSA
-            layer_nodes = []
-            for lsa in crossing_lsas:
-                geometry = lsa.geometry.transform(settings.METRICAL, clone=True)
-                fraction = geometry.project_normalized(point_on_route)
-                point_on_lsa = geometry.interpolate_normalized(fraction)
-                node = MarkovModelNode(lsa.id, lsa, sigma_z, point_on_lsa, point_on_route)
-                layer_nodes.append(node)
-            nodes.append(layer_nodes)
-
-        # Add the route end point to the DAG as the final layer
-        end_point = MarkovModelNode("end", None, sigma_z, route_points[-1], route_points[-1])
-        nodes.append([end_point])
-
-        # Build the Markov model
-        return cls(beta, nodes)
 
-    @cached_property
-    def adjacency_list(self) -> Dict[MarkovModelNode, List[MarkovModelNode]]:
+        The probabilities are the same as for `MarkovModelNode` and `MarkovModelEdge`,
+        but computed for all nodes and edges at once. Each LSA geometry is only
+        transformed once, and all route points are projected onto it in one call.
         """
-        Create the adjacency list of the Markov model.
-        """
-        adjacency_list = defaultdict(list)
-        for layer_1, layer_2 in zip(self.nodes[:-1], self.nodes[1:]):
-            # Layers are fully connected
-            for node_1 in layer_1:
-                for node_2 in layer_2:
-                    adjacency_list[node_1].append(node_2)
-        adjacency_list[self.end_node] = []
-        return adjacency_list
+        # See https://github.com/valhalla/valhalla/blob/master/docs/meili/algorithms.md
+        crossing_lsas = list(crossing_lsas)
+        # Make sure that we use the correct projection
+        projection = settings.METRICAL
+        z = np.array([
+            (point if point.srid == projection else point.transform(projection, clone=True)).coords[:2]
+            for point in route_points
+        ], dtype=np.float64).reshape(-1, 2)
+        n_points, n_lsas = len(z), len(crossing_lsas)
+
+        # The distances along the LSAs which are closest to the route points,
+        # and the corresponding points on the LSAs (the `x` points of the nodes)
+        measures = np.zeros((n_points, n_lsas))
+        x = np.zeros((n_points, n_lsas, 2))
+        lengths = np.zeros(n_lsas)
+        lsa_starts = np.zeros((n_lsas, 2))
+        lsa_ends = np.zeros((n_lsas, 2))
+        for i, lsa in enumerate(crossing_lsas):
+            linear_lsa = LinearRoute.from_linestring(lsa_geometry(lsa, projection))
+            measures[:, i] = linear_lsa.project(z)
+            x[:, i] = linear_lsa.interpolate(measures[:, i])[:, :2]
+            lengths[i] = linear_lsa.length
+            lsa_starts[i] = linear_lsa.coords[0, :2]
+            lsa_ends[i] = linear_lsa.coords[-1, :2]
+
+        # The emission probabilities, see `MarkovModelNode.emission_probability`
+        log_c = -math.log(sigma_z * math.sqrt(2 * math.pi))
+        great_circle_distances = np.linalg.norm(z[:, np.newaxis] - x, axis=2)
+        log_emissions = log_c - great_circle_distances**2
+
+        # The transition probabilities, see `MarkovModelEdge.transition_probability`
+        # and `calc_route_distance` for the route distances
+        def log_transition(great_circle_dist, route_dist):
+            return -math.log(beta) - np.abs(great_circle_dist - route_dist) / beta
+
+        # From the end of the origin LSA to the start of the target LSA
+        lsa_transition_distances = np.linalg.norm(lsa_ends[:, np.newaxis] - lsa_starts[np.newaxis], axis=2)
+        log_transitions = np.zeros((max(n_points - 1, 0), n_lsas, n_lsas))
+        diagonal = np.arange(n_lsas)
+        for k in range(n_points - 1):
+            route_distances = (lengths - measures[k])[:, np.newaxis] + lsa_transition_distances + measures[k + 1][np.newaxis]
+            # Along the LSA, if both nodes are on the same LSA
+            route_distances[diagonal, diagonal] = np.abs(measures[k + 1] - measures[k])
+            log_transitions[k] = log_transition(np.linalg.norm(z[k + 1] - z[k]), route_distances)
+
+        # The start and end node are on the first and last route point
+        log_start_transitions = log_transition(0, np.linalg.norm(z[0] - lsa_starts, axis=1) + measures[0])
+        log_end_transitions = log_transition(0, (lengths - measures[-1]) + np.linalg.norm(lsa_ends - z[-1], axis=1))
+
+        return cls([lsa.id for lsa in crossing_lsas], log_emissions, log_transitions,
+                   log_start_transitions, log_end_transitions, log_c)
 
     def viterbi(self) -> List[str]:
         """
         Find the most probable path in the graph using Viterbi's algorithm.
 
-        The path will be returned as a list of ordered lsa ids.
+        The path will be returned as a list of lsa ids, one for each route point.
+        If there is no path, an empty list is returned.
         """
-        s: MarkovModelNode = self.start_node
-        t: MarkovModelNode = self.end_node
-        joint_prob = {}
-        for u in self.adjacency_list:
-            joint_prob[u] = 0
-        predecessor = {}
-        fifo_queue = []
-
-        fifo_queue.append(s)
-        joint_prob[s] = s.emission_probability
-        predecessor[s] = None
-        while fifo_queue:
-            u = fifo_queue.pop(0)
-            if u == t:
-                break
-            for v in self.adjacency_list[u]:
-                # Relaxation
-                edge = MarkovModelEdge(self.beta, u, v)
-                new_prob = joint_prob[u] * edge.transition_probability * v.emission_probability
-                if joint_prob[v] < new_prob:
-                    joint_prob[v] = new_prob
-                    predecessor[v] = u
-                if v not in fifo_queue:
-                    fifo_queue.append(v)
-        
-        # Reconstruct the path
-        path = []
-        curr_v = t
-        while curr_v != s:
-            path.append(curr_v)
-            try:
-                curr_v = predecessor[curr_v]
-            except KeyError:
-                return []
-        path.append(s)
+        n_points, n_lsas = self.log_emissions.shape
+        if n_points == 0 or n_lsas == 0:
+            return []
 
-        reversed_path = path[::-1] # Reverse the reconstructed path
-        return reversed_path
+        # The log-probability of the most probable path to each node of the current layer
+        log_probs = self.log_start_end_emission + self.log_start_transitions + self.log_emissions[0]
+        # The best predecessor of each node, for each layer
+        predecessors = np.zeros((n_points, n_lsas), dtype=np.intp)
+        targets = np.arange(n_lsas)
+        for k in range(1, n_points):
+            candidates = log_probs[:, np.newaxis] + self.log_transitions[k - 1]
+            # Like in a relaxation, the first of multiple equally probable predecessors wins
+            predecessors[k] = np.argmax(candidates, axis=0)
+            log_probs = candidates[predecessors[k], targets] + self.log_emissions[k]
+        log_probs = log_probs + self.log_end_transitions + self.log_start_end_emission
+
+        # Reconstruct the path
+        node = int(np.argmax(log_probs))
+        path = [node]
+        for k in range(n_points - 1, 0, -1):
+            node = int(predecessors[k, node])
+            path.append(node)
+        return [self.lsa_ids[i] for i in reversed(path)]
 
 
-class MarkovMatcher(RouteMatcher):
+class MarkovMatcher(CrossingMatcher):
     def __init__(self, crossing_padding=10, sigma_z=4.07, beta=3, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.crossing_padding = crossing_padding
+        super().__init__(crossing_padding, *args, **kwargs)
         self.sigma_z = sigma_z
         self.beta = beta
 
-    def process_crossing(self, crossing, lsas, route) -> List[str]:
-        # Use the Extent query to annotate the extent of each crossing
-        # Note: the cast is necessary because the geometry is a geography type
-        crossing_id = crossing["crossing_id"]
-        crossing_lsas = lsas.filter(lsametadata__traffic_lights_id=crossing_id)
-        # Use only the lsas that were selected beforehand in the lsas queryset
-        crossing_geom = crossing_lsas \
-            .annotate(cast_geometry=Cast("geometry", LineStringField())) \
-            .aggregate(geom=Collect("cast_geometry"))
-        crossing_bound = crossing_geom["geom"].envelope \
-            .transform(settings.METRICAL, clone=True) \
-            .buffer(self.crossing_padding) \
-            .transform(self.system, clone=True)
+    def process_crossing(self, crossing: Crossing, route: LineString) -> List[str]:
+        crossing_bound = self.get_crossing_bound(crossing)
 
         # Get the route section that is within the crossing bound
         route_section = crossing_bound.intersection(route).transform(settings.METRICAL, clone=True)
@@ -329,40 +339,9 @@ class MarkovMatcher(RouteMatcher):
         if len(route_section.coords) < 2:
             return []
 
-        points_on_route = route_points.copy()
-        while len(points_on_route) > 1:
-            model = MarkovModel.build_model(self.sigma_z, self.beta, points_on_route, crossing_lsas)
-            best_path: List[MarkovModelNode] = model.viterbi()[1:][:-1]
-            if not best_path:
-                # Remove the first route point
-                points_on_route.pop(0)
-                continue
-            return [node.id for node in best_path]
-        return []
-
-    def matches(self, lsas: QuerySet, route: LineString) -> Tuple[QuerySet, LineString]:
-        lsas, route = super().matches(lsas, route)
-        lsas_ids = lsas.values_list("pk", flat=True)
-
-        # Group by the associated crossing
-        crossings = lsas \
-            .select_related("lsametadata") \
-            .annotate(crossing_id=F("lsametadata__traffic_lights_id")) \
-            .values("crossing_id") \
-            .distinct() \
-            .order_by("crossing_id")
-
-        lsa_ids = []
-
-        pool = ThreadPool(processes=1)
-        threads = []
-        for crossing in crossings:
-            thread = pool.apply_async(self.process_crossing, (crossing, lsas, route))
-            threads.append(thread)
-        for thread in threads:
-            lsa_ids.extend(thread.get())
-
-        return lsas.filter(id__in=lsa_ids), route
+        # In log-space, there is always a path if the crossing has LSAs
+        model = MarkovModel.build_model(self.sigma_z, self.beta, route_points, crossing.lsas)
+        return model.viterbi()
 
 
 def _write_debug_geojson(route_section, crossing_id, crossing_bound, crossing_lsas, best_path):
@@ -1,18 +1,20 @@
-from typing import List
+from typing import Dict, Iterable, List, Optional, Tuple
 import time
 from routing.matching.ml.features.types import Timing
+from routing import metrics
 
 import numpy as np
 from django.conf import settings
 from django.contrib.gis.geos import LineString, Point
+from routing.matching.context import lsa_geometry, match_context, transform
 from routing.matching.projection import project_onto_route, project_onto_route_new, get_extended_projected_linestring
 from routing.matching.ml.utils import remove_duplicate_coordinates
-from routing.models import LSA
+from routing.models import LSA, LSAFeatures
 
 class FeatureExtractionState:
     def __init__(
         self,
-        features: List[float],
+        features: np.ndarray,
         lsa: LSA,
         lsa_system_linestring: LineString,
         lsa_projected_linestring: LineString,
@@ -20,11 +22,19 @@ class FeatureExtractionState:
         route_system_linestring: LineString,
         config: map,
         feature_timing_sums: List[Timing],
+        timed: bool = False,
+        precomputed: Optional[LSAFeatures] = None,
+        deferred: Optional[Dict[type, list]] = None,
         *args,
         **kwargs
     ):
         """
         Initialize the feature state object.
+
+        :param features: The preallocated row that the extractors write their features into.
+        :param timed: Whether the extractors should record their timings in `feature_timing_sums`.
+        :param precomputed: The route-independent features of the LSA, if available.
+        :param deferred: If given, extractors can defer their features to be extracted in a batch.
         """
         self.features = features
         self.lsa = lsa
@@ -34,6 +44,26 @@ class FeatureExtractionState:
         self.route_system_linestring = route_system_linestring
         self.config = config
         self.feature_timing_sums = feature_timing_sums
+        self.timed = timed
+        self.precomputed = precomputed
+        self.deferred = deferred
+        # The column of the features row that the next feature is written to
+        self.cursor = 0
+
+    def write(self, values):
+        """
+        Write features into the row, after the previously written features.
+        """
+        self.features[self.cursor:self.cursor + len(values)] = values
+        self.cursor += len(values)
+
+    def defer(self, extractor, payload):
+        """
+        Defer the features of the extractor at the cursor, see `complete_deferred`.
+
+        The extractor should still write placeholder values for its features.
+        """
+        self.deferred.setdefault(extractor, []).append((self.features, self.cursor, payload))
 
 class FeatureExtractor:
     def __init__(self, *args, **kwargs):
@@ -65,24 +95,75 @@ class FeatureExtractor:
             dict: An object with all the statistics for the features.
         """
 
-def get_features(lsa: LSA, route_linestring: LineString, config):
+    @classmethod
+    def get_number_of_features(cls, config) -> int:
+        """Gets the number of features that the extractor writes with the given config.
+
+        Returns:
+            int: The number of features
+        """
+        return len(cls.FEATURE_NAMES)
+
+    @classmethod
+    def complete_deferred(cls, deferred):
+        """Writes the deferred features of the extractor.
+
+        Args:
+            deferred: A list of (features row, column, payload) tuples, see `FeatureExtractionState.defer`
+        """
+
+
+class FeatureLayout:
     """
-    Extract features from a LSA with regards to the route.
+    The columns of the feature matrix for a data/feature config.
+
+    Each extractor of the config writes its features into a fixed range
+    of columns, so that the features of many LSAs can be written into
+    a preallocated matrix.
     """
 
-    # Important for length features! For bearing LONLAT is better and the transformation
-    # into the LONLAT system happens in the respective feature extractors
-    system = settings.METRICAL
+    # The dtype of the feature matrix
+    dtype = np.float32
 
-    lsa_linestring = lsa.geometry
+    def __init__(self, config):
+        self.extractors = config["feature_extractor_combination"]
+        # The first column of each extractor
+        self.offsets = {}
+        self.width = 0
+        for extractor in self.extractors:
+            self.offsets[extractor] = self.width
+            self.width += extractor.get_number_of_features(config)
 
-    if len(lsa_linestring.coords) < 2:
-        raise ValueError("LSA LineString must have at least 2 coordinates")
-    if len(route_linestring.coords) < 2:
-        raise ValueError("Route LineString must have at least 2 coordinates")
+    def allocate(self, n_rows: int) -> np.ndarray:
+        """
+        Return a feature matrix for the given number of LSAs.
+        """
+        return np.zeros((n_rows, self.width), dtype=self.dtype)
+
+
+# The compiled layouts by the id of the config, with the config itself
+# to make sure that the id is not reused
+_feature_layouts: Dict[int, Tuple[dict, FeatureLayout]] = {}
+
+
+def get_feature_layout(config) -> FeatureLayout:
+    """
+    Return the (cached) feature layout for the data/feature config.
+    """
+    cached = _feature_layouts.get(id(config))
+    if cached is None or cached[0] is not config:
+        cached = (config, FeatureLayout(config))
+        _feature_layouts[id(config)] = cached
+    return cached[1]
+
+
+def get_lsa_system_linestring(lsa: LSA, system=settings.METRICAL) -> Tuple[LineString, bool]:
+    """
+    Return the connection geometry of the LSA in the given system, without duplicate coordinates.
 
-    system_lsa_linestring = lsa_linestring.transform(system, clone=True)
-    system_route_linestring = route_linestring.transform(system, clone=True)
+    Also returns whether duplicate coordinates were found.
+    """
+    system_lsa_linestring = lsa_geometry(lsa, system)
 
     # Analyse how many MAP-Topologies have duplicate coordinates
     map_topology_duplicate_coordinates = False
@@ -104,6 +185,56 @@ def get_features(lsa: LSA, route_linestring: LineString, config):
         system_lsa_linestring = remove_duplicate_coordinates(
             system_lsa_linestring)
 
+    return system_lsa_linestring, map_topology_duplicate_coordinates
+
+
+def get_precomputed_features(lsa: LSA) -> Optional[LSAFeatures]:
+    """
+    Return the route-independent features of the LSA, if they were fetched with the LSA.
+
+    The features are only used if they are already loaded (see `LSASnapshot`),
+    so that this never performs a query.
+    """
+    descriptor = getattr(type(lsa), "lsafeatures", None)
+    if descriptor is None or not descriptor.is_cached(lsa):
+        return None
+    return descriptor.related.get_cached_value(lsa)
+
+
+def complete_deferred(deferred: Dict[type, list]):
+    """
+    Write the features that were deferred by the extractors.
+    """
+    for extractor, extractor_deferred in deferred.items():
+        with metrics.stage(f"features:{extractor.__name__}"):
+            extractor.complete_deferred(extractor_deferred)
+    deferred.clear()
+
+
+def get_features(lsa: LSA, route_linestring: LineString, config, features: np.ndarray = None, timed=False, deferred=None):
+    """
+    Extract features from a LSA with regards to the route.
+
+    :param features: The row to write the features into. By default, a new row is allocated.
+    :param timed: Whether the timings of the feature extractors should be recorded.
+    :param deferred: If given, some features may be deferred, to be written by `complete_deferred`.
+    """
+
+    # Important for length features! For bearing LONLAT is better and the transformation
+    # into the LONLAT system happens in the respective feature extractors
+    system = settings.METRICAL
+
+    lsa_linestring = lsa.geometry
+
+    if len(lsa_linestring.coords) < 2:
+        raise ValueError("LSA LineString must have at least 2 coordinates")
+    if len(route_linestring.coords) < 2:
+        raise ValueError("Route LineString must have at least 2 coordinates")
+
+    system_route_linestring = transform(route_linestring, system)
+
+    system_lsa_linestring, map_topology_duplicate_coordinates = get_lsa_system_linestring(lsa, system)
+
     # Error check whether after removing duplicate coordinates there are still duplicate coordinates (for debugging)
     """ for coordinate in system_lsa_linestring.coords:
         count = 0
@@ -163,7 +294,9 @@ def get_features(lsa: LSA, route_linestring: LineString, config):
         if duplicate_projected_coordinates:
             break
 
-    features = np.array([]).astype(np.float32)
+    layout = get_feature_layout(config)
+    if features is None:
+        features = layout.allocate(1)[0]
     feature_timing_sums = []
 
     featureExtractionState = FeatureExtractionState(
@@ -174,9 +307,39 @@ def get_features(lsa: LSA, route_linestring: LineString, config):
         lsa_extended_projected_linestring=extended_projected_linestring,
         route_system_linestring=system_route_linestring,
         config=config,
-        feature_timing_sums=feature_timing_sums
+        feature_timing_sums=feature_timing_sums,
+        timed=timed,
+        # The precomputed features refer to the unmodified connection geometry
+        precomputed=get_precomputed_features(lsa) if config["projection_method"] == "old" else None,
+        deferred=deferred
     )
 
-    for extractor in config["feature_extractor_combination"]:
+    request = metrics.get_request()
+    for extractor in layout.extractors:
+        featureExtractionState.cursor = layout.offsets[extractor]
+        if request is None:
+            featureExtractionState = extractor().extract(featureExtractionState)
+            continue
+        # Measured without a context manager, since this runs for each LSA and extractor
+        extractor_start = time.perf_counter()
         featureExtractionState = extractor().extract(featureExtractionState)
+        request.add_duration(f"features:{extractor.__name__}", time.perf_counter() - extractor_start)
     return featureExtractionState.features, duplicate_projected_coordinates, map_topology_duplicate_coordinates, featureExtractionState.feature_timing_sums, timing_normal_projection, timing_extended_projection
+
+
+def get_feature_matrix(lsas: Iterable[LSA], route_linestring: LineString, config) -> np.ndarray:
+    """
+    Extract the features of all LSAs with regards to the route, as one matrix.
+
+    The rows are in the order of the LSAs. All LSAs are processed within one
+    match context, so that the route is only transformed and prepared once.
+    Features that rely on external services are extracted for all LSAs at once.
+    """
+    lsas = list(lsas)
+    X = get_feature_layout(config).allocate(len(lsas))
+    deferred = {}
+    with match_context(route_linestring):
+        for lsa, row in zip(lsas, X):
+            get_features(lsa, route_linestring, config, features=row, deferred=deferred)
+        complete_deferred(deferred)
+    return X
@@ -5,7 +5,6 @@ import numpy as np
 from routing.matching.ml.features.types import FeatureType, Timing
 from routing.matching.ml.features import FeatureExtractor, FeatureExtractionState
 from routing.matching.bearing import calc_bearing_diffs
-from ml_evaluation.utils_meta import get_filename
 
 
 class BearingDiffs(FeatureExtractor):
@@ -52,7 +51,12 @@ class BearingDiffs(FeatureExtractor):
 
     @staticmethod
     def get_name_of_file():
-        return get_filename()
+        return __name__.rpartition(".")[2]
+
+    @classmethod
+    def get_number_of_features(cls, config) -> int:
+        # Only the features that are chosen in the config are extracted
+        return len(config.get(BearingDiffs, []))
 
     @staticmethod
     def get_statistic_for_one_class(feature_bindings, indices):
@@ -127,9 +131,11 @@ class BearingDiffs(FeatureExtractor):
 
     def extract(self, featureExtractionState: FeatureExtractionState) -> FeatureExtractionState:
         start = time.time()
+        precomputed = featureExtractionState.precomputed
         # Features related to the bearing of the linestring
         bearing_diffs = calc_bearing_diffs(
-            featureExtractionState.lsa_system_linestring, featureExtractionState.lsa_projected_linestring)
+            featureExtractionState.lsa_system_linestring, featureExtractionState.lsa_projected_linestring,
+            bearings_l1=precomputed.segment_bearings if precomputed is not None else None)
         end = time.time()
         base_time = end - start
 
@@ -139,19 +145,21 @@ class BearingDiffs(FeatureExtractor):
         if bearing_diffs:
             for feature in featureExtractionState.config[BearingDiffs]:
                 start = time.time()
-                featureExtractionState.features = np.append(featureExtractionState.features, [
+                featureExtractionState.write([
                     self.get_feature(bearing_diffs, feature)
                 ])
                 end = time.time()
-                featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-                    Timing(base=base_time, extra=end - start)
-                ])
+                if featureExtractionState.timed:
+                    featureExtractionState.feature_timing_sums.extend([
+                        Timing(base=base_time, extra=end - start)
+                    ])
         else:
-            featureExtractionState.features = np.append(featureExtractionState.features, [
+            featureExtractionState.write([
                 0.0 for _ in featureExtractionState.config[BearingDiffs]
             ])
-            featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-                Timing(base=base_time, extra=None) for _ in featureExtractionState.config[BearingDiffs]
-            ])
+            if featureExtractionState.timed:
+                featureExtractionState.feature_timing_sums.extend([
+                    Timing(base=base_time, extra=None) for _ in featureExtractionState.config[BearingDiffs]
+                ])
 
         return featureExtractionState
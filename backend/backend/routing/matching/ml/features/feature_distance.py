@@ -4,7 +4,6 @@ from typing import List
 import numpy as np
 from routing.matching.ml.features.types import FeatureType, Timing
 from routing.matching.ml.features import FeatureExtractor, FeatureExtractionState
-from ml_evaluation.utils_meta import get_filename
 
 
 class Distance(FeatureExtractor):
@@ -30,7 +29,7 @@ class Distance(FeatureExtractor):
 
     @staticmethod
     def get_name_of_file():
-        return get_filename()
+        return __name__.rpartition(".")[2]
 
     @staticmethod
     def get_statistics(features: List[List], labels: List[int]):
@@ -62,11 +61,12 @@ class Distance(FeatureExtractor):
     def extract(self, featureExtractionState: FeatureExtractionState) -> FeatureExtractionState:
         start = time.time()
         # Distance of the linestring from the route
-        featureExtractionState.features = np.append(featureExtractionState.features, [
-                                                    featureExtractionState.lsa_system_linestring.distance(featureExtractionState.route_system_linestring)])
+        featureExtractionState.write([
+            featureExtractionState.lsa_system_linestring.distance(featureExtractionState.route_system_linestring)])
         end = time.time()
-        featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-            Timing(base=end - start, extra=None)
-        ])
+        if featureExtractionState.timed:
+            featureExtractionState.feature_timing_sums.extend([
+                Timing(base=end - start, extra=None)
+            ])
 
         return featureExtractionState
@@ -1,6 +1,5 @@
 import time
 from typing import List
-from ml_evaluation.utils_meta import get_filename
 
 import numpy as np
 from django.conf import settings
@@ -44,7 +43,12 @@ class LengthDiffs(FeatureExtractor):
 
     @staticmethod
     def get_name_of_file():
-        return get_filename()
+        return __name__.rpartition(".")[2]
+
+    @classmethod
+    def get_number_of_features(cls, config) -> int:
+        # Only the features that are chosen in the config are extracted
+        return len(config.get(LengthDiffs, []))
 
     @staticmethod
     def get_statistic_for_one_class(feature_bindings, indices):
@@ -106,28 +110,32 @@ class LengthDiffs(FeatureExtractor):
 
         start = time.time()
         system = settings.METRICAL
+        precomputed = featureExtractionState.precomputed
         # Features related to the length of the linestring
         length_diffs = calc_length_diffs(featureExtractionState.lsa_system_linestring,
-                                         featureExtractionState.lsa_projected_linestring, system=system)
+                                         featureExtractionState.lsa_projected_linestring, system=system,
+                                         lengths_l1=precomputed.segment_lengths if precomputed is not None else None)
         end = time.time()
         base_time = end - start
 
         if length_diffs:
             for feature in featureExtractionState.config[LengthDiffs]:
                 start = time.time()
-                featureExtractionState.features = np.append(featureExtractionState.features, [
+                featureExtractionState.write([
                     self.get_feature(length_diffs, feature)
                 ])
                 end = time.time()
-                featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-                    Timing(base=base_time, extra=end - start)
-                ])
+                if featureExtractionState.timed:
+                    featureExtractionState.feature_timing_sums.extend([
+                        Timing(base=base_time, extra=end - start)
+                    ])
         else:
-            featureExtractionState.features = np.append(featureExtractionState.features, [
+            featureExtractionState.write([
                 0.0 for _ in featureExtractionState.config[LengthDiffs]
             ])
-            featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-                Timing(base=base_time, extra=None) for _ in featureExtractionState.config[LengthDiffs]
-            ])
+            if featureExtractionState.timed:
+                featureExtractionState.feature_timing_sums.extend([
+                    Timing(base=base_time, extra=None) for _ in featureExtractionState.config[LengthDiffs]
+                ])
 
         return featureExtractionState
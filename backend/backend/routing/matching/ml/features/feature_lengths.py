@@ -1,6 +1,5 @@
 import time
 from typing import List
-from ml_evaluation.utils_meta import get_filename
 
 import numpy as np
 from routing.matching.ml.features.types import FeatureType, Timing
@@ -33,7 +32,12 @@ class Lengths(FeatureExtractor):
 
     @staticmethod
     def get_name_of_file():
-        return get_filename()
+        return __name__.rpartition(".")[2]
+
+    @classmethod
+    def get_number_of_features(cls, config) -> int:
+        # Only the features that are chosen in the config are extracted
+        return len(config.get(Lengths, []))
 
     @staticmethod
     def get_statistic_for_one_class(feature_bindings, indices):
@@ -74,23 +78,26 @@ class Lengths(FeatureExtractor):
             if feature == 0:
                 start = time.time()
                 # Features denoting the length of the linestrings
-                featureExtractionState.features = np.append(featureExtractionState.features, [
-                    featureExtractionState.lsa_system_linestring.length,
+                featureExtractionState.write([
+                    featureExtractionState.precomputed.length if featureExtractionState.precomputed is not None
+                    else featureExtractionState.lsa_system_linestring.length,
                 ])
                 end = time.time()
-                featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-                    Timing(base=end - start, extra=None)
-                ])
+                if featureExtractionState.timed:
+                    featureExtractionState.feature_timing_sums.extend([
+                        Timing(base=end - start, extra=None)
+                    ])
             elif feature == 1:
                 start = time.time()
                 # Features denoting the length of the linestrings
-                featureExtractionState.features = np.append(featureExtractionState.features, [
+                featureExtractionState.write([
                     featureExtractionState.lsa_projected_linestring.length,
                 ])
                 end = time.time()
-                featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-                    Timing(base=end - start, extra=None)
-                ])
+                if featureExtractionState.timed:
+                    featureExtractionState.feature_timing_sums.extend([
+                        Timing(base=end - start, extra=None)
+                    ])
             else:
                 raise Exception("Chosen feature index not existent.")
 
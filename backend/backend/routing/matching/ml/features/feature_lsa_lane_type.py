@@ -2,10 +2,8 @@ import time
 from typing import List
 import numpy as np
 
-from ml_evaluation.utils_meta import get_filename
 from routing.matching.ml.features.types import FeatureType, Timing
 from routing.matching.ml.features import FeatureExtractor, FeatureExtractionState
-from routing.models import LSAMetadata
 
 
 class LSALaneType(FeatureExtractor):
@@ -43,7 +41,7 @@ class LSALaneType(FeatureExtractor):
 
     @staticmethod
     def get_name_of_file():
-        return get_filename()
+        return __name__.rpartition(".")[2]
 
     @staticmethod
     def get_statistics(features: List[List], labels: List[int]):
@@ -76,34 +74,45 @@ class LSALaneType(FeatureExtractor):
         }
         return statistic
 
+    @staticmethod
+    def get_lane_type_index(lane_type: str) -> int:
+        """Gets the index of the lane type in the one hot encoding.
+
+        Returns:
+            int: The index of the lane type
+        """
+        if lane_type == "Radfahrer":
+            return 0
+        elif lane_type == 'Fußgänger/Radfahrer':
+            return 1
+        elif lane_type == 'KFZ/Radfahrer':
+            return 2
+        elif lane_type == 'KFZ/Bus/Radfahrer':
+            return 3
+        else:  # Bus/Radfahrer
+            return 4
+
     def extract(self, featureExtractionState: FeatureExtractionState) -> FeatureExtractionState:
         start = time.time()
 
-        lsa_metadata = LSAMetadata.objects.get(lsa=featureExtractionState.lsa)
+        if featureExtractionState.precomputed is not None:
+            lane_type_index = featureExtractionState.precomputed.lane_type_index
+        else:
+            lane_type_index = self.get_lane_type_index(featureExtractionState.lsa.lsametadata.lane_type)
+
         # Feature denoting the lane type of the map topology (one hot encoded)
-        if lsa_metadata.lane_type == "Radfahrer":
-            featureExtractionState.features = np.append(
-                featureExtractionState.features, [1, 0, 0, 0, 0])
-        elif lsa_metadata.lane_type == 'Fußgänger/Radfahrer':
-            featureExtractionState.features = np.append(
-                featureExtractionState.features, [0, 1, 0, 0, 0])
-        elif lsa_metadata.lane_type == 'KFZ/Radfahrer':
-            featureExtractionState.features = np.append(
-                featureExtractionState.features, [0, 0, 1, 0, 0])
-        elif lsa_metadata.lane_type == 'KFZ/Bus/Radfahrer':
-            featureExtractionState.features = np.append(
-                featureExtractionState.features, [0, 0, 0, 1, 0])
-        else:  # Bus/Radfahrer
-            featureExtractionState.features = np.append(
-                featureExtractionState.features, [0, 0, 0, 0, 1])
+        one_hot = [0, 0, 0, 0, 0]
+        one_hot[lane_type_index] = 1
+        featureExtractionState.write(one_hot)
 
         end = time.time()
-        featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-            Timing(base=(end - start), extra=None),
-            Timing(base=-524, extra=None),
-            Timing(base=-524, extra=None),
-            Timing(base=-524, extra=None),
-            Timing(base=-524, extra=None)
-        ])
+        if featureExtractionState.timed:
+            featureExtractionState.feature_timing_sums.extend([
+                Timing(base=(end - start), extra=None),
+                Timing(base=-524, extra=None),
+                Timing(base=-524, extra=None),
+                Timing(base=-524, extra=None),
+                Timing(base=-524, extra=None)
+            ])
 
         return featureExtractionState
@@ -4,9 +4,9 @@ from typing import List
 import numpy as np
 from django.conf import settings
 from django.contrib.gis.geos import LineString, Point
+from routing.matching.context import transform
 from routing.matching.ml.features.types import FeatureType, Timing
 from routing.matching.ml.features import FeatureExtractor, FeatureExtractionState
-from ml_evaluation.utils_meta import get_filename
 
 
 def calc_points_distances(l1: LineString, l2: LineString) -> List[float]:
@@ -19,8 +19,8 @@ def calc_points_distances(l1: LineString, l2: LineString) -> List[float]:
 
     system = settings.METRICAL
 
-    system_l1 = l1.transform(system, clone=True)
-    system_l2 = l2.transform(system, clone=True)
+    system_l1 = transform(l1, system)
+    system_l2 = transform(l2, system)
 
     diffs = []
     for (p1, p2) in zip(system_l1.coords, system_l2.coords):
@@ -66,7 +66,12 @@ class PointDistances(FeatureExtractor):
 
     @staticmethod
     def get_name_of_file():
-        return get_filename()
+        return __name__.rpartition(".")[2]
+
+    @classmethod
+    def get_number_of_features(cls, config) -> int:
+        # Only the features that are chosen in the config are extracted
+        return len(config.get(PointDistances, []))
 
     @staticmethod
     def get_statistic_for_one_class(feature_bindings, indices):
@@ -137,19 +142,21 @@ class PointDistances(FeatureExtractor):
         if point_distances:
             for feature in featureExtractionState.config[PointDistances]:
                 start = time.time()
-                featureExtractionState.features = np.append(featureExtractionState.features, [
+                featureExtractionState.write([
                     self.get_feature(point_distances, feature)
                 ])
                 end = time.time()
-                featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-                    Timing(base=base_time, extra=end - start)
-                ])
+                if featureExtractionState.timed:
+                    featureExtractionState.feature_timing_sums.extend([
+                        Timing(base=base_time, extra=end - start)
+                    ])
         else:
-            featureExtractionState.features = np.append(featureExtractionState.features, [
+            featureExtractionState.write([
                 0.0 for _ in featureExtractionState.config[PointDistances]
             ])
-            featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-                Timing(base=base_time, extra=None) for _ in featureExtractionState.config[PointDistances]
-            ])
+            if featureExtractionState.timed:
+                featureExtractionState.feature_timing_sums.extend([
+                    Timing(base=base_time, extra=None) for _ in featureExtractionState.config[PointDistances]
+                ])
 
         return featureExtractionState
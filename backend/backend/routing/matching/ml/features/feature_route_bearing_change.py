@@ -5,7 +5,6 @@ from django.contrib.gis.geos.linestring import LineString, Point
 from routing.matching.ml.features.types import FeatureType, Timing
 from routing.matching.ml.features import FeatureExtractor, FeatureExtractionState
 from routing.matching.bearing import calc_bearing_diffs
-from ml_evaluation.utils_meta import get_filename
 
 
 class RouteBearingChange(FeatureExtractor):
@@ -31,7 +30,7 @@ class RouteBearingChange(FeatureExtractor):
 
     @staticmethod
     def get_name_of_file():
-        return get_filename()
+        return __name__.rpartition(".")[2]
 
     @staticmethod
     def get_statistics(features: List[List], labels: List[int]):
@@ -96,12 +95,12 @@ class RouteBearingChange(FeatureExtractor):
             print("\n") """
 
         # bearing difference between first and last segment of projected lsa linestring
-        featureExtractionState.features = np.append(
-            featureExtractionState.features, [bearing_diff[0]])
+        featureExtractionState.write([bearing_diff[0]])
 
         end = time.time()
-        featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-            Timing(base=end - start, extra=None)
-        ])
+        if featureExtractionState.timed:
+            featureExtractionState.feature_timing_sums.extend([
+                Timing(base=end - start, extra=None)
+            ])
 
         return featureExtractionState
@@ -5,7 +5,6 @@ import numpy as np
 
 from routing.matching.ml.features.types import FeatureType, Timing
 from routing.matching.ml.features import FeatureExtractor, FeatureExtractionState
-from ml_evaluation.utils_meta import get_filename
 
 
 class SegmentCount(FeatureExtractor):
@@ -31,7 +30,7 @@ class SegmentCount(FeatureExtractor):
 
     @staticmethod
     def get_name_of_file():
-        return get_filename()
+        return __name__.rpartition(".")[2]
 
     @staticmethod
     def get_statistics(features: List[List], labels: List[int]):
@@ -64,11 +63,12 @@ class SegmentCount(FeatureExtractor):
         start = time.time()
 
         # Feature denoting the number of segments
-        featureExtractionState.features = np.append(featureExtractionState.features, [
-                                                    len(featureExtractionState.lsa_projected_linestring.coords) - 1])
+        featureExtractionState.write([
+            len(featureExtractionState.lsa_projected_linestring.coords) - 1])
 
         end = time.time()
-        featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-            Timing(base=end - start, extra=None)
-        ])
+        if featureExtractionState.timed:
+            featureExtractionState.feature_timing_sums.extend([
+                Timing(base=end - start, extra=None)
+            ])
         return featureExtractionState
@@ -5,7 +5,6 @@ import numpy as np
 from routing.matching.ml.features.types import FeatureType, Timing
 from routing.matching.ml.features import FeatureExtractor, FeatureExtractionState
 from routing.matching.bearing import calc_side
-from ml_evaluation.utils_meta import get_filename
 
 
 class Side(FeatureExtractor):
@@ -37,7 +36,7 @@ class Side(FeatureExtractor):
 
     @staticmethod
     def get_name_of_file():
-        return get_filename()
+        return __name__.rpartition(".")[2]
 
     @staticmethod
     def get_statistics(features: List[List], labels: List[int]):
@@ -75,19 +74,17 @@ class Side(FeatureExtractor):
 
         # Feature denoting the side of the route the linestring is on (one hot encoded)
         if side == "left":
-            featureExtractionState.features = np.append(
-                featureExtractionState.features, [1, 0, 0])
+            featureExtractionState.write([1, 0, 0])
         elif side == "right":
-            featureExtractionState.features = np.append(
-                featureExtractionState.features, [0, 1, 0])
+            featureExtractionState.write([0, 1, 0])
         else:
-            featureExtractionState.features = np.append(
-                featureExtractionState.features, [0, 0, 1])
+            featureExtractionState.write([0, 0, 1])
 
         end = time.time()
-        featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-            Timing(base=(end - start), extra=None),
-            Timing(base=-524, extra=None),
-            Timing(base=-524, extra=None)
-        ])
+        if featureExtractionState.timed:
+            featureExtractionState.feature_timing_sums.extend([
+                Timing(base=(end - start), extra=None),
+                Timing(base=-524, extra=None),
+                Timing(base=-524, extra=None)
+            ])
         return featureExtractionState
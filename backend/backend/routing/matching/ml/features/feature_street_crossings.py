@@ -3,11 +3,12 @@ from typing import List
 
 import numpy as np
 from django.conf import settings
+from routing.matching.context import transform
 from routing.matching.ml.features.types import FeatureType, Timing
 from routing.matching.ml.features import FeatureExtractor, FeatureExtractionState
+from django.contrib.gis.geos import LineString
 from django.contrib.gis.measure import D
 
-from ml_evaluation.utils_meta import get_filename
 
 from routing.models import PlanetOsmLine
 
@@ -35,7 +36,7 @@ class StreetCrossings(FeatureExtractor):
 
     @staticmethod
     def get_name_of_file():
-        return get_filename()
+        return __name__.rpartition(".")[2]
 
     @staticmethod
     def get_statistics(features: List[List], labels: List[int]):
@@ -64,11 +65,14 @@ class StreetCrossings(FeatureExtractor):
         }
         return statistic
 
-    def extract(self, featureExtractionState: FeatureExtractionState) -> FeatureExtractionState:
-        start = time.time()
+    @staticmethod
+    def count_street_crossings(lsa_linestring: LineString) -> int:
+        """Counts the streets that the linestring is crossing.
 
-        lsa_linestring_osm_System = featureExtractionState.lsa_system_linestring.transform(
-            settings.METRICAL, clone=True)
+        Returns:
+            int: The number of crossed streets
+        """
+        lsa_linestring_osm_System = transform(lsa_linestring, settings.METRICAL)
 
         # Highway field described here: https://wiki.openstreetmap.org/wiki/Key:highway
         relevant_streets = PlanetOsmLine.objects.filter(way__dwithin=(lsa_linestring_osm_System, D(m=14)),
@@ -92,16 +96,25 @@ class StreetCrossings(FeatureExtractor):
         for relevant_street in relevant_streets:
             if relevant_street.way.crosses(lsa_linestring_osm_System):
                 crossings += 1
+        return crossings
+
+    def extract(self, featureExtractionState: FeatureExtractionState) -> FeatureExtractionState:
+        start = time.time()
+
+        if featureExtractionState.precomputed is not None:
+            crossings = featureExtractionState.precomputed.street_crossings
+        else:
+            crossings = self.count_street_crossings(featureExtractionState.lsa_system_linestring)
 
         # print(f'Route-ID: {route.id}, LSA-ID: {lsa.id}, Crossings: {crossings}')
 
         # Feature denoting how many streets the MAP topology is crossing
         # 0 = 0 crossings, 1 = 1 crossing, 2 = 2 crossings ...
-        featureExtractionState.features = np.append(
-            featureExtractionState.features, [crossings])
+        featureExtractionState.write([crossings])
 
         end = time.time()
-        featureExtractionState.feature_timing_sums = np.append(featureExtractionState.feature_timing_sums, [
-            Timing(base=end - start, extra=None)
-        ])
+        if featureExtractionState.timed:
+            featureExtractionState.feature_timing_sums.extend([
+                Timing(base=end - start, extra=None)
+            ])
         return featureExtractionState
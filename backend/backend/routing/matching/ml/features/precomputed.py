@@ -0,0 +1,27 @@
+from django.conf import settings
+from routing.matching.bearing import calc_segment_bearings
+from routing.matching.context import match_context
+from routing.matching.length import calc_segment_lengths
+from routing.matching.ml.features import get_lsa_system_linestring
+from routing.matching.ml.features.feature_lsa_lane_type import LSALaneType
+from routing.matching.ml.features.feature_street_crossings import StreetCrossings
+from routing.models import LSA, LSAFeatures
+
+
+def compute_lsa_features(lsa: LSA) -> LSAFeatures:
+    """
+    Compute the features of the LSA that don't depend on the route.
+
+    The features are computed in the same way as by the feature extractors,
+    so that the precomputed features are identical to the extracted ones.
+    """
+    with match_context(lsa.geometry):
+        system_lsa_linestring, _ = get_lsa_system_linestring(lsa, settings.METRICAL)
+        return LSAFeatures(
+            lsa=lsa,
+            lane_type_index=LSALaneType.get_lane_type_index(lsa.lsametadata.lane_type),
+            street_crossings=StreetCrossings.count_street_crossings(system_lsa_linestring),
+            length=system_lsa_linestring.length,
+            segment_lengths=calc_segment_lengths(system_lsa_linestring, system=settings.METRICAL),
+            segment_bearings=[float(bearing) for bearing in calc_segment_bearings(system_lsa_linestring)],
+        )
@@ -1,24 +1,66 @@
 import os
 import pickle
-from typing import Tuple
+from typing import Dict, List, Tuple
 
 import numpy as np
 from django.conf import settings
 from django.contrib.gis.geos import LineString
 from django.db.models.query import QuerySet
-from routing.matching import RouteMatcher
-from routing.matching.ml.features import get_features
+from routing import metrics
+from routing.matching import (LSACollection, RouteMatcher, exclude_by_pks,
+                              filter_by_pks)
+from routing.matching.ml.features import get_feature_matrix, get_features
 from routing.matching.ml.configs_production.trainings import config_train
 from routing.matching.ml.configs_production.datasets import config_data_and_features
 from routing.matching.ml.path_configs import models_production_path_osm, models_production_path_drn, models_evaluation_path_osm, models_evaluation_path_drn
 from routing.matching.overlap import OverlapMatcher, calc_sections
 
 
+class MLPredictions:
+    """
+    The predictions of a ML model for a batch of LSAs.
+
+    The labels and probabilities are arrays in the order of the LSA ids.
+    """
+
+    def __init__(self, lsa_ids: List[str], labels: np.ndarray, probabilities: np.ndarray):
+        self.lsa_ids = lsa_ids
+        self.labels = labels
+        self.probabilities = probabilities
+        # The row of each LSA in the arrays
+        self.rows: Dict[str, int] = {lsa_id: row for row, lsa_id in enumerate(lsa_ids)}
+
+    def __len__(self):
+        return len(self.lsa_ids)
+
+    def label(self, lsa_id: str) -> bool:
+        """
+        Return whether the LSA was predicted to match the route.
+        """
+        return bool(self.labels[self.rows[lsa_id]])
+
+    def probability(self, lsa_id: str) -> float:
+        """
+        Return the predicted probability that the LSA matches the route.
+        """
+        return float(self.probabilities[self.rows[lsa_id]])
+
+    def matched_ids(self) -> List[str]:
+        """
+        Return the ids of the LSAs that were predicted to match, in order.
+        """
+        return [lsa_id for lsa_id, label in zip(self.lsa_ids, self.labels) if label]
+
+
 class MLMatcher(RouteMatcher):
     """
     An elementwise matcher using a ML model.
     """
 
+    # The probability above which a LSA is predicted to match,
+    # as used by `predict` of the binary sklearn classifiers
+    threshold = 0.5
+
     @classmethod
     def store(cls, clf, model_name, config_train_id, route_data):
         """Store a model on the disk.
@@ -50,11 +92,15 @@ class MLMatcher(RouteMatcher):
             return os.path.join(
                 settings.BASE_DIR, f'{models_production_path_drn}model_config_feature_data_id_{self.data_features_id}_name_{feature_transformer_name}.joblib')
 
-    def __init__(self, route_data, *args, **kwargs):
+    def __init__(self, route_data, *args, batched=True, **kwargs):
         """
         Initialize the ml matcher.
+
+        If `batched` is False, the candidates are classified one after another.
         """
         super().__init__(*args, **kwargs)
+
+        self.batched = batched
         
         # Needs to be set according to the available configurations in routing.matching.ml.configs_production.trainings.
         self.config_train_id = 8603009191
@@ -116,18 +162,17 @@ class MLMatcher(RouteMatcher):
             self.transformer = None
             
 
-    def matches(self, lsas: QuerySet, route: LineString) -> Tuple[QuerySet, LineString]:
+    def get_data_features_config(self) -> dict:
         """
-        Return the LSAs that match the route, as a queryset.
+        Return the data/feature config of the model.
         """
-
         if not hasattr(self, 'clf'):
             raise KeyError("NO MODEL FOUND!")
 
         if not hasattr(self, 'config_train_id'):
             raise KeyError("NO CONFIG TRAIN ID FOUND!")
 
-    	# Get the training/inference config.
+        # Get the training/inference config.
         config_train_id = self.config_train_id
         if config_train_id not in config_train:
             raise KeyError(
@@ -139,7 +184,130 @@ class MLMatcher(RouteMatcher):
         if config_data_and_features_id not in config_data_and_features:
             raise KeyError(
                 'No config for the given config data/features id available. Check whether it is in routing.matching.ml.configs_production.datasets')
-        data_features_config = config_data_and_features[config_data_and_features_id]
+        return config_data_and_features[config_data_and_features_id]
+
+    def classify(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Classify the rows of the feature matrix with a single model pass.
+
+        Returns the labels and the probabilities that the rows match their routes.
+        """
+        # The models were trained on double precision features
+        X = X.astype(np.float64)
+
+        # If a feature transformer is used, apply it to the features.
+        if self.transformer is not None:
+            X = self.transformer.transform(X)
+
+        # Models without probabilities can only be used for the labels
+        if not hasattr(self.clf, 'predict_proba'):
+            labels = np.asarray(self.clf.predict(X)) == 1
+            return labels, labels.astype(np.float64)
+
+        # The probability of the positive class, i.e. that the LSA matches the route
+        probabilities = self.clf.predict_proba(X)[:, list(self.clf.classes_).index(1)]
+        return probabilities > self.threshold, probabilities
+
+    def predict(self, lsas: LSACollection, route: LineString) -> MLPredictions:
+        """
+        Predict for all LSAs at once whether they match the route.
+
+        The features of all LSAs are extracted into one matrix, which is
+        transformed once and classified with a single `predict_proba` pass.
+        The labels are derived from the probabilities by thresholding.
+        """
+        return self.predict_batch([(lsas, route)])[0]
+
+    def predict_batch(self, batch: List[Tuple[LSACollection, LineString]]) -> List[MLPredictions]:
+        """
+        Predict for the LSAs of multiple routes whether they match their route.
+
+        The feature matrices of all routes are stacked, so that the model
+        classifies the candidates of all routes in a single pass.
+        """
+        data_features_config = self.get_data_features_config()
+
+        lsa_ids = [[lsa.pk for lsa in lsas] for lsas, _ in batch]
+        with metrics.stage("features"):
+            matrices = [get_feature_matrix(lsas, route, data_features_config) for lsas, route in batch]
+        non_empty = [X for X in matrices if len(X) > 0]
+        if not non_empty:
+            return [MLPredictions(ids, np.zeros(0, dtype=bool), np.zeros(0)) for ids in lsa_ids]
+
+        with metrics.stage("inference"):
+            labels, probabilities = self.classify(np.concatenate(non_empty))
+
+        # Split the predictions by route
+        splits = np.cumsum([len(X) for X in matrices])[:-1]
+        return [
+            MLPredictions(ids, route_labels, route_probabilities)
+            for ids, route_labels, route_probabilities
+            in zip(lsa_ids, np.split(labels, splits), np.split(probabilities, splits))
+        ]
+
+    def select(self, lsas: LSACollection, route: LineString, predictions: MLPredictions) -> LSACollection:
+        """
+        Return the LSAs that were predicted to match the route, without overlapping LSAs.
+        """
+        pks_to_include = predictions.matched_ids()
+
+        # Don't perform overlap matching if no MLP is used (probabilites required for the overlap matching)
+        # Also overlap matching won't need to be performed if no or only one MAP topology got matched
+        if (self.model_name != "MLP") or len(pks_to_include) < 2:
+            return filter_by_pks(lsas, pks_to_include)
+
+        lsas = filter_by_pks(lsas, pks_to_include)
+
+        # Perform overlap matching
+        with metrics.stage("overlap"):
+            sections = calc_sections(lsas, route)
+            overlapMatcher = OverlapMatcher(
+                58.97414602358541,
+                49.990248909428296,
+                0
+            )
+            overlaps = overlapMatcher.calc_overlaps(sections)
+
+        excluded_lsas = set()
+        for lsa_id_1, lsa_id_2 in overlaps:
+            if predictions.probability(lsa_id_1) > predictions.probability(lsa_id_2):
+                excluded_lsas.add(lsa_id_2)
+            else:
+                excluded_lsas.add(lsa_id_1)
+
+        return exclude_by_pks(lsas, excluded_lsas)
+
+    def matches(self, lsas: LSACollection, route: LineString) -> Tuple[LSACollection, LineString]:
+        """
+        Return the LSAs that match the route.
+        """
+        if not self.batched:
+            return self.matches_per_candidate(lsas, route)
+
+        lsas, route = super().matches(lsas, route)
+        return self.select(lsas, route, self.predict(lsas, route)), route
+
+    def matches_batch(self, batch: List[Tuple[LSACollection, LineString]]) -> List[Tuple[LSACollection, LineString]]:
+        """
+        Return the LSAs that match each route, with a single model pass for all routes.
+        """
+        if not self.batched:
+            return super().matches_batch(batch)
+
+        batch = [super(MLMatcher, self).matches(lsas, route) for lsas, route in batch]
+        predictions = self.predict_batch(batch)
+        return [
+            (self.select(lsas, route, route_predictions), route)
+            for (lsas, route), route_predictions in zip(batch, predictions)
+        ]
+
+    def matches_per_candidate(self, lsas: QuerySet, route: LineString) -> Tuple[QuerySet, LineString]:
+        """
+        Return the LSAs that match the route, classifying one candidate after another.
+
+        This is the unbatched inference path, which is kept for comparison.
+        """
+        data_features_config = self.get_data_features_config()
 
         lsas, route = super().matches(lsas, route)
 
@@ -149,7 +317,7 @@ class MLMatcher(RouteMatcher):
 
         # If the dataset ist empty, return an empty queryset (when there are no lsas). 
         if len(X) == 0:
-            return lsas.filter(pk__in=[]), route
+            return filter_by_pks(lsas, []), route
             
         # If a feature transformer is used, apply it to the features.
         if self.transformer is not None:
@@ -164,14 +332,14 @@ class MLMatcher(RouteMatcher):
         # Also overlap matching won't need to be performed if no or only one MAP topology got matched ("y.count(1) < 2")
         if (self.model_name != "MLP") or np.count_nonzero(y == 1) < 2:
             pks_to_include = [lsa.pk for lsa, prediction in zip(lsas, y) if prediction]
-            return lsas.filter(pk__in=pks_to_include), route
+            return filter_by_pks(lsas, pks_to_include), route
 
         y_prob = self.clf.predict_proba(X)
 
         pks_to_include, probabilities_of_pks_to_include = zip(*[(lsa.pk, probability) for lsa, prediction, probability
                                                                 in zip(lsas, y, y_prob) if prediction])
 
-        lsas = lsas.filter(pk__in=pks_to_include)
+        lsas = filter_by_pks(lsas, pks_to_include)
 
         # Perform overlap matching
         if (self.model_name == "MLP"):
@@ -191,6 +359,6 @@ class MLMatcher(RouteMatcher):
                 else:
                     excluded_lsas.add(lsa_id_1)
 
-            lsas = lsas.exclude(id__in=excluded_lsas)
+            lsas = exclude_by_pks(lsas, excluded_lsas)
 
         return lsas, route
@@ -0,0 +1,262 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from django.conf import settings
+from django.contrib.gis.geos import LineString
+from django.db import connection
+from routing.matching.context import transform
+
+
+def street_changed(street_names: List[str]) -> bool:
+    """
+    Return whether the street names along a linestring change at some point.
+    """
+    return any(name != street_names[0] for name in street_names[1:])
+
+
+def geometry_key(linestring: LineString, precision: int = 6) -> str:
+    """
+    Return a key for the linestring, with the LONLAT coordinates rounded to the given precision.
+
+    With 6 decimals, linestrings that differ by less than ~0.1m get the same key.
+    """
+    coords = [(round(lon, precision), round(lat, precision)) for lon, lat, *_ in linestring.coords]
+    return hashlib.sha1(json.dumps(coords).encode("utf8")).hexdigest()
+
+
+class StreetNameCache:
+    """
+    A persistent cache of street names, stored in a SQLite database.
+
+    The cache can be shared by the threads of a resolver.
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS street_names (key TEXT PRIMARY KEY, names TEXT NOT NULL)")
+
+    def get(self, key: str) -> Optional[List[str]]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT names FROM street_names WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def set(self, key: str, street_names: List[str]):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO street_names (key, names) VALUES (?, ?)", (key, json.dumps(street_names)))
+
+
+class StreetNameResolver:
+    """
+    Resolves the names of the streets along linestrings.
+    """
+
+    def resolve(self, linestring: LineString) -> List[str]:
+        """
+        Return the street names along the linestring, in order of occurrence.
+        """
+        return self.resolve_many([linestring])[0]
+
+    def resolve_many(self, linestrings: List[LineString]) -> List[List[str]]:
+        """
+        Return the street names along each of the linestrings.
+
+        If the street names can't be resolved, an empty list is returned for the linestring.
+        """
+        raise NotImplementedError
+
+
+class PostgisStreetNameResolver(StreetNameResolver):
+    """
+    Resolves the street names from the local planet_osm_line table.
+
+    The linestrings are sampled in regular intervals and each sample
+    is joined with the nearest street. All linestrings are resolved
+    with a single query.
+    """
+
+    # The interval in which the linestrings are sampled (in the metrical system)
+    sample_interval = 5
+    # The maximum distance from a sample to its street (in the metrical system)
+    max_distance = 14
+
+    query = """
+        SELECT trace.index, (
+            SELECT coalesce(line.name, '')
+            FROM planet_osm_line AS line
+            WHERE line.highway IS NOT NULL AND ST_DWithin(line.way, sample.geom, %s)
+            ORDER BY line.way <-> sample.geom
+            LIMIT 1
+        )
+        FROM unnest(%s::text[]) WITH ORDINALITY AS trace(ewkt, index),
+            LATERAL ST_DumpPoints(ST_Segmentize(ST_GeomFromEWKT(trace.ewkt), %s)) AS sample
+        ORDER BY trace.index, sample.path
+    """
+
+    def resolve_many(self, linestrings: List[LineString]) -> List[List[str]]:
+        street_names = [[] for _ in linestrings]
+        if not linestrings:
+            return street_names
+        ewkts = [transform(linestring, settings.METRICAL).ewkt for linestring in linestrings]
+        with connection.cursor() as cursor:
+            cursor.execute(self.query, [self.max_distance, ewkts, self.sample_interval])
+            for index, name in cursor.fetchall():
+                names = street_names[index - 1]
+                # Samples without a nearby street are skipped, like in the map matching
+                if name is not None and (not names or names[-1] != name):
+                    names.append(name)
+        return street_names
+
+
+class GraphHopperStreetNameResolver(StreetNameResolver):
+    """
+    Resolves the street names with the map matching of a GraphHopper instance.
+
+    The requests are sent concurrently over a pool of connections. Resolved
+    street names are cached by the (rounded) geometry, so that every distinct
+    linestring is only map matched once.
+    """
+
+    def __init__(self, url: str = None, cache: StreetNameCache = None, max_workers: int = 8, timeout: float = 10):
+        self.url = f"{(url or settings.GRAPHHOPPER_URL).rstrip('/')}/match"
+        self.cache = cache
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        # Imported here, so that importing the feature extractors doesn't load requests
+        import requests
+        from requests.adapters import HTTPAdapter
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({'Content-type': 'application/xml', 'Accept': '*/*'})
+
+    @staticmethod
+    def to_gpx(linestring: LineString) -> bytes:
+        """
+        Write the LONLAT linestring as GPX/XML for the map matching.
+        """
+        import xml.etree.ElementTree as ET
+
+        gpx = ET.Element("gpx")
+        trk = ET.SubElement(gpx, "trk")
+        trkseg = ET.SubElement(trk, "trkseg")
+
+        for coordinate in linestring.coords:
+            ET.SubElement(trkseg, "trkpt", attrib={"lat": str(
+                coordinate[1]), "lon": str(coordinate[0])})
+
+        return ET.tostring(gpx, encoding='utf8', method='xml')
+
+    def match(self, linestring: LineString) -> Optional[List[str]]:
+        """
+        Map match the LONLAT linestring and return the street names along it.
+
+        Returns None if the map matching failed.
+        """
+        import requests
+
+        try:
+            response = self.session.post(
+                self.url, params={"profile": "bike", "details": "street_name"},
+                data=self.to_gpx(linestring), timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f'Error during map matching process for the street names.\nMessage: {e}')
+            return None
+
+        """
+        Example response (shortened):
+
+        {
+            "paths": [
+                {
+                    "distance": 94.631,
+                    "points": "wmreIskj|@SYeArE",
+                    "details": {
+                        "street_name": [
+                            [
+                                0,
+                                1,
+                                "Peutestraße"
+                            ],
+                            [
+                                1,
+                                2,
+                                "Müggenburger Straße"
+                            ]
+                        ]
+                    }
+                }
+            ],
+            "map_matching": {
+                "original_distance": 115.84688023136935,
+                "distance": 94.63070803000674,
+                "time": 18925
+            }
+        }
+        """
+
+        if response.status_code != 200:
+            print(f'Error during map matching process for the street names.\nStatus code: {response.status_code}\nMessage: {response.text}')
+            return None
+
+        details = response.json()["paths"][0]["details"]
+        if "street_name" not in details:
+            return []
+        return [street[2] for street in details["street_name"]]
+
+    def resolve_many(self, linestrings: List[LineString]) -> List[List[str]]:
+        linestrings = [transform(linestring, settings.LONLAT) for linestring in linestrings]
+        keys = [geometry_key(linestring) for linestring in linestrings]
+
+        street_names = {}
+        if self.cache is not None:
+            for key in set(keys):
+                cached = self.cache.get(key)
+                if cached is not None:
+                    street_names[key] = cached
+
+        # Map match every distinct linestring that is not cached
+        missing = {}
+        for key, linestring in zip(keys, linestrings):
+            if key not in street_names:
+                missing.setdefault(key, linestring)
+        if missing:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                matched = executor.map(self.match, missing.values())
+                for key, names in zip(missing.keys(), matched):
+                    if names is None:
+                        # Failed requests are not cached, to be retried the next time
+                        continue
+                    street_names[key] = names
+                    if self.cache is not None:
+                        self.cache.set(key, names)
+
+        return [street_names.get(key, []) for key in keys]
+
+
+_resolver: Optional[StreetNameResolver] = None
+
+
+def get_street_name_resolver() -> StreetNameResolver:
+    """
+    Return the street name resolver that is configured in the settings.
+    """
+    global _resolver
+    if _resolver is None:
+        if settings.STREET_NAME_RESOLVER == "postgis":
+            _resolver = PostgisStreetNameResolver()
+        elif settings.STREET_NAME_RESOLVER == "graphhopper":
+            _resolver = GraphHopperStreetNameResolver(cache=StreetNameCache(settings.STREET_NAME_CACHE))
+        else:
+            raise ValueError(f"Unknown street name resolver: {settings.STREET_NAME_RESOLVER}")
+    return _resolver
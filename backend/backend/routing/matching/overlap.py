@@ -1,16 +1,31 @@
 from collections import namedtuple
-from typing import Dict, Iterable, Set, Tuple
+from typing import Dict, Iterable, List, Set, Tuple
 
+import numpy as np
 from django.conf import settings
-from django.contrib.gis.geos import LineString, Point
+from django.contrib.gis.geos import LineString
 from django.db.models.query import QuerySet
-from routing.matching import RouteMatcher
+from routing.matching import LSACollection, RouteMatcher, exclude_by_pks
 from routing.matching.bearing import calc_side
-from routing.models import LSA, LSAMetadata
+from routing.matching.context import lsa_geometry, transform
+from routing.matching.linear_referencing import get_linear_route
+from routing.models import LSA
 
 RouteSection = namedtuple("RouteSection", ["min_fraction", "max_fraction"])
 
 
+def calc_section(lsa: LSA, linear_route, system=settings.LONLAT) -> RouteSection:
+    """
+    Calculate the section of the (linear) route that is covered by the LSA.
+    """
+    linestring = lsa_geometry(lsa, system)
+    # Get the fractions of the route that the points are closest to
+    fractions = linear_route.project_normalized(np.array(linestring.coords, dtype=np.float64))
+    min_fraction = min(1, float(fractions.min()))
+    max_fraction = max(0, float(fractions.max()))
+    return RouteSection(min_fraction, max_fraction)
+
+
 def calc_sections(lsas: Iterable[LSA], route: LineString, system=settings.LONLAT) -> Dict[str, RouteSection]:
     """
     Calculate the sections of the route that are covered by the LSAs.
@@ -21,20 +36,11 @@ def calc_sections(lsas: Iterable[LSA], route: LineString, system=settings.LONLAT
     Example: if the LSA covers the first 100m of a 400m route, the section will be (0, 0.25).
     """
 
-    system_route = route.transform(system, clone=True)
+    linear_route = get_linear_route(route, system)
 
     section_dict = {}
     for lsa in lsas:
-        min_fraction = 1
-        max_fraction = 0
-        linestring = lsa.geometry.transform(system, clone=True)
-        for coord in linestring.coords:
-            point_geometry = Point(*coord, srid=system)
-            # Get the fraction of the route that the point is closest to
-            fraction = system_route.project_normalized(point_geometry)
-            min_fraction = min(min_fraction, fraction)
-            max_fraction = max(max_fraction, fraction)
-        section_dict[lsa.id] = RouteSection(min_fraction, max_fraction)
+        section_dict[lsa.id] = calc_section(lsa, linear_route, system)
 
     return section_dict
 
@@ -47,11 +53,11 @@ def calc_distances(lsas: Iterable[LSA], route: LineString, system=settings.METRI
     Use the Mercator projection system for distances in meters.
     """
 
-    system_route = route.transform(system, clone=True)
+    system_route = transform(route, system)
 
     distance_dict = {}
     for lsa in lsas:
-        linestring = lsa.geometry.transform(system, clone=True)
+        linestring = lsa_geometry(lsa, system)
         distance_dict[lsa.id] = linestring.distance(system_route)
 
     return distance_dict
@@ -68,6 +74,83 @@ def calc_sides(lsas: Iterable[LSA], route: LineString) -> Dict[str, str]:
     return side_dict
 
 
+class OverlapCandidates:
+    """
+    The properties of the LSAs that decide about their overlaps, as columns.
+
+    The i-th entry of each column belongs to the i-th LSA id.
+    """
+
+    def __init__(
+        self,
+        ids: List[str],
+        lane_types: List[str],
+        min_fractions: np.ndarray,
+        max_fractions: np.ndarray,
+        distances: np.ndarray,
+        sides: List[str],
+    ):
+        self.ids = ids
+        self.lane_types = lane_types
+        self.min_fractions = min_fractions
+        self.max_fractions = max_fractions
+        self.distances = distances
+        self.sides = sides
+        self.index = {lsa_id: i for i, lsa_id in enumerate(ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def sections(self) -> Dict[str, RouteSection]:
+        return {
+            lsa_id: RouteSection(float(min_fraction), float(max_fraction))
+            for lsa_id, min_fraction, max_fraction in zip(self.ids, self.min_fractions, self.max_fractions)
+        }
+
+    def lane_type(self, lsa_id: str) -> str:
+        return self.lane_types[self.index[lsa_id]]
+
+    def distance(self, lsa_id: str) -> float:
+        return float(self.distances[self.index[lsa_id]])
+
+    def side(self, lsa_id: str) -> str:
+        return self.sides[self.index[lsa_id]]
+
+
+def prefetch_overlap_candidates(lsas: LSACollection, route: LineString) -> OverlapCandidates:
+    """
+    Fetch the LSAs with their lane types and calculate their sections,
+    distances (in meters) and sides with regards to the route, in one pass.
+
+    If the LSAs are a queryset, they are fetched with a single query.
+    """
+    if isinstance(lsas, QuerySet):
+        lsas = lsas.select_related("lsametadata")
+
+    linear_route = get_linear_route(route, settings.LONLAT)
+    system_route = transform(route, settings.METRICAL)
+
+    ids, lane_types, min_fractions, max_fractions, distances, sides = [], [], [], [], [], []
+    for lsa in lsas:
+        section = calc_section(lsa, linear_route, settings.LONLAT)
+        ids.append(lsa.id)
+        lane_types.append(lsa.lsametadata.lane_type)
+        min_fractions.append(section.min_fraction)
+        max_fractions.append(section.max_fraction)
+        distances.append(lsa_geometry(lsa, settings.METRICAL).distance(system_route))
+        sides.append(calc_side(route, lsa.geometry))
+
+    return OverlapCandidates(
+        ids,
+        lane_types,
+        np.array(min_fractions, dtype=np.float64),
+        np.array(max_fractions, dtype=np.float64),
+        np.array(distances, dtype=np.float64),
+        sides,
+    )
+
+
 Overlap = namedtuple("Overlap", ["lsa_1_id", "lsa_2_id"])
 
 
@@ -94,11 +177,11 @@ class OverlapMatcher(RouteMatcher):
         self.perfect_match_threshold = perfect_match_threshold
         self.overlap_pct_threshold = overlap_pct_threshold
 
-    def calc_overlaps(self, sections: Dict[str, RouteSection]) -> Set[Overlap]:
+    def is_overlap(self, s1: RouteSection, s2: RouteSection) -> bool:
         """
-        Calculate the overlaps between the sections of the route.
+        Check whether two sections of the route overlap by at least the threshold.
 
-        Returns a list of overlaps. To further understand the overlap, see the example below:
+        To further understand the overlap, see the example below:
 
             0.2        0.6
             --------------
@@ -108,6 +191,18 @@ class OverlapMatcher(RouteMatcher):
         The overlap is between 0.2 and 0.5, i.e. 0.3 and therefore 0.3/0.5 = 0.6 -> 60%
         Now, if the overlap is above a given threshold, the two LSAs are considered to be overlapping.
         """
+        start_of_overlap = max(s1.min_fraction, s2.min_fraction)
+        end_of_overlap = min(s1.max_fraction, s2.max_fraction)
+        max_dist = max(s1.max_fraction, s2.max_fraction) - min(s1.min_fraction, s2.min_fraction)
+        overlap_pct = (end_of_overlap - start_of_overlap) / max_dist if max_dist > 0 else 0
+        return overlap_pct >= self.overlap_pct_threshold
+
+    def calc_overlaps_pairwise(self, sections: Dict[str, RouteSection]) -> Set[Overlap]:
+        """
+        Calculate the overlaps between the sections of the route, by comparing all pairs of sections.
+
+        See `calc_overlaps`, which returns the same overlaps.
+        """
 
         overlaps = set()
         considered_lsa_ids = set()
@@ -117,15 +212,39 @@ class OverlapMatcher(RouteMatcher):
                 if lsa_2_id in considered_lsa_ids:
                     continue
 
-                start_of_overlap = max(s1.min_fraction, s2.min_fraction)
-                end_of_overlap = min(s1.max_fraction, s2.max_fraction)
-                max_dist = max(s1.max_fraction, s2.max_fraction) - min(s1.min_fraction, s2.min_fraction)
-                overlap_pct = (end_of_overlap - start_of_overlap) / max_dist if max_dist > 0 else 0
+                if self.is_overlap(s1, s2):
+                    overlaps.add(Overlap(lsa_1_id, lsa_2_id))
 
-                if overlap_pct < self.overlap_pct_threshold:
-                    continue
+        return overlaps
+
+    def calc_overlaps(self, sections: Dict[str, RouteSection]) -> Set[Overlap]:
+        """
+        Calculate the overlaps between the sections of the route.
 
-                overlaps.add(Overlap(lsa_1_id, lsa_2_id))
+        Returns a set of overlaps, where the first LSA of each overlap comes
+        first in the given sections. See `is_overlap` for the definition of an overlap.
+
+        The sections are swept in the order of their start, so that only sections
+        whose intervals intersect are compared. Sections that don't intersect
+        have a negative overlap and are never overlapping, unless the threshold is negative.
+        """
+        if self.overlap_pct_threshold < 0:
+            return self.calc_overlaps_pairwise(sections)
+
+        # The position of each LSA in the sections, to keep the order of the pairs
+        ids = list(sections.keys())
+        order = sorted(range(len(ids)), key=lambda i: sections[ids[i]].min_fraction)
+
+        overlaps = set()
+        # The sections that started before the current one and may still intersect with it
+        active = []
+        for i in order:
+            s1 = sections[ids[i]]
+            active = [j for j in active if sections[ids[j]].max_fraction >= s1.min_fraction]
+            for j in active:
+                if self.is_overlap(s1, sections[ids[j]]):
+                    overlaps.add(Overlap(ids[i], ids[j]) if i < j else Overlap(ids[j], ids[i]))
+            active.append(i)
 
         return overlaps
 
@@ -136,22 +255,19 @@ class OverlapMatcher(RouteMatcher):
         """
         lsas, route = super().matches(lsas, route)
 
-        sections = calc_sections(lsas, route)
-        distances = calc_distances(lsas, route)
-        sides = calc_sides(lsas, route)
-        overlaps = self.calc_overlaps(sections)
+        candidates = prefetch_overlap_candidates(lsas, route)
+        overlaps = self.calc_overlaps(candidates.sections)
 
         excluded_lsas = set()
         for lsa_id_1, lsa_id_2 in overlaps:
-            dist_1, dist_2 = distances[lsa_id_1], distances[lsa_id_2]
-            side_1, side_2 = sides[lsa_id_1], sides[lsa_id_2]
-            lsa_metadata_1 = LSAMetadata.objects.get(pk=lsa_id_1)
-            lsa_metadata_2 = LSAMetadata.objects.get(pk=lsa_id_2)
-            
+            dist_1, dist_2 = candidates.distance(lsa_id_1), candidates.distance(lsa_id_2)
+            side_1, side_2 = candidates.side(lsa_id_1), candidates.side(lsa_id_2)
+            lane_type_1, lane_type_2 = candidates.lane_type(lsa_id_1), candidates.lane_type(lsa_id_2)
+
             # If only one signalgroup is exclusively for bikes choose that one.
-            if lsa_metadata_1.lane_type == "Radfahrer" and lsa_metadata_2.lane_type != "Radfahrer":
+            if lane_type_1 == "Radfahrer" and lane_type_2 != "Radfahrer":
                 excluded_lsas.add(lsa_id_2)
-            elif lsa_metadata_2.lane_type == "Radfahrer" and lsa_metadata_1.lane_type != "Radfahrer":
+            elif lane_type_2 == "Radfahrer" and lane_type_1 != "Radfahrer":
                 excluded_lsas.add(lsa_id_1)
 
             # If there is at least one perfect match, decide purely by the distance
@@ -175,5 +291,5 @@ class OverlapMatcher(RouteMatcher):
             else:
                 excluded_lsas.add(lsa_id_2)
 
-        lsas = lsas.exclude(id__in=excluded_lsas)
+        lsas = exclude_by_pks(lsas, excluded_lsas)
         return lsas, route
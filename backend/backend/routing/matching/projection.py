@@ -1,8 +1,12 @@
+from collections import namedtuple
 from typing import List
 
+import numpy as np
 from django.conf import settings
 from django.contrib.gis.geos import LineString, Point
 from django.contrib.gis.geos import fromstr
+from routing.matching.context import transform
+from routing.matching.linear_referencing import get_linear_route
 from shapely.geometry import LineString as ShapelyLineString
 from shapely import wkt
 from shapely.ops import substring
@@ -21,26 +25,83 @@ def project_onto_route(
     If `use_route_direction` is True, the direction of the route is used.
     """
 
-    system_linestring = linestring.transform(system, clone=True)
-    system_route = route.transform(system, clone=True)
+    system_linestring = transform(linestring, system)
+    linear_route = get_linear_route(route, system)
 
+    coords = np.array(system_linestring.coords, dtype=np.float64)
+    # Get the fractions of the route that the points are closest to
+    fractions = linear_route.project_normalized(coords)
     if use_route_direction:
-        points = points_in_route_dir(system_linestring, system_route, system)
-    else:
-        points = [Point(*coord, srid=system)
-                  for coord in system_linestring.coords]
+        fractions = np.sort(fractions, kind="stable")
 
-    projected_points = []
-    for point_geometry in points:
-        # Get the fraction of the route that the point is closest to
-        fraction = system_route.project_normalized(point_geometry)
-        # Interpolate the point along the route
-        projected_points.append(system_route.interpolate_normalized(fraction))
+    # Interpolate the points along the route
+    projected_points = linear_route.interpolate_normalized(fractions)
 
     # Project back to the original coordinate system
     projected_linestring = LineString(projected_points, srid=system)
-    projected_linestring.transform(linestring.srid)
-    return projected_linestring
+    return transform(projected_linestring, linestring.srid)
+
+
+# The points snapped onto a route, as arrays:
+# - The fractions of the route which are closest to the points
+# - The distances along the route which are closest to the points
+# - The snapped coordinates on the route, in the dimension of the route coordinates
+# - The lengths of the linestrings projected onto the route (0 for points)
+Snaps = namedtuple("Snaps", ["fractions", "distances", "coords", "projected_lengths"])
+
+
+def snap_points(coords: np.ndarray, route: LineString, system=settings.LONLAT) -> Snaps:
+    """
+    Snap the points onto the route, in a single vectorized call.
+
+    :param coords: The coordinates of the points in the given projection system, of shape (n, 2) or (n, 3).
+    """
+    linear_route = get_linear_route(route, system)
+    coords = np.asarray(coords, dtype=np.float64)
+    if coords.ndim == 1:
+        coords = coords.reshape(-1, 2)
+
+    distances = linear_route.project(coords)
+    fractions = distances / linear_route.length if linear_route.length else np.zeros_like(distances)
+    snapped_coords = linear_route.interpolate_normalized(fractions)
+    return Snaps(fractions, distances, snapped_coords, np.zeros(len(coords)))
+
+
+def snap_linestrings(linestrings: List[LineString], route: LineString, system=settings.LONLAT) -> Snaps:
+    """
+    Snap the start points of the linestrings onto the route and project the linestrings
+    onto the route (like `project_onto_route`, in the direction of the route), in a single
+    vectorized call.
+
+    The projected lengths are measured in the given projection system.
+    """
+    linear_route = get_linear_route(route, system)
+    coords = [np.array(transform(linestring, system).coords, dtype=np.float64) for linestring in linestrings]
+    if not coords:
+        return Snaps(np.zeros(0), np.zeros(0), np.zeros((0, linear_route.coords.shape[1])), np.zeros(0))
+
+    # Project the coordinates of all linestrings at once
+    n_coords = np.array([len(c) for c in coords])
+    offsets = np.concatenate(([0], np.cumsum(n_coords)[:-1]))
+    groups = np.repeat(np.arange(len(coords)), n_coords)
+    all_coords = np.concatenate([c[:, :2] for c in coords])
+    distances = linear_route.project(all_coords)
+    fractions = distances / linear_route.length if linear_route.length else np.zeros_like(distances)
+
+    # The start point of each linestring
+    start_fractions = fractions[offsets]
+    snapped_coords = linear_route.interpolate_normalized(start_fractions)
+
+    # Sort the projected coordinates of each linestring in the direction of the route
+    order = np.lexsort((fractions, groups))
+    projected_coords = linear_route.interpolate_normalized(fractions[order])
+    segments = projected_coords[1:, :2] - projected_coords[:-1, :2]
+    segment_lengths = np.sqrt(segments[:, 0] * segments[:, 0] + segments[:, 1] * segments[:, 1])
+    # Only sum up the segments within each linestring
+    within = groups[1:] == groups[:-1]
+    projected_lengths = np.bincount(groups[1:][within], weights=segment_lengths[within], minlength=len(coords))
+
+    return Snaps(start_fractions, distances[offsets], snapped_coords, projected_lengths)
 
 
 def project_onto_route_new(
@@ -185,18 +246,15 @@ def points_in_route_dir(linestring: LineString, route: LineString, system=settin
     The points are returned in the projection system of the linestring.
     """
 
-    system_linestring = linestring.transform(system, clone=True)
-    system_route = route.transform(system, clone=True)
+    system_linestring = transform(linestring, system)
+    linear_route = get_linear_route(route, system)
 
-    points = []
-    fractions = []
-    for coord in system_linestring.coords:
-        point_geometry = Point(*coord, srid=system)
-        points.append(point_geometry.transform(linestring.srid, clone=True))
-        fraction = system_route.project_normalized(point_geometry)
-        fractions.append(fraction)
+    coords = np.array(system_linestring.coords, dtype=np.float64)
+    fractions = linear_route.project_normalized(coords)
+    sorted_linestring = LineString(coords[np.argsort(fractions, kind="stable")], srid=system)
+    sorted_linestring = transform(sorted_linestring, linestring.srid)
 
-    return [p for p, _ in sorted(zip(points, fractions), key=lambda x: x[1])]
+    return [Point(*coord, srid=linestring.srid) for coord in sorted_linestring.coords]
 
 
 def get_extended_projected_linestring(lsa_linestring: LineString, route_linestring: LineString) -> LineString:
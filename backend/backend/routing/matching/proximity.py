@@ -5,9 +5,13 @@ from django.contrib.gis.geos.linestring import LineString
 from django.contrib.gis.measure import D
 from django.db.models.query import QuerySet
 from routing.matching import RouteMatcher
+from routing.snapshot import get_snapshot
 
 
 class ProximityMatcher(RouteMatcher):
+    # The proximity matcher fetches the candidates for the other matchers
+    stage_name = "candidates"
+
     def __init__(self, search_radius_m=13, *args, **kwargs):
         """
         Initialize the proximity matcher.
@@ -19,5 +23,9 @@ class ProximityMatcher(RouteMatcher):
 
     def matches(self, lsas: QuerySet, route: LineString) -> Tuple[QuerySet, LineString]:
         lsas, route = super().matches(lsas, route)
-        lsas = lsas.filter(geometry__dwithin=(route, D(m=self.search_radius_m)))
+        if isinstance(lsas, QuerySet):
+            lsas = lsas.filter(geometry__dwithin=(route, D(m=self.search_radius_m)))
+        else:
+            # Use the in-memory spatial index instead of querying the database
+            lsas = get_snapshot().lsas_within(route, self.search_radius_m, lsas)
         return lsas, route
@@ -0,0 +1,152 @@
+import logging
+import pickle
+import threading
+import time
+from collections import namedtuple
+from typing import Callable, Dict, List, Tuple
+
+from routing import stamps
+from routing.matching import RouteMatcher
+
+# The supported values for the `routing` parameter of the selection views.
+ROUTING_DATA = ("osm", "drn")
+
+
+def build_ml_pipeline(route_data: str) -> List[RouteMatcher]:
+    """
+    Build the matchers for the `ml` matcher parameter.
+    """
+    from routing.matching.ml.matcher import MLMatcher
+    from routing.matching.proximity import ProximityMatcher
+    return [ ProximityMatcher(search_radius_m=20), MLMatcher(route_data) ]
+
+
+def build_legacy_pipeline(route_data: str) -> List[RouteMatcher]:
+    """
+    Build the matchers for the `legacy` matcher parameter.
+    """
+    from routing.matching.hypermodel import TopologicHypermodelMatcher
+    return [ TopologicHypermodelMatcher.from_config_file(f'config/topologic.hypermodel.{route_data}.updated.json') ]
+
+
+PIPELINES = {
+    "ml": build_ml_pipeline,
+    "legacy": build_legacy_pipeline,
+}
+
+
+RegistryEntry = namedtuple("RegistryEntry", [
+    "matchers", # The list of matchers, applied in sequential order
+    "load_time_s", # The time it took to build the matchers, in seconds
+    "size_bytes", # The approximate memory size of the matchers (pickled size)
+    "loaded_at", # The unix timestamp at which the matchers were built
+])
+
+
+def estimate_size(matchers: List[RouteMatcher]) -> int:
+    """
+    Estimate the memory size of the matchers by their pickled size.
+
+    Returns -1 if the matchers cannot be pickled.
+    """
+    try:
+        return len(pickle.dumps(matchers, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return -1
+
+
+class MatcherRegistry:
+    """
+    A registry that builds each (matcher, routing) pipeline once per process.
+
+    Building a pipeline loads the ML model and feature transformer or the
+    hypermodel config from the disk. The registry keeps the built matchers
+    so that subsequent requests can reuse them. Run the `reload_matchers`
+    management command to let every worker rebuild its pipelines, e.g.
+    after the model or config files changed.
+    """
+
+    def __init__(self, pipelines: Dict[str, Callable[[str], List[RouteMatcher]]] = PIPELINES):
+        self.pipelines = pipelines
+        self.entries: Dict[Tuple[str, str], RegistryEntry] = {}
+        self.stamp = stamps.read(stamps.MATCHERS_STAMP)
+        self.lock = threading.Lock()
+
+    def check_stamp(self):
+        """
+        Drop all built pipelines if a reload was requested in the meantime.
+        """
+        stamp = stamps.read(stamps.MATCHERS_STAMP)
+        if stamp != self.stamp:
+            logging.info("Matcher reload requested, dropping all built matchers.")
+            with self.lock:
+                self.entries = {}
+                self.stamp = stamp
+
+    def load(self, matcher: str, route_data: str) -> RegistryEntry:
+        """
+        Build the pipeline for the given matcher and routing data.
+        """
+        if matcher not in self.pipelines:
+            raise KeyError(f"Unknown matcher: {matcher}")
+        if route_data not in ROUTING_DATA:
+            raise KeyError(f"Unknown routing data: {route_data}")
+
+        start = time.perf_counter()
+        matchers = self.pipelines[matcher](route_data)
+        load_time_s = time.perf_counter() - start
+        logging.info(f"Built matcher {matcher} ({route_data}) in {load_time_s:.3f}s")
+        return RegistryEntry(matchers, load_time_s, estimate_size(matchers), time.time())
+
+    def get(self, matcher: str, route_data: str) -> List[RouteMatcher]:
+        """
+        Return the pipeline for the given matcher and routing data.
+
+        The pipeline is built on the first access and reused afterwards.
+        Raises a KeyError if the matcher or routing data is not supported.
+        """
+        self.check_stamp()
+        key = (matcher, route_data)
+        entry = self.entries.get(key)
+        if entry is None:
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is None:
+                    entry = self.load(matcher, route_data)
+                    self.entries[key] = entry
+        return entry.matchers
+
+    def preload(self):
+        """
+        Build all supported pipelines.
+        """
+        for matcher in self.pipelines:
+            for route_data in ROUTING_DATA:
+                self.get(matcher, route_data)
+
+    def reload(self):
+        """
+        Drop all built pipelines of this process.
+        """
+        with self.lock:
+            self.entries = {}
+
+    def describe(self) -> List[dict]:
+        """
+        Describe the built pipelines, for introspection.
+        """
+        return [
+            {
+                "matcher": matcher,
+                "routing": route_data,
+                "matchers": [m.__class__.__name__ for m in entry.matchers],
+                "loadTimeSeconds": entry.load_time_s,
+                "sizeBytes": entry.size_bytes,
+                "loadedAt": entry.loaded_at,
+            }
+            for (matcher, route_data), entry in self.entries.items()
+        ]
+
+
+# The registry of this process.
+matcher_registry = MatcherRegistry()
@@ -1,10 +1,47 @@
+import math
+from typing import List, Tuple
+
+import numpy as np
+from django.conf import settings
 from django.contrib.gis.measure import D
 from django.contrib.gis.geos.linestring import LineString
-from routing.matching.bearing import calc_bearing_diffs
-from routing.matching.projection import project_onto_route
+from django.db.models import Q
+from routing import metrics
+from routing.matching.bearing import get_bearing
+from routing.matching.context import transform
+from routing.matching.linear_referencing import get_linear_route
 
 from routing.models import LSA
 
+
+def calc_ingress_bearing_diffs(sgs: List[LSA], route: LineString) -> np.ndarray:
+    """
+    Calculate the bearing differences between the last segments of the ingress
+    geometries of the SGs and their projections onto the route, for all SGs at once.
+
+    This is the same as `calc_bearing_diffs(tail, project_onto_route(tail, route))[0]`
+    for the tail of each ingress geometry. The bearing differences will be in the interval [0, 360].
+    """
+    if not sgs:
+        return np.zeros(0)
+
+    # The last two points of each ingress geometry, of shape (n, 2, 2)
+    tails = np.array([
+        [coord[:2] for coord in transform(sg.ingress_geometry, settings.LONLAT).coords[-2:]] for sg in sgs
+    ], dtype=np.float64)
+
+    # Project the tails onto the route, in the direction of the route
+    linear_route = get_linear_route(route, settings.LONLAT)
+    fractions = linear_route.project_normalized(tails.reshape(-1, 2)).reshape(-1, 2)
+    fractions = np.sort(fractions, axis=1, kind="stable")
+    projections = linear_route.interpolate_normalized(fractions.reshape(-1))[:, :2].reshape(-1, 2, 2)
+
+    tail_bearings = get_bearing(tails[:, 0, 0], tails[:, 0, 1], tails[:, 1, 0], tails[:, 1, 1])
+    projection_bearings = get_bearing(
+        projections[:, 0, 0], projections[:, 0, 1], projections[:, 1, 0], projections[:, 1, 1])
+    return np.abs(tail_bearings - projection_bearings)
+
+
 class MultiLaneMatcher:
     """
     Class for the multi lane SG matching algorithm.
@@ -13,27 +50,42 @@ class MultiLaneMatcher:
     def __init__(self, route: LineString):
         self.route = route
         
-    def match(self, distance_to_route: int, bearing_diff: int):
+    def metric_search_area(self, distance_to_route: int) -> Tuple[LineString, float]:
+        """
+        Return the route in the metrical system and a search distance in its units.
+
+        Distances in the Mercator projection are stretched by 1 / cos(latitude),
+        so the distance is stretched for the latitude farthest from the equator.
+        A small margin covers the difference between the sphere and the spheroid.
+        """
+        metric_route = self.route.transform(settings.METRICAL, clone=True)
+        lonlat_route = self.route.transform(settings.LONLAT, clone=True)
+        max_latitude = max(abs(coord[1]) for coord in lonlat_route.coords)
+        return metric_route, 1.01 * distance_to_route / math.cos(math.radians(max_latitude))
+
+    def match(self, distance_to_route: int, bearing_diff: int) -> List[LSA]:
         """
         Perform the multi lane matching based on proximity and bearing.
+
+        The candidates are fetched with their metadata in a single query and filtered
+        by bearing in memory. Returns the matched SGs as a list.
         """
         
         # First: Gather all SGs that are within a certain distance of the route.
-        nearby_sgs = LSA.objects.filter(geometry__dwithin=(self.route, D(m=distance_to_route)))
-        print(f"Found {nearby_sgs.count()} SGs within {distance_to_route}m of the route.")
+        # The planar index of the metric geometries narrows down the candidates cheaply,
+        # before the exact distance is checked on the geography.
+        with metrics.stage("candidates"):
+            nearby_sgs = list(LSA.objects \
+                .select_related("lsametadata") \
+                .filter(Q(metric_geometry__isnull=True) | Q(metric_geometry__dwithin=self.metric_search_area(distance_to_route))) \
+                .filter(geometry__dwithin=(self.route, D(m=distance_to_route))))
+        metrics.record_lsas("candidates", nearby_sgs)
         
         # Second: Filter the SGs by bearing.
-        sg_ids_to_remove = set()
-        for sg in nearby_sgs:
-            sg_start = LineString(sg.ingress_geometry.coords[-2:])
-            sg_start.srid = sg.ingress_geometry.srid
-            sg_start_route_projection = project_onto_route(sg_start, self.route)
-            
-            bearing_diffs = calc_bearing_diffs(sg_start, sg_start_route_projection)
-            if bearing_diffs[0] > bearing_diff:
-                sg_ids_to_remove.add(sg.id)
-            
-        print(f"Removed {len(sg_ids_to_remove)} SGs based on bearing.")
-        nearby_sgs = nearby_sgs.exclude(id__in=sg_ids_to_remove)
-        
-        return nearby_sgs
\ No newline at end of file
+        # (SGs with an undefined bearing difference are kept, as before)
+        with metrics.stage("bearing"):
+            bearing_diffs = calc_ingress_bearing_diffs(nearby_sgs, self.route)
+            keep = ~(bearing_diffs > bearing_diff)
+            matched_sgs = [sg for sg, keep_sg in zip(nearby_sgs, keep.tolist()) if keep_sg]
+        metrics.record_lsas("bearing", matched_sgs)
+        return matched_sgs
@@ -0,0 +1,325 @@
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.query import QuerySet
+
+# The buckets of the durations, in seconds
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The buckets of the numbers of LSAs or queries per request
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+class Histogram:
+    """
+    A histogram of observations with labels, like a Prometheus histogram.
+
+    The bucket counts are kept per bucket (not cumulative), so that
+    the histograms of multiple workers can be summed up.
+    """
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: List[str], buckets: Tuple[float, ...]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # The bucket counts (with a last bucket for +Inf), the sum and the count by the label values
+        self.values: Dict[Tuple[str, ...], list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labelvalues: str):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            values = self.values.get(labelvalues)
+            if values is None:
+                values = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self.values[labelvalues] = values
+            values[0][index] += 1
+            values[1] += value
+            values[2] += 1
+
+    def dump(self) -> list:
+        with self.lock:
+            return [[list(labelvalues), list(counts), total, count] for labelvalues, (counts, total, count) in self.values.items()]
+
+    def reset(self):
+        with self.lock:
+            self.values.clear()
+
+    def render(self, dumps: List[list]) -> Iterator[str]:
+        """
+        Render the summed up dumps of the histogram in the Prometheus text format.
+        """
+        merged: Dict[Tuple[str, ...], list] = {}
+        for labelvalues, counts, total, count in dumps:
+            if len(counts) != len(self.buckets) + 1:
+                # Written with other buckets, e.g. by an older version
+                continue
+            values = merged.setdefault(tuple(labelvalues), [[0] * len(counts), 0.0, 0])
+            values[0] = [a + b for a, b in zip(values[0], counts)]
+            values[1] += total
+            values[2] += count
+
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} histogram"
+        for labelvalues in sorted(merged):
+            counts, total, count = merged[labelvalues]
+            labels = format_labels(self.labelnames, labelvalues)
+            cumulative = 0
+            for bound, bucket_count in zip(list(self.buckets) + [float("inf")], counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                yield f'{self.name}_bucket{format_labels(self.labelnames + ["le"], labelvalues + (le,))} {cumulative}'
+            yield f"{self.name}_sum{labels} {repr(float(total))}"
+            yield f"{self.name}_count{labels} {count}"
+
+
+class CallbackCounter:
+    """
+    A counter whose values are read from a callback, e.g. from the counters of a cache.
+
+    The callback returns the values by a single label value.
+    """
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelname: str):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = [labelname]
+        self.callback: Optional[Callable[[], Dict[str, float]]] = None
+
+    def dump(self) -> list:
+        if self.callback is None:
+            return []
+        return [[[str(labelvalue)], value] for labelvalue, value in self.callback().items()]
+
+    def reset(self):
+        self.callback = None
+
+    def render(self, dumps: List[list]) -> Iterator[str]:
+        merged: Dict[Tuple[str, ...], float] = {}
+        for labelvalues, value in dumps:
+            merged[tuple(labelvalues)] = merged.get(tuple(labelvalues), 0) + value
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} counter"
+        for labelvalues in sorted(merged):
+            yield f"{self.name}{format_labels(self.labelnames, labelvalues)} {merged[labelvalues]}"
+
+
+def format_labels(labelnames: List[str], labelvalues: Tuple[str, ...]) -> str:
+    escaped = (
+        str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        for value in labelvalues
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(labelnames, escaped)) + "}"
+
+
+REQUEST_DURATION = Histogram(
+    "routing_request_duration_seconds", "The duration of the routing requests.",
+    ["view"], DURATION_BUCKETS)
+STAGE_DURATION = Histogram(
+    "routing_stage_duration_seconds", "The duration of the stages of the routing requests, summed up per request.",
+    ["view", "stage"], DURATION_BUCKETS)
+MATCHER_LSAS = Histogram(
+    "routing_matcher_lsas", "The number of LSAs that remain after each matcher, per request.",
+    ["view", "matcher"], COUNT_BUCKETS)
+DB_QUERIES = Histogram(
+    "routing_request_db_queries", "The number of database queries per routing request.",
+    ["view"], COUNT_BUCKETS)
+SELECTION_CACHE_EVENTS = CallbackCounter(
+    "routing_selection_cache_events_total", "The hits, misses and invalidations of the selection cache.",
+    "event")
+
+METRICS = [REQUEST_DURATION, STAGE_DURATION, MATCHER_LSAS, DB_QUERIES, SELECTION_CACHE_EVENTS]
+
+
+class RequestMetrics:
+    """
+    The metrics of a single request, which are observed when the request is finished.
+
+    The durations of stages that occur multiple times in a request
+    (e.g. for each route of a batch) are summed up.
+    """
+
+    def __init__(self, view: str):
+        self.view = view
+        self.stage_durations: Dict[str, float] = {}
+        self.matcher_lsas: Dict[str, int] = {}
+        self.n_queries = 0
+        self.finished = False
+
+    def add_duration(self, stage: str, duration_s: float):
+        if self.finished:
+            # E.g. a response that is streamed after the view returned
+            STAGE_DURATION.observe(duration_s, self.view, stage)
+            return
+        self.stage_durations[stage] = self.stage_durations.get(stage, 0.0) + duration_s
+
+    def add_lsas(self, matcher: str, n_lsas: int):
+        self.matcher_lsas[matcher] = self.matcher_lsas.get(matcher, 0) + n_lsas
+
+    def count_query(self, execute, sql, params, many, context):
+        # Used as the execute wrapper of the database connection
+        self.n_queries += 1
+        return execute(sql, params, many, context)
+
+    def finish(self, duration_s: float):
+        self.finished = True
+        REQUEST_DURATION.observe(duration_s, self.view)
+        DB_QUERIES.observe(self.n_queries, self.view)
+        for stage, stage_duration_s in self.stage_durations.items():
+            STAGE_DURATION.observe(stage_duration_s, self.view, stage)
+        for matcher, n_lsas in self.matcher_lsas.items():
+            MATCHER_LSAS.observe(n_lsas, self.view, matcher)
+
+
+_current_request: ContextVar[Optional[RequestMetrics]] = ContextVar("current_request", default=None)
+
+# The process that the metrics were observed in, see `check_process`
+_pid = os.getpid()
+
+# The time of the last write of the metrics of this process, see `flush`
+_last_flush = 0.0
+_flush_lock = threading.Lock()
+
+
+def check_process():
+    """
+    Reset the metrics if this is a new (forked) process, so that the metrics
+    of the parent process are not counted again by each worker.
+    """
+    global _pid, _last_flush
+    if os.getpid() != _pid:
+        _pid = os.getpid()
+        _last_flush = 0.0
+        for metric in METRICS:
+            if isinstance(metric, Histogram):
+                metric.reset()
+
+
+def get_request() -> Optional[RequestMetrics]:
+    """
+    Return the metrics of the current request, if any.
+    """
+    return _current_request.get()
+
+
+@contextmanager
+def request_metrics(view: str):
+    """
+    Record the metrics of a request within this context.
+
+    The metrics are written to the metrics directory when the request is finished
+    (at most once per `METRICS_FLUSH_INTERVAL_S`), so that the metrics endpoint
+    can sum them up over all workers.
+    """
+    check_process()
+    request = RequestMetrics(view)
+    token = _current_request.set(request)
+    start = time.perf_counter()
+    try:
+        with connection.execute_wrapper(request.count_query):
+            yield request
+    finally:
+        _current_request.reset(token)
+        request.finish(time.perf_counter() - start)
+        flush()
+
+
+@contextmanager
+def stage(name: Optional[str]):
+    """
+    Measure the duration of a stage of the current request.
+
+    Outside of a request (e.g. in the management commands) or without
+    a name (see `RouteMatcher.stage_name`), nothing is measured.
+    """
+    request = _current_request.get()
+    if request is None or name is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        request.add_duration(name, time.perf_counter() - start)
+
+
+def record_lsas(matcher: str, lsas):
+    """
+    Record the number of LSAs that remain after the matcher, in the current request.
+
+    Querysets are not counted, since counting them would cost another query.
+    """
+    request = _current_request.get()
+    if request is not None and not isinstance(lsas, QuerySet):
+        request.add_lsas(matcher, len(lsas))
+
+
+def get_metrics_path(pid: int) -> str:
+    return os.path.join(settings.METRICS_DIR, f"{pid}.json")
+
+
+def flush(force: bool = False):
+    """
+    Write the metrics of this process to the metrics directory.
+
+    :param force: Whether to write the metrics even if they were
+        written less than `METRICS_FLUSH_INTERVAL_S` ago.
+    """
+    global _last_flush
+    with _flush_lock:
+        now = time.monotonic()
+        if not force and now - _last_flush < settings.METRICS_FLUSH_INTERVAL_S:
+            return
+        _last_flush = now
+        content = {metric.name: metric.dump() for metric in METRICS}
+        path = get_metrics_path(os.getpid())
+        try:
+            os.makedirs(settings.METRICS_DIR, exist_ok=True)
+            # Write to a temporary file first, so that the metrics are never read half-written
+            with open(f"{path}.tmp", "w") as f:
+                json.dump(content, f)
+            os.replace(f"{path}.tmp", path)
+        except OSError as e:
+            logging.warning(f"Could not write the metrics: {e}")
+
+
+def render() -> str:
+    """
+    Render the metrics of all workers in the Prometheus text format.
+
+    The metrics files of finished workers are kept, so that the counts never decrease.
+    The directory should be cleared before the server is started.
+    """
+    check_process()
+    flush(force=True)
+    dumps: Dict[str, list] = {metric.name: [] for metric in METRICS}
+    for path in sorted(glob.glob(os.path.join(settings.METRICS_DIR, "*.json"))):
+        try:
+            with open(path) as f:
+                content = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Could not read the metrics file {path}: {e}")
+            continue
+        for name, metric_dumps in content.items():
+            if name in dumps:
+                dumps[name].extend(metric_dumps)
+
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render(dumps[metric.name]))
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,44 @@
+import django.contrib.gis.db.models.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0008_lsa_bearing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lsa',
+            name='metric_egress_geometry',
+            field=django.contrib.gis.db.models.fields.LineStringField(null=True, srid=3857),
+        ),
+        migrations.AddField(
+            model_name='lsa',
+            name='metric_geometry',
+            field=django.contrib.gis.db.models.fields.LineStringField(null=True, srid=3857),
+        ),
+        migrations.AddField(
+            model_name='lsa',
+            name='metric_ingress_geometry',
+            field=django.contrib.gis.db.models.fields.LineStringField(null=True, srid=3857),
+        ),
+        migrations.AddField(
+            model_name='lsacrossing',
+            name='metric_point',
+            field=django.contrib.gis.db.models.fields.PointField(null=True, srid=3857),
+        ),
+        # Fill the new columns for the LSAs and crossings that are already loaded
+        migrations.RunSQL(
+            sql="""
+                UPDATE routing_lsa SET
+                    metric_ingress_geometry = ST_Transform(ingress_geometry::geometry, 3857),
+                    metric_geometry = ST_Transform(geometry::geometry, 3857),
+                    metric_egress_geometry = ST_Transform(egress_geometry::geometry, 3857);
+                UPDATE routing_lsacrossing SET
+                    metric_point = ST_Transform(point::geometry, 3857);
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0009_metric_geometries'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LSAFeatures',
+            fields=[
+                ('lsa', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='routing.lsa')),
+                ('lane_type_index', models.IntegerField()),
+                ('street_crossings', models.IntegerField()),
+                ('length', models.FloatField()),
+                ('segment_lengths', models.JSONField()),
+                ('segment_bearings', models.JSONField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,22 @@
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('routing', '0010_lsafeatures'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CrossingEnvelope',
+            fields=[
+                ('traffic_lights_id', models.CharField(max_length=10, primary_key=True, serialize=False)),
+                ('envelope', django.contrib.gis.db.models.fields.GeometryField(srid=4326)),
+                ('buffered_geometry', django.contrib.gis.db.models.fields.PolygonField(srid=3857)),
+                ('padding', models.FloatField()),
+                ('lsa_ids', models.JSONField()),
+            ],
+        ),
+    ]
@@ -1,9 +1,23 @@
 from django.conf import settings
 from django.contrib.gis.db import models
-from django.contrib.gis.geos import Point
+from django.contrib.gis.geos import GEOSGeometry, Point
 from django.utils.functional import cached_property
 
 
+def to_metrical(geometry: GEOSGeometry) -> GEOSGeometry:
+    """
+    Return a copy of the geometry in the metrical system.
+
+    Geometries without a projection system are assumed to be in LONLAT,
+    like the geometries that are loaded into the geography fields.
+    """
+    geometry = geometry.clone()
+    if geometry.srid is None:
+        geometry.srid = settings.LONLAT
+    geometry.transform(settings.METRICAL)
+    return geometry
+
+
 class LSA(models.Model):
     """ A LSA. """
 
@@ -27,6 +41,25 @@ class LSA(models.Model):
     # If the first two geometry coordinates go to the west, the bearing is 270.
     bearing = models.FloatField(default=None, null=True)
 
+    # The geometries above, pre-projected into the metrical system.
+    # These are filled by the load commands, see `update_metric_geometries`.
+    # If they are missing, the matchers transform the geometries on the fly.
+    metric_ingress_geometry = models.LineStringField(
+        srid=settings.METRICAL, null=True)
+    metric_geometry = models.LineStringField(srid=settings.METRICAL, null=True)
+    metric_egress_geometry = models.LineStringField(
+        srid=settings.METRICAL, null=True)
+
+    def update_metric_geometries(self):
+        """
+        Project the geometries into the metrical system.
+
+        This needs to be called whenever the geometries are changed.
+        """
+        self.metric_ingress_geometry = to_metrical(self.ingress_geometry)
+        self.metric_geometry = to_metrical(self.geometry)
+        self.metric_egress_geometry = to_metrical(self.egress_geometry)
+
     @cached_property
     def start_point(self) -> Point:
         """
@@ -91,6 +124,64 @@ class LSAMetadata(models.Model):
         return f"{self.lsa.id}"
 
 
+class LSAFeatures(models.Model):
+    """
+    The ML features of a LSA that don't depend on the route.
+
+    These are computed once by the `precompute_lsa_features` command,
+    so that the feature extractors don't need to compute them per request.
+    The geometric features refer to the connection geometry in the
+    metrical system, with duplicate coordinates removed.
+    """
+
+    lsa = models.OneToOneField(LSA, on_delete=models.CASCADE, primary_key=True)
+
+    # The index of the lane type in the one hot encoding of the lane type feature
+    lane_type_index = models.IntegerField()
+
+    # The number of streets that the connection geometry is crossing
+    street_crossings = models.IntegerField()
+
+    # The length of the connection geometry
+    length = models.FloatField()
+
+    # The lengths of the segments of the connection geometry
+    segment_lengths = models.JSONField()
+
+    # The bearings of the segments of the connection geometry
+    segment_bearings = models.JSONField()
+
+    def __str__(self):
+        return f"{self.lsa_id}"
+
+
+class CrossingEnvelope(models.Model):
+    """
+    The extent of the LSAs of a crossing, i.e. of a traffic lights id.
+
+    These are rebuilt by the `sync_crossings` command, so that the crossing-based
+    matchers and the composer don't need to aggregate the LSA geometries per request.
+    """
+
+    # The traffic lights id of the LSAs, see `LSAMetadata`
+    traffic_lights_id = models.CharField(max_length=10, primary_key=True)
+
+    # The envelope of the connection geometries of the LSAs
+    envelope = models.GeometryField(srid=settings.LONLAT)
+
+    # The envelope in the metrical system, buffered by the padding
+    buffered_geometry = models.PolygonField(srid=settings.METRICAL)
+
+    # The padding of the buffered geometry, in meters
+    padding = models.FloatField()
+
+    # The ids of the LSAs of the crossing
+    lsa_ids = models.JSONField()
+
+    def __str__(self):
+        return f"{self.traffic_lights_id}"
+
+
 class LSACrossing(models.Model):
     """
     A crossing where we may find traffic lights.
@@ -112,6 +203,17 @@ class LSACrossing(models.Model):
     # Some crossings may not contain any connected traffic lights at all.
     connected = models.BooleanField(default=False)
 
+    # The point, pre-projected into the metrical system, see `update_metric_point`.
+    metric_point = models.PointField(srid=settings.METRICAL, null=True)
+
+    def update_metric_point(self):
+        """
+        Project the point into the metrical system.
+
+        This needs to be called whenever the point is changed.
+        """
+        self.metric_point = to_metrical(self.point)
+
     def __str__(self):
         return f"{self.id} ({self.name})"
 
@@ -0,0 +1,158 @@
+import json
+from collections import namedtuple
+from typing import List, Optional, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry, LineString
+from routing.matching import RouteMatcher, get_matches
+from routing.matching.context import lsa_geometry, transform_coords
+from routing.matching.linear_referencing import LinearRoute
+from routing.matching.projection import snap_points
+from routing.models import LSA
+from routing.snapshot import LSASnapshot
+
+# A matched route, as stored for later reroutes: the route and the ids of the matched LSAs
+MatchRecord = namedtuple("MatchRecord", ["route", "lsa_ids"])
+
+# How much of a route was reused from the previous route:
+# - The length of the route and of the reused part, in meters
+# - The number of reused and rematched LSAs
+Reuse = namedtuple("Reuse", ["route_length_m", "reused_length_m", "n_reused", "n_rematched"])
+
+
+def record_key(key: str) -> str:
+    """
+    Return the cache key of the match record of the route with the given (selection) cache key.
+    """
+    return f"record:{key}"
+
+
+def encode_record(record: MatchRecord) -> bytes:
+    return json.dumps({"route": record.route.hexewkb.decode("ascii"), "lsaIds": record.lsa_ids}).encode("utf8")
+
+
+def decode_record(data: bytes) -> MatchRecord:
+    content = json.loads(data)
+    return MatchRecord(GEOSGeometry(content["route"]), content["lsaIds"])
+
+
+def find_changed_sections(
+    previous_route: LineString,
+    route: LineString,
+    tolerance_m: float,
+) -> Optional[Tuple[Tuple[float, float], Tuple[float, float]]]:
+    """
+    Find the parts of the previous route and of the route that differ from each other.
+
+    The routes share a prefix (or suffix) as long as their first (or last)
+    vertices are within the tolerance of each other. Returns the start and
+    end of the changed part of the previous route and of the route, as distances
+    along the respective route in meters, or None if the routes share neither
+    a prefix nor a suffix.
+    """
+    previous_coords = transform_coords(np.array(previous_route.coords)[:, :2], previous_route.srid, settings.METRICAL)
+    coords = transform_coords(np.array(route.coords)[:, :2], route.srid, settings.METRICAL)
+    n = min(len(previous_coords), len(coords))
+
+    def n_shared(a: np.ndarray, b: np.ndarray) -> int:
+        close = np.sqrt(((a[:n] - b[:n]) ** 2).sum(axis=1)) <= tolerance_m
+        return n if close.all() else int(np.argmin(close))
+
+    n_prefix = n_shared(previous_coords, coords)
+    # The suffix can't overlap with the prefix
+    n_suffix = min(n_shared(previous_coords[::-1], coords[::-1]), n - n_prefix)
+    if n_prefix < 2 and n_suffix < 2:
+        return None
+
+    def changed_section(coords: np.ndarray) -> Tuple[float, float]:
+        linear_route = LinearRoute(coords, settings.METRICAL)
+        measures = np.concatenate(([0.0], linear_route.cum_ends))
+        start = measures[n_prefix - 1] if n_prefix > 0 else 0.0
+        end = measures[len(coords) - n_suffix] if n_suffix > 0 else linear_route.length
+        return float(start), float(max(start, end))
+
+    return changed_section(previous_coords), changed_section(coords)
+
+
+def find_changed_section(previous_route: LineString, route: LineString, tolerance_m: float) -> Optional[Tuple[float, float]]:
+    """
+    Find the part of the route that differs from the previous route.
+
+    Returns the start and end of the changed part as distances along the route
+    in meters, or None if the routes share neither a prefix nor a suffix.
+    """
+    changed_sections = find_changed_sections(previous_route, route, tolerance_m)
+    return None if changed_sections is None else changed_sections[1]
+
+
+def get_distances_on_route(lsas: List[LSA], route: LineString) -> np.ndarray:
+    """
+    Return the distances along the route (in meters) to which the start points of the LSAs are snapped.
+    """
+    coords = [lsa_geometry(lsa, settings.METRICAL).coords[0][:2] for lsa in lsas]
+    return snap_points(coords, route, settings.METRICAL).distances
+
+
+def rematch(
+    route: LineString,
+    previous: MatchRecord,
+    matchers: List[RouteMatcher],
+    snapshot: LSASnapshot,
+    margin_m: float = None,
+    tolerance_m: float = None,
+) -> Optional[Tuple[List[LSA], Reuse]]:
+    """
+    Match the route incrementally, reusing the matches of the previous route where the routes are the same.
+
+    Only the changed part of the route, padded by the margin on both sides, is matched again.
+    The LSAs that are snapped into this section are taken from the new matching. The LSAs of
+    the previous matching are reused if they are snapped to the shared prefix or suffix of the
+    previous route (outside of its padded changed part), so that LSAs along an abandoned part
+    of the previous route are dropped, even if they are close to the shared part of the route.
+    Returns None if the routes share no prefix or suffix.
+    """
+    if margin_m is None:
+        margin_m = settings.REMATCH_MARGIN_M
+    if tolerance_m is None:
+        tolerance_m = settings.REMATCH_TOLERANCE_M
+
+    changed_sections = find_changed_sections(previous.route, route, tolerance_m)
+    if changed_sections is None:
+        return None
+
+    metric_route = LinearRoute(transform_coords(np.array(route.coords), route.srid, settings.METRICAL), settings.METRICAL)
+    (previous_start, previous_end), (start, end) = changed_sections
+    previous_lsas = [snapshot.lsas_by_pk[pk] for pk in previous.lsa_ids if pk in snapshot.lsas_by_pk]
+    if end <= start and previous_end <= previous_start:
+        # The routes are the same
+        return previous_lsas, Reuse(metric_route.length, metric_route.length, len(previous_lsas), 0)
+
+    if end > start:
+        start = max(start - margin_m, 0.0)
+        end = min(end + margin_m, metric_route.length)
+        previous_start -= margin_m
+        previous_end += margin_m
+
+    # Reuse the previous LSAs along the shared prefix and suffix of the previous route
+    previous_distances = get_distances_on_route(previous_lsas, previous.route)
+    reused_lsas = [
+        lsa for lsa, distance in zip(previous_lsas, previous_distances.tolist())
+        if distance < previous_start or distance > previous_end
+    ]
+
+    rematched_lsas = []
+    if end > start:
+        section_coords = transform_coords(metric_route.substring(start, end), settings.METRICAL, route.srid)
+        section = LineString(section_coords, srid=route.srid)
+        matched_lsas = list(get_matches(section, matchers, snapshot.bike_lsas))
+        matched_distances = get_distances_on_route(matched_lsas, route)
+        # Close to the ends of the section, an LSA may be both reused and rematched
+        reused_pks = {lsa.pk for lsa in reused_lsas}
+        rematched_lsas = [
+            lsa for lsa, distance in zip(matched_lsas, matched_distances.tolist())
+            if start <= distance <= end and lsa.pk not in reused_pks
+        ]
+
+    reuse = Reuse(metric_route.length, metric_route.length - (end - start), len(reused_lsas), len(rematched_lsas))
+    return reused_lsas + rematched_lsas, reuse
@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+from typing import Iterable, List, Optional
+
+import numpy as np
+from django.conf import settings
+from django.contrib.gis.geos import GEOSGeometry, LineString
+from routing import stamps
+from routing.models import LSA, LSACrossing, to_metrical
+
+
+class SpatialIndex:
+    """
+    A simple spatial index over metric geometries.
+
+    The index keeps the bounding boxes of all geometries in numpy arrays,
+    so that the candidates for a distance query can be found with a few
+    vectorized comparisons. Only the candidates are checked with GEOS.
+
+    Note that distances in the Mercator projection are stretched by
+    1 / cos(latitude). Therefore, each geometry carries a scale factor
+    which converts meters into Mercator units at its location. This
+    matches the geography distances of PostGIS up to a few centimeters
+    for the search radii that are used by the matchers.
+    """
+
+    def __init__(self, geometries: List[GEOSGeometry]):
+        """
+        Initialize the spatial index.
+
+        :param geometries: The geometries, in the metrical system.
+        """
+        self.geometries = geometries
+        extents = np.array([g.extent for g in geometries], dtype=np.float64).reshape(-1, 4)
+        self.min_x, self.min_y, self.max_x, self.max_y = extents.T
+        # The inverse Mercator transformation of the y coordinate gives the latitude
+        center_y = (self.min_y + self.max_y) / 2
+        latitudes = np.arctan(np.sinh(center_y / 6378137.0))
+        self.scales = 1 / np.cos(latitudes)
+
+    def query(self, geometry: GEOSGeometry, distance_m: float) -> List[int]:
+        """
+        Return the indices of all geometries within the given distance.
+
+        :param geometry: The geometry to query, in the metrical system.
+        :param distance_m: The distance in meters.
+        """
+        if not self.geometries:
+            return []
+        min_x, min_y, max_x, max_y = geometry.extent
+        padding = distance_m * self.scales
+        candidates = np.flatnonzero(
+            (self.min_x - padding <= max_x) & (self.max_x + padding >= min_x) &
+            (self.min_y - padding <= max_y) & (self.max_y + padding >= min_y)
+        )
+        return [
+            i for i in candidates.tolist()
+            if self.geometries[i].distance(geometry) <= padding[i]
+        ]
+
+
+class LSASnapshot:
+    """
+    A worker-local snapshot of all LSAs and crossings.
+
+    The snapshot answers proximity queries without any database access.
+    Its LSAs come with their metadata and precomputed features, so that
+    the matchers don't need to fetch them separately.
+    """
+
+    def __init__(self, lsas: List[LSA], crossings: List[LSACrossing], stamp: int = 0):
+        self.lsas = lsas
+        self.crossings = crossings
+        self.stamp = stamp
+        self.lsas_by_pk = {lsa.pk: lsa for lsa in lsas}
+
+        # Only consider LSA's that are also for cyclists
+        self.bike_lsas = [
+            lsa for lsa in lsas
+            if hasattr(lsa, "lsametadata") and "radfahrer" in lsa.lsametadata.lane_type.lower()
+        ]
+
+        # Use the pre-projected geometries, if they were loaded
+        self.lsa_index = SpatialIndex([
+            lsa.metric_geometry if lsa.metric_geometry is not None else to_metrical(lsa.geometry)
+            for lsa in lsas
+        ])
+        self.crossing_index = SpatialIndex([
+            crossing.metric_point if crossing.metric_point is not None else to_metrical(crossing.point)
+            for crossing in crossings
+        ])
+
+    @classmethod
+    def build(cls, stamp: int = 0) -> 'LSASnapshot':
+        """
+        Build a snapshot from the database.
+        """
+        lsas = list(LSA.objects.select_related("lsametadata", "lsafeatures").order_by("pk"))
+        crossings = list(LSACrossing.objects.order_by("pk"))
+        return cls(lsas, crossings, stamp)
+
+    def lsas_within(self, route: LineString, distance_m: float, lsas: Optional[Iterable[LSA]] = None) -> List[LSA]:
+        """
+        Return the LSAs within the given distance of the route.
+
+        :param route: The route, in any system.
+        :param distance_m: The distance in meters.
+        :param lsas: If given, only return LSAs from this collection,
+            in the order of the collection.
+        """
+        metric_route = route.transform(settings.METRICAL, clone=True)
+        nearby_lsas = [self.lsas[i] for i in self.lsa_index.query(metric_route, distance_m)]
+        if lsas is None:
+            return nearby_lsas
+        nearby_pks = set(lsa.pk for lsa in nearby_lsas)
+        return [lsa for lsa in lsas if lsa.pk in nearby_pks]
+
+    def crossings_within(self, route: LineString, distance_m: float) -> List[LSACrossing]:
+        """
+        Return the crossings within the given distance of the route.
+        """
+        metric_route = route.transform(settings.METRICAL, clone=True)
+        return [self.crossings[i] for i in self.crossing_index.query(metric_route, distance_m)]
+
+
+_snapshot: Optional[LSASnapshot] = None
+_snapshot_lock = threading.Lock()
+
+
+def get_snapshot() -> LSASnapshot:
+    """
+    Return the snapshot of this process.
+
+    The snapshot is built on the first access and rebuilt when the
+    LSA or crossing data was changed by one of the management commands.
+    """
+    global _snapshot
+    stamp = stamps.read(stamps.LSAS_STAMP)
+    snapshot = _snapshot
+    if snapshot is None or snapshot.stamp != stamp:
+        with _snapshot_lock:
+            snapshot = _snapshot
+            if snapshot is None or snapshot.stamp != stamp:
+                start = time.perf_counter()
+                snapshot = LSASnapshot.build(stamp)
+                logging.info(
+                    f"Built snapshot of {len(snapshot.lsas)} LSAs and {len(snapshot.crossings)} "
+                    f"crossings in {time.perf_counter() - start:.3f}s"
+                )
+                _snapshot = snapshot
+    return snapshot
@@ -0,0 +1,43 @@
+import os
+import time
+
+from django.conf import settings
+
+# Touched when the matcher models or configs should be reloaded.
+MATCHERS_STAMP = "matchers"
+
+# Touched when the LSAs or crossings in the database were changed.
+LSAS_STAMP = "lsas"
+
+
+def get_stamp_path(name: str) -> str:
+    """
+    Return the path of the stamp file with the given name.
+    """
+    return os.path.join(settings.STAMP_DIR, name)
+
+
+def touch(name: str):
+    """
+    Touch the stamp with the given name.
+
+    Stamps are plain files in the stamp directory. Every gunicorn worker
+    compares the modification time of a stamp with the one it has seen
+    before, so that a management command can signal a change to all workers.
+    """
+    os.makedirs(settings.STAMP_DIR, exist_ok=True)
+    with open(get_stamp_path(name), "w") as f:
+        f.write(str(time.time()))
+
+
+def read(name: str) -> int:
+    """
+    Return the version of the stamp with the given name.
+
+    The version is the modification time of the stamp in nanoseconds,
+    or 0 if the stamp was never touched.
+    """
+    try:
+        return os.stat(get_stamp_path(name)).st_mtime_ns
+    except FileNotFoundError:
+        return 0
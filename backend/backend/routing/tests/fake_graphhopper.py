@@ -0,0 +1,74 @@
+import json
+import threading
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List, Tuple
+
+
+class FakeGraphHopper:
+    """
+    A local stand-in for the map matching endpoint of GraphHopper.
+
+    The street name of each GPX track point is given by a function of its
+    (lon, lat) coordinate. Consecutive points with the same street name are
+    merged into one street name detail, like GraphHopper does.
+    """
+
+    def __init__(self, street_name: Callable[[Tuple[float, float]], str], status_code: int = 200):
+        self.street_name = street_name
+        self.status_code = status_code
+        # The paths and GPX tracks of all received requests
+        self.requests: List[Tuple[str, List[Tuple[float, float]]]] = []
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self.handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                coords = [(float(point.get("lon")), float(point.get("lat")))
+                          for point in ET.fromstring(body).iter("trkpt")]
+                with fake.lock:
+                    fake.requests.append((self.path, coords))
+                if fake.status_code != 200:
+                    self.respond(fake.status_code, {"message": "Fake error"})
+                    return
+                self.respond(200, fake.match(coords))
+
+            def respond(self, status_code, content):
+                data = json.dumps(content).encode("utf8")
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def match(self, coords):
+        details = []
+        for index, coord in enumerate(coords):
+            name = self.street_name(coord)
+            if details and details[-1][2] == name:
+                details[-1][1] = index
+            else:
+                details.append([index, index, name])
+        return {"paths": [{"details": {"street_name": details}}]}
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
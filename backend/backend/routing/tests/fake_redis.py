@@ -0,0 +1,40 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class FakeRedis:
+    """
+    A local stand-in for the redis client, with the `get` and `set` commands.
+
+    The entries expire like in redis. If `available` is False, all commands
+    raise a connection error.
+    """
+
+    def __init__(self):
+        self.available = True
+        # The values and expiry times (or None) by key
+        self.entries: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self.lock = threading.Lock()
+
+    def check_available(self):
+        if not self.available:
+            raise ConnectionError("Fake redis is not available")
+
+    def get(self, key: str) -> Optional[bytes]:
+        self.check_available()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self.entries[key]
+                return None
+            return value
+
+    def set(self, key: str, value: bytes, ex: Optional[int] = None):
+        self.check_available()
+        with self.lock:
+            self.entries[key] = (value, time.time() + ex if ex is not None else None)
+        return True
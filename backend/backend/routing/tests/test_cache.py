@@ -0,0 +1,97 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.gis.geos import LineString
+from django.test import TestCase, override_settings
+from routing import stamps
+from routing.cache import (LRUCache, RedisCache, SelectionCache,
+                           get_data_version)
+from routing.tests.fake_redis import FakeRedis
+
+
+class LRUCacheTest(TestCase):
+    def test_drops_least_recently_used(self):
+        cache = LRUCache(2)
+        cache.set("a", b"1")
+        cache.set("b", b"2")
+        self.assertEqual(cache.get("a"), b"1")
+        cache.set("c", b"3")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"1")
+        self.assertEqual(len(cache), 2)
+
+
+class SelectionCacheTest(TestCase):
+    route = LineString([(9.99, 53.56, 10), (10.0, 53.56, 11)], srid=4326)
+
+    def setUp(self):
+        self.stamp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(STAMP_DIR=self.stamp_dir.name)
+        self.settings_override.enable()
+        self.redis = FakeRedis()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.stamp_dir.cleanup()
+
+    def make_cache(self):
+        return SelectionCache(LRUCache(10), RedisCache(self.redis, ttl_s=60))
+
+    def test_key(self):
+        cache = self.make_cache()
+        key = cache.key(self.route, "ml", "osm")
+        # The same coordinates, in another instance
+        self.assertEqual(cache.key(LineString(self.route.coords, srid=4326), "ml", "osm"), key)
+        self.assertNotEqual(cache.key(self.route, "legacy", "osm"), key)
+        self.assertNotEqual(cache.key(self.route, "ml", "drn"), key)
+        other_route = LineString([(9.99, 53.56, 10), (10.0, 53.56, 12)], srid=4326)
+        self.assertNotEqual(cache.key(other_route, "ml", "osm"), key)
+
+    def test_tiers(self):
+        cache = self.make_cache()
+        key = cache.key(self.route, "ml", "osm")
+        self.assertIsNone(cache.get(key))
+        cache.set(key, b"response")
+        self.assertEqual(cache.get(key), b"response")
+
+        # Another worker finds the response in the shared cache
+        other_cache = self.make_cache()
+        self.assertEqual(other_cache.get(other_cache.key(self.route, "ml", "osm")), b"response")
+        self.assertEqual(other_cache.get(key), b"response")
+
+        self.assertEqual(cache.describe()["localHits"], 1)
+        self.assertEqual(cache.describe()["misses"], 1)
+        self.assertEqual(other_cache.describe()["sharedHits"], 1)
+        self.assertEqual(other_cache.describe()["localHits"], 1)
+
+    def test_shared_cache_unavailable(self):
+        cache = self.make_cache()
+        self.redis.available = False
+        key = cache.key(self.route, "ml", "osm")
+        with patch("logging.warning"):
+            cache.set(key, b"response")
+            self.assertEqual(cache.get(key), b"response")
+            self.assertIsNone(self.make_cache().get(key))
+
+    def test_invalidated_on_stamps(self):
+        cache = self.make_cache()
+        for stamp in (stamps.LSAS_STAMP, stamps.MATCHERS_STAMP):
+            key = cache.key(self.route, "ml", "osm")
+            cache.set(key, b"response")
+            stamps.touch(stamp)
+            new_key = cache.key(self.route, "ml", "osm")
+            self.assertNotEqual(new_key, key)
+            self.assertIsNone(cache.get(new_key))
+            self.assertEqual(len(cache.local), 0)
+        self.assertEqual(cache.describe()["invalidations"], 2)
+
+    def test_invalidated_on_model_change(self):
+        with tempfile.NamedTemporaryFile() as model_file:
+            with patch("routing.cache.get_model_files", return_value=[model_file.name]):
+                version = get_data_version()
+                self.assertEqual(get_data_version(), version)
+                model_file.write(b"new model")
+                model_file.flush()
+                os.utime(model_file.name, ns=(0, 0))
+                self.assertNotEqual(get_data_version(), version)
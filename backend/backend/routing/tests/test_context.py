@@ -0,0 +1,49 @@
+from unittest.mock import MagicMock
+
+from django.contrib.gis.geos import LineString, Point
+from django.test import TestCase
+from routing.matching.context import (get_context, lsa_geometry, match_context,
+                                      transform, transform_geometry)
+
+
+class MatchContextTest(TestCase):
+    route = LineString([(9.99, 53.56, 1), (9.995, 53.561, 2), (10.0, 53.562, 3)], srid=4326)
+
+    def test_transform_equals_geos(self):
+        for geometry in [self.route, Point(9.99, 53.56, srid=4326)]:
+            transformed = transform_geometry(geometry, 3857)
+            expected = geometry.transform(3857, clone=True)
+            self.assertEqual(transformed.srid, 3857)
+            self.assertEqual(transformed.hasz, expected.hasz)
+            for coord, expected_coord in zip(transformed.coords, expected.coords):
+                for c, e in zip(coord, expected_coord):
+                    self.assertAlmostEqual(c, e, places=6)
+
+    def test_transform_once(self):
+        with match_context(self.route) as context:
+            metric_route = transform(self.route, 3857)
+            self.assertIs(transform(self.route, 3857), metric_route)
+            # Transforming back yields the original route
+            self.assertIs(transform(metric_route, 4326), self.route)
+            # Transforming into the same system is not a transformation
+            self.assertIs(transform(self.route, 4326), self.route)
+            self.assertEqual(context.n_transforms, 1)
+            self.assertEqual(context.n_reused, 2)
+        self.assertIsNone(get_context())
+
+    def test_lsa_geometry(self):
+        lsa = MagicMock(pk="1", geometry=LineString([(9.99, 53.56), (9.991, 53.56)], srid=4326))
+        same_lsa = MagicMock(pk="1", geometry=lsa.geometry.clone())
+        changed_lsa = MagicMock(pk="1", geometry=LineString([(9.99, 53.56), (9.992, 53.56)], srid=4326))
+        with match_context(self.route) as context:
+            geometry = lsa_geometry(lsa, 3857)
+            # Another instance of the same LSA shares the transformed geometry
+            self.assertIs(lsa_geometry(same_lsa, 3857), geometry)
+            # A modified copy of the LSA is transformed again
+            self.assertIsNot(lsa_geometry(changed_lsa, 3857), geometry)
+            self.assertEqual(context.n_transforms, 2)
+
+    def test_nested_contexts(self):
+        with match_context(self.route) as outer:
+            with match_context(self.route) as inner:
+                self.assertIs(inner, outer)
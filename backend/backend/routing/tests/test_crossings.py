@@ -0,0 +1,136 @@
+import json
+import tempfile
+from unittest.mock import MagicMock, patch
+
+from django.conf import settings
+from django.contrib.gis.geos import LineString
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from routing.matching.context import match_context
+from routing.matching.crossings import (CrossingExecutor,
+                                        build_crossing_envelopes,
+                                        fetch_crossings,
+                                        rebuild_crossing_envelopes)
+from routing.matching.dijkstra import DijkstraMatcher
+from routing.matching.markov import MarkovMatcher
+from routing.models import LSA, CrossingEnvelope
+from routing.tests.utils import ROUTE, create_lsa
+
+
+def crossing_lsa_ids(crossing, route):
+    # Must be defined on the module level, to be sent to the worker processes
+    return [lsa.id for lsa in crossing.lsas]
+
+
+class CrossingExecutorTest(TestCase):
+    route = ROUTE
+
+    def setUp(self):
+        # A crossing with an LSA along the route and one that turns left
+        create_lsa("1", [(9.9910, 53.5600), (9.9920, 53.5600)], crossing_id="A")
+        create_lsa("2", [(9.9910, 53.5600), (9.9915, 53.5610)], crossing_id="A")
+        # A crossing with an LSA along the route
+        create_lsa("3", [(9.9960, 53.5600), (9.9970, 53.5600)], crossing_id="B")
+
+    def test_fetch_crossings(self):
+        # One query for the LSAs and one for the stored envelopes
+        with self.assertNumQueries(2):
+            crossings = fetch_crossings(LSA.objects.all())
+        self.assertEqual([crossing.crossing_id for crossing in crossings], ["A", "B"])
+        self.assertEqual(sorted(lsa.id for lsa in crossings[0].lsas), ["1", "2"])
+        for crossing in crossings:
+            self.assertIsNone(crossing.stored)
+            for lsa in crossing.lsas:
+                self.assertTrue(crossing.envelope.covers(lsa.geometry))
+
+    def test_stored_envelopes(self):
+        computed = fetch_crossings(LSA.objects.all())
+        CrossingEnvelope.objects.bulk_create(build_crossing_envelopes(padding=20))
+        self.assertEqual(sorted(CrossingEnvelope.objects.get(pk="A").lsa_ids), ["1", "2"])
+
+        stored = fetch_crossings(LSA.objects.all())
+        self.assertTrue(all(crossing.stored is not None for crossing in stored))
+        for padding in (20, 4):
+            matcher = DijkstraMatcher(crossing_padding=padding)
+            for computed_crossing, stored_crossing in zip(computed, stored):
+                self.assertTrue(matcher.get_crossing_bound(stored_crossing).equals_exact(
+                    matcher.get_crossing_bound(computed_crossing), 1e-9))
+
+        # The stored envelope is not used if only some LSAs of the crossing are candidates
+        crossings = fetch_crossings(LSA.objects.filter(pk__in=["1", "3"]))
+        self.assertIsNone(crossings[0].stored)
+        self.assertIsNotNone(crossings[1].stored)
+
+    def test_load_lsas_rebuilds_envelopes(self):
+        rebuild_crossing_envelopes(padding=20)
+
+        # LSA "1" is loaded again with another geometry, the other LSAs are gone
+        coords = [[9.9980, 53.5600], [9.9990, 53.5600]]
+        thing = {
+            "name": "1",
+            "Locations": [{"location": {"geometry": {"type": "MultiLineString", "coordinates": [coords] * 3}}}],
+            "Datastreams": [],
+            "properties": {
+                "topic": "", "assetID": "", "laneType": "Radfahrer", "language": "", "ownerThing": "",
+                "infoLastUpdate": "2022-01-01T00:00:00Z", "connectionID": "", "egressLaneID": "",
+                "ingressLaneID": "", "trafficLightsID": "A",
+            },
+        }
+        response = MagicMock(status_code=200, json=MagicMock(return_value={"value": [thing]}))
+        with tempfile.TemporaryDirectory() as stamp_dir, override_settings(STAMP_DIR=stamp_dir), \
+                patch("routing.management.commands.load_lsas.requests.get", return_value=response), \
+                patch("builtins.print"):
+            call_command("load_lsas", api="http://localhost", filter="all")
+
+        envelope = CrossingEnvelope.objects.get(pk="A")
+        self.assertEqual(envelope.lsa_ids, ["1"])
+        self.assertTrue(envelope.envelope.covers(LSA.objects.get(pk="1").geometry))
+        self.assertFalse(CrossingEnvelope.objects.filter(pk="B").exists())
+
+    def test_composer_route_crossings(self):
+        rebuild_crossing_envelopes(padding=20)
+        # A route that reaches only LSA "2" of crossing A, but all LSAs of crossing B
+        route = LineString([(9.9915, 53.5611), (9.9965, 53.5611), (9.9965, 53.5600), (10.0000, 53.5600)], srid=4326)
+
+        # The composer is only installed in the debug mode
+        with override_settings(INSTALLED_APPS=settings.INSTALLED_APPS + ["composer"]):
+            from composer.views import RouteCrossingsResource
+            request = RequestFactory().get("/composer/routes/1/crossings")
+            with patch("composer.views.get_object_or_404", return_value=MagicMock(geometry=route)), \
+                    self.assertNumQueries(2):
+                response = RouteCrossingsResource.as_view()(request, route_id=1)
+
+        results = json.loads(response.content)
+        self.assertEqual([(result["id"], result["lsas"]) for result in results], [("A", 1), ("B", 1)])
+        # The extent of crossing A only spans the LSA within reach
+        for result, lsa_id in zip(results, ["2", "3"]):
+            for value, expected in zip(result["extent"], LSA.objects.get(pk=lsa_id).geometry.extent):
+                self.assertAlmostEqual(value, expected, places=9)
+
+    def test_modes_select_the_same_lsas(self):
+        selected = {}
+        for mode in ("serial", "threads"):
+            executor = CrossingExecutor(mode, workers=2)
+            self.addCleanup(executor.shutdown)
+            for matcher in (DijkstraMatcher(executor=executor), MarkovMatcher(executor=executor)):
+                with match_context(self.route) as context:
+                    lsas, _ = matcher.matches(LSA.objects.all(), self.route)
+                    selected[(mode, type(matcher))] = sorted(lsa.id for lsa in lsas)
+                # The duration of each crossing is recorded
+                self.assertEqual([crossing_id for _, crossing_id, _ in context.crossing_timings], ["A", "B"])
+        for matcher_cls in (DijkstraMatcher, MarkovMatcher):
+            self.assertEqual(selected[("serial", matcher_cls)], selected[("threads", matcher_cls)])
+            self.assertIn("1", selected[("serial", matcher_cls)])
+            self.assertIn("3", selected[("serial", matcher_cls)])
+
+    def test_processes(self):
+        executor = CrossingExecutor("processes", workers=2)
+        self.addCleanup(executor.shutdown)
+        results = executor.map(crossing_lsa_ids, fetch_crossings(LSA.objects.all()), self.route)
+        self.assertEqual([result.crossing_id for result in results], ["A", "B"])
+        self.assertEqual([sorted(result.lsa_ids) for result in results], [["1", "2"], ["3"]])
+        self.assertTrue(all(result.duration_s >= 0 for result in results))
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            CrossingExecutor("gpu")
@@ -0,0 +1,110 @@
+import random
+from unittest.mock import MagicMock
+
+import numpy as np
+from django.contrib.gis.geos import LineString, MultiLineString
+from django.test import TestCase
+from routing.matching.dijkstra import (CrossingGraph, DijkstraMatcher,
+                                       StrictDijkstraMatcher, dijkstra)
+
+
+def random_graph(n_lsas: int) -> CrossingGraph:
+    """
+    Create a crossing graph with small integer costs, so that there are many equally short paths.
+    """
+    lsa_ids = random.sample([str(i) for i in range(100, 1000)], n_lsas)
+    return CrossingGraph(
+        lsa_ids,
+        np.array([random.randint(0, 5) for _ in range(n_lsas)], dtype=float),
+        np.array([random.randint(0, 5) for _ in range(n_lsas)], dtype=float),
+        np.array([[random.randint(0, 5) for _ in range(n_lsas)] for _ in range(n_lsas)], dtype=float),
+        float(random.randint(0, 12)),
+    )
+
+
+class DijkstraTest(TestCase):
+    def setUp(self):
+        random.seed(42)
+
+    def test_dijkstra(self):
+        graph = {
+            "start": [("a", 1), ("b", 4), ("end", 10)],
+            "a": [("b", 1), ("end", 6)],
+            "b": [("end", 1)],
+            "end": [],
+        }
+        self.assertEqual(dijkstra(graph, "start", "end"), ["start", "a", "b", "end"])
+
+    def test_dense_equals_heap(self):
+        for _ in range(200):
+            graph = random_graph(random.randint(0, 12))
+            dense_path = graph.shortest_path()
+            graph.dense_max_nodes = 0
+            self.assertEqual(dense_path, graph.shortest_path())
+
+
+class CrossingGraphTest(TestCase):
+    # Two parallel LSAs and one LSA that turns right, in the metrical system
+    mocked_lsas = [
+        MagicMock(id="LSA1", geometry=LineString([(0, 0), (0, 20), (0, 40)], srid=3857)),
+        MagicMock(id="LSA2", geometry=LineString([(3, 0), (3, 40)], srid=3857)),
+        MagicMock(id="LSA3", geometry=LineString([(1, 0), (1, 20), (20, 22)], srid=3857)),
+    ]
+    route = LineString([(0.5, -10), (0.5, 20), (15, 25)], srid=3857)
+
+    def reference_graph(self, matcher, route):
+        """
+        Build the graph edge by edge with GEOS, as the reference.
+        """
+        graph = {"start": {"end": matcher.offlsa_penalty * route.length}, "end": {}}
+        for lsa in self.mocked_lsas:
+            start_point = lsa.geometry.interpolate_normalized(0)
+            end_point = lsa.geometry.interpolate_normalized(1)
+            graph[lsa.id] = {}
+            if isinstance(matcher, StrictDijkstraMatcher):
+                graph["start"][lsa.id] = route.project(start_point) * matcher.offlsa_penalty \
+                    + route.distance(start_point) * matcher.offlsa_penalty + lsa.geometry.length
+                graph[lsa.id]["end"] = end_point.distance(route) * matcher.offlsa_penalty \
+                    + (route.length - route.project(end_point)) * matcher.offlsa_penalty
+            else:
+                graph["start"][lsa.id] = matcher.offlsa_penalty * start_point.distance(route.interpolate_normalized(0)) \
+                    + lsa.geometry.length
+                graph[lsa.id]["end"] = matcher.offlsa_penalty * end_point.distance(route.interpolate_normalized(1))
+            for other_lsa in self.mocked_lsas:
+                if other_lsa is lsa:
+                    continue
+                other_start_point = other_lsa.geometry.interpolate_normalized(0)
+                if isinstance(matcher, StrictDijkstraMatcher):
+                    graph[lsa.id][other_lsa.id] = end_point.distance(route) * matcher.offlsa_penalty \
+                        + abs(route.project(other_start_point) - route.project(end_point)) * matcher.offlsa_penalty \
+                        + route.distance(other_start_point) * matcher.offlsa_penalty + other_lsa.geometry.length
+                else:
+                    graph[lsa.id][other_lsa.id] = matcher.offlsa_penalty * end_point.distance(other_start_point) \
+                        + other_lsa.geometry.length
+        return graph
+
+    def assertGraphEqual(self, graph: CrossingGraph, reference):
+        adjacency_list = graph.as_adjacency_list()
+        self.assertEqual(set(adjacency_list), set(reference))
+        for node_id, edges in adjacency_list.items():
+            self.assertEqual({target for target, _ in edges}, set(reference[node_id]))
+            for target, cost in edges:
+                self.assertAlmostEqual(cost, reference[node_id][target], places=9)
+
+    def test_equals_reference(self):
+        for matcher in (DijkstraMatcher(), StrictDijkstraMatcher()):
+            graph = matcher.create_graph(self.mocked_lsas, self.route)
+            self.assertGraphEqual(graph, self.reference_graph(matcher, self.route))
+
+    def test_multilinestring_route(self):
+        matcher = StrictDijkstraMatcher()
+        route = MultiLineString([
+            LineString([(0.5, -10), (0.5, 10)]), LineString([(0.5, 15), (15, 25)])
+        ], srid=3857)
+        graph = matcher.create_graph(self.mocked_lsas, route)
+        self.assertGraphEqual(graph, self.reference_graph(matcher, route))
+
+    def test_shortest_path(self):
+        # The route runs along the right turn
+        graph = StrictDijkstraMatcher().create_graph(self.mocked_lsas, self.route)
+        self.assertEqual(graph.shortest_path(), ["start", "LSA3", "end"])
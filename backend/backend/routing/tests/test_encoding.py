@@ -0,0 +1,79 @@
+import json
+from unittest.mock import MagicMock
+
+from django.test import TestCase
+from routing.encoding import ResponseEncoder, make_signal_group
+
+
+def mocked_lsa(pk: str, signal_group_id: str) -> MagicMock:
+    lsa = MagicMock(pk=pk, id=pk, bearing=90.0)
+    lsa.start_point.x, lsa.start_point.y = 9.99, 53.56
+    lsa.geometry.coords = ((9.99, 53.56), (9.991, 53.561))
+    for field in ("connection_id", "lane_type", "datastream_detector_car_id", "datastream_detector_cyclists_id",
+                  "datastream_cycle_second_id", "datastream_primary_signal_id", "datastream_signal_program_id"):
+        setattr(lsa.lsametadata, field, f"{field}-{pk}-ä")
+    lsa.lsametadata.signal_group_id = signal_group_id
+    return lsa
+
+
+class ResponseEncoderTest(TestCase):
+    waypoints = [
+        {"lon": 9.99, "lat": 53.56, "alt": 0, "signalGroupId": None, "distanceOnRoute": 0},
+        {"lon": 9.991, "lat": 53.561, "alt": 1.5, "signalGroupId": "K1", "distanceOnRoute": 130.2, "distanceToNextSignal": 0},
+    ]
+
+    def setUp(self):
+        # Two LSAs of the same signal group, of which the last one is returned
+        self.lsas = [mocked_lsa("1", "K1"), mocked_lsa("2", "K2"), mocked_lsa("3", "K1")]
+        self.reference = {
+            "route": self.waypoints,
+            "signalGroups": {lsa.lsametadata.signal_group_id: make_signal_group(lsa) for lsa in self.lsas},
+            "crossings": [{"name": "A", "connected": False}],
+        }
+
+    def selection(self, encoder: ResponseEncoder) -> dict:
+        return {
+            "route": encoder.route(self.waypoints),
+            "signalGroups": encoder.signal_groups(self.lsas),
+            "crossings": [{"name": "A", "connected": False}],
+        }
+
+    def test_default_format(self):
+        for indent in (None, 2):
+            encoder = ResponseEncoder(indent=indent, chunk_size=1)
+            # The second encoding uses the cached fragments
+            for _ in range(2):
+                self.assertEqual(
+                    "".join(encoder.iterencode(self.selection(encoder))),
+                    json.dumps(self.reference, indent=indent, ensure_ascii=False),
+                )
+
+    def test_compact_format(self):
+        encoder = ResponseEncoder(format_version=2)
+        content = "".join(encoder.iterencode(self.selection(encoder)))
+        self.assertNotIn(" ", content)
+        selection = json.loads(content)
+        self.assertEqual(selection["route"]["lon"], [9.99, 9.991])
+        self.assertEqual(selection["route"]["distanceToNextSignal"], [None, 0])
+        self.assertEqual(selection["signalGroups"], json.loads(json.dumps(self.reference["signalGroups"])))
+
+    def test_embed(self):
+        encoder = ResponseEncoder(chunk_size=2)
+        results = [encoder.embed(self.selection(encoder)), {"error": "Invalid route"}, encoder.embed(self.selection(encoder))]
+        self.assertEqual(
+            "".join(encoder.iterencode({"results": results})),
+            json.dumps({"results": [self.reference, {"error": "Invalid route"}, self.reference]}, ensure_ascii=False),
+        )
+
+    def test_streamed_response(self):
+        encoder = ResponseEncoder()
+        completed = []
+        response = encoder.response(self.selection(encoder), stream=True, on_complete=completed.append)
+        self.assertTrue(response.streaming)
+        content = b"".join(response.streaming_content)
+        self.assertEqual(json.loads(content), json.loads(json.dumps(self.reference)))
+        self.assertEqual(completed, [content])
+
+    def test_unsupported_format_version(self):
+        with self.assertRaises(ValueError):
+            ResponseEncoder(format_version=3)
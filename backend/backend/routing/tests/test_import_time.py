@@ -0,0 +1,81 @@
+import os
+import re
+import subprocess
+import sys
+from typing import Dict
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+# The budget for the cold import of the routing app, in seconds (the best of `N_RUNS`)
+IMPORT_TIME_BUDGET_S = 1.5
+N_RUNS = 3
+
+# Modules that the request path must not import, since no production pipeline needs them
+# or they are only imported when a pipeline is built
+HEAVY_MODULES = [
+    "routing.matching.hypermodel",
+    "routing.matching.markov",
+    "routing.matching.dijkstra",
+    "routing.matching.ml.features",
+    "routing.matching.ml.street_names",
+    "ml_evaluation",
+    "requests",
+    "sklearn",
+]
+
+IMPORT_TIME_LINE = re.compile(r"^import time:\s+\d+ \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def import_times(code: str) -> Dict[str, float]:
+    """
+    Run the code in a fresh interpreter with `-X importtime` and return the
+    cumulative import time of each imported module, in seconds.
+
+    The times of the routing modules are summed up under "routing",
+    without counting the routing modules that import each other twice.
+    """
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": "backend.settings"}
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import django; django.setup(); {code}"],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True)
+
+    times = {}
+    routing_s = 0.0
+    # The lines are printed after the imports of each module, i.e. after the lines of
+    # the modules that it imported. In reverse, each module comes before its imports.
+    ancestors = []
+    for line in reversed(process.stderr.splitlines()):
+        match = IMPORT_TIME_LINE.match(line)
+        if match is None:
+            continue
+        cumulative_us, indent, name = match.groups()
+        depth = len(indent) // 2
+        while ancestors and ancestors[-1][0] >= depth:
+            ancestors.pop()
+        is_routing = name == "routing" or name.startswith("routing.")
+        if is_routing and not any(is_routing_ancestor for _, is_routing_ancestor in ancestors):
+            routing_s += int(cumulative_us) / 1e6
+        ancestors.append((depth, is_routing))
+        times[name] = int(cumulative_us) / 1e6
+    times["routing"] = routing_s
+    return times
+
+
+class ImportTimeTest(SimpleTestCase):
+    def test_request_path(self):
+        runs = [import_times("import routing.urls") for _ in range(N_RUNS)]
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, runs[0], f"{module} is imported by the request path")
+
+        import_time_s = min(times["routing"] for times in runs)
+        self.assertLess(
+            import_time_s, IMPORT_TIME_BUDGET_S,
+            f"The routing app took {import_time_s:.3f}s to import, the budget is {IMPORT_TIME_BUDGET_S}s")
+
+    def test_legacy_pipeline(self):
+        times = import_times(
+            "from routing.matching.registry import build_legacy_pipeline; build_legacy_pipeline('osm')")
+        self.assertIn("routing.matching.overlap", times)
+        for module in ["routing.matching.markov", "routing.matching.dijkstra", "routing.matching.ml.features"]:
+            self.assertNotIn(module, times, f"{module} is imported by the legacy pipeline")
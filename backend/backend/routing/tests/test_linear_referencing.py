@@ -0,0 +1,106 @@
+import random
+from unittest.mock import patch
+
+import numpy as np
+from django.contrib.gis.geos import LineString, Point
+from django.test import TestCase
+from routing.matching.linear_referencing import LinearRoute
+from routing.matching.projection import points_in_route_dir, project_onto_route
+
+
+def random_linestring(n_points: int, srid=4326) -> LineString:
+    """
+    Create a random walk linestring around Hamburg.
+    """
+    coords = [(9.99, 53.56, 10.0)]
+    for _ in range(n_points - 1):
+        x, y, z = coords[-1]
+        # Sometimes repeat a vertex to get zero-length segments
+        if random.random() < 0.1:
+            coords.append((x, y, z))
+            continue
+        coords.append((x + random.gauss(0, 1e-3), y + random.gauss(0, 1e-3), z + random.gauss(0, 1)))
+    return LineString(coords, srid=srid)
+
+
+def geos_project_onto_route(linestring: LineString, route: LineString) -> LineString:
+    """
+    The point-by-point GEOS implementation of `project_onto_route`, for reference.
+    """
+    points = [Point(*coord, srid=route.srid) for coord in linestring.coords]
+    points.sort(key=lambda p: route.project_normalized(p))
+    return LineString([
+        route.interpolate_normalized(route.project_normalized(p)) for p in points
+    ], srid=route.srid)
+
+
+class LinearRouteTest(TestCase):
+    def setUp(self):
+        random.seed(42)
+
+    def test_equals_geos(self):
+        for _ in range(50):
+            route = random_linestring(random.randint(2, 50))
+            linear_route = LinearRoute.from_linestring(route)
+            self.assertAlmostEqual(linear_route.length, route.length)
+
+            # Points on the route vertices and points near the route
+            coords = list(route.coords) + [
+                (x + random.gauss(0, 1e-3), y + random.gauss(0, 1e-3))
+                for x, y, _ in random.sample(route.coords, min(5, len(route.coords)))
+            ]
+            points = np.array([c[:2] for c in coords])
+
+            distances = linear_route.project(points)
+            fractions = linear_route.project_normalized(points)
+            offsets = linear_route.distance(points)
+            for (x, y), distance, fraction, offset in zip(points, distances, fractions, offsets):
+                point = Point(x, y, srid=route.srid)
+                self.assertAlmostEqual(distance, route.project(point), places=12)
+                self.assertAlmostEqual(fraction, route.project_normalized(point), places=12)
+                self.assertAlmostEqual(offset, route.distance(point), places=12)
+
+            sampled = list(distances) + [0, route.length, route.length * 2] + \
+                [random.uniform(0, route.length) for _ in range(10)]
+            for distance, interpolated in zip(sampled, linear_route.interpolate(sampled)):
+                expected = route.interpolate(distance)
+                self.assertAlmostEqual(interpolated[0], expected.x, places=12)
+                self.assertAlmostEqual(interpolated[1], expected.y, places=12)
+
+            sampled = [random.random() for _ in range(10)]
+            for fraction, interpolated in zip(sampled, linear_route.interpolate_normalized(sampled)):
+                expected = route.interpolate_normalized(fraction)
+                self.assertAlmostEqual(interpolated[0], expected.x, places=12)
+                self.assertAlmostEqual(interpolated[1], expected.y, places=12)
+
+    def test_chunks(self):
+        route = LinearRoute.from_linestring(random_linestring(100))
+        points = route.coords[:, :2] + np.random.default_rng(42).normal(0, 1e-3, (len(route.coords), 2))
+        distances, measures = route.distance(points), route.project(points)
+        # Chunks of 4 points, and of a single point (less than one point per chunk)
+        for pairs in (4 * 99, 10):
+            with patch("routing.matching.linear_referencing.NEAREST_CHUNK_PAIRS", pairs):
+                np.testing.assert_array_equal(route.distance(points), distances)
+                np.testing.assert_array_equal(route.project(points), measures)
+
+    def test_project_onto_route_equals_geos(self):
+        for _ in range(50):
+            route = random_linestring(random.randint(2, 50))
+            linestring = random_linestring(random.randint(2, 10))
+            projected = project_onto_route(linestring, route)
+            expected = geos_project_onto_route(linestring, route)
+            self.assertEqual(len(projected.coords), len(expected.coords))
+            for coord, expected_coord in zip(projected.coords, expected.coords):
+                self.assertAlmostEqual(coord[0], expected_coord[0], places=12)
+                self.assertAlmostEqual(coord[1], expected_coord[1], places=12)
+
+    def test_points_in_route_dir_equals_geos(self):
+        for _ in range(50):
+            route = random_linestring(random.randint(2, 50))
+            linestring = random_linestring(random.randint(2, 10))
+            points = points_in_route_dir(linestring, route)
+            expected = sorted(
+                (Point(*coord, srid=route.srid) for coord in linestring.coords),
+                key=lambda p: route.project_normalized(p),
+            )
+            self.assertEqual([p.coords[:2] for p in points], [p.coords[:2] for p in expected])
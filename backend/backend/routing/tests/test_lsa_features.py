@@ -0,0 +1,67 @@
+from unittest.mock import patch
+
+import numpy as np
+from django.contrib.gis.geos import LineString
+from django.test import TestCase
+from routing.matching.context import match_context
+from routing.matching.ml.configs_production.datasets import \
+    config_data_and_features
+from routing.matching.ml.features import (get_features,
+                                          get_precomputed_features)
+from routing.matching.ml.features.feature_lengths import Lengths
+from routing.matching.ml.features.feature_street_crossings import \
+    StreetCrossings
+from routing.matching.ml.features.precomputed import compute_lsa_features
+from routing.models import LSA
+from routing.snapshot import LSASnapshot
+from routing.tests.utils import create_lsa
+
+
+class LSAFeaturesTest(TestCase):
+    # A route along a street in Hamburg, going to the east
+    route = LineString([(9.9900, 53.5600, 0), (9.9950, 53.5601, 0), (10.0000, 53.5600, 0)], srid=4326)
+
+    # The production config, with all route-independent features
+    config = {
+        **config_data_and_features[8603],
+        Lengths: [0, 1],
+        "feature_extractor_combination": [
+            *config_data_and_features[8603]["feature_extractor_combination"], StreetCrossings
+        ],
+    }
+
+    def setUp(self):
+        create_lsa("1", [(9.9910, 53.5601), (9.9915, 53.5602), (9.9920, 53.5601)], lane_type="KFZ/Radfahrer")
+
+        # The planet_osm_line table is not managed by the test database
+        patcher = patch.object(StreetCrossings, "count_street_crossings", return_value=2)
+        self.count_street_crossings = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        compute_lsa_features(LSA.objects.select_related("lsametadata").get(pk="1")).save()
+
+    def test_features_are_read_from_the_snapshot(self):
+        lsa = LSASnapshot.build().lsas[0]
+        with self.assertNumQueries(0):
+            precomputed = get_precomputed_features(lsa)
+        self.assertEqual(precomputed.lane_type_index, 2)
+        self.assertEqual(precomputed.street_crossings, 2)
+        self.assertEqual(len(precomputed.segment_lengths), 2)
+        self.assertEqual(len(precomputed.segment_bearings), 2)
+
+    def test_features_are_not_queried(self):
+        lsa = LSA.objects.get(pk="1")
+        with self.assertNumQueries(0):
+            self.assertIsNone(get_precomputed_features(lsa))
+
+    def test_precomputed_features_equal_extracted_features(self):
+        # Like in the matching, the features are extracted within a match context
+        with match_context(self.route):
+            extracted = get_features(LSA.objects.select_related("lsametadata").get(pk="1"), self.route, self.config)[0]
+        self.count_street_crossings.reset_mock()
+
+        lsa = LSASnapshot.build().lsas[0]
+        with match_context(self.route):
+            precomputed = get_features(lsa, self.route, self.config)[0]
+        np.testing.assert_array_equal(precomputed, extracted)
+        self.count_street_crossings.assert_not_called()
@@ -0,0 +1,74 @@
+import math
+from unittest.mock import MagicMock
+
+from django.contrib.gis.geos import LineString, Point
+from django.test import TestCase
+from routing.matching.markov import (MarkovModel, MarkovModelEdge,
+                                     MarkovModelNode)
+
+
+class MarkovModelTest(TestCase):
+    sigma_z = 4.07
+    beta = 3
+
+    # Two parallel LSAs and one LSA that turns right, in the metrical system
+    mocked_lsas = [
+        MagicMock(id="LSA1", geometry=LineString([(0, 0), (0, 20), (0, 40)], srid=3857)),
+        MagicMock(id="LSA2", geometry=LineString([(3, 0), (3, 40)], srid=3857)),
+        MagicMock(id="LSA3", geometry=LineString([(1, 0), (1, 20), (20, 22)], srid=3857)),
+    ]
+
+    def route_points(self, x_offset=0.3):
+        return [Point(x_offset, y, srid=3857) for y in (0, 5, 10, 18, 25, 33)]
+
+    def reference_nodes(self, route_points):
+        """
+        Build the layers of the model with the node objects, as the reference.
+        """
+        layers = []
+        for point in route_points:
+            layer = []
+            for lsa in self.mocked_lsas:
+                fraction = lsa.geometry.project_normalized(point)
+                point_on_lsa = lsa.geometry.interpolate_normalized(fraction)
+                layer.append(MarkovModelNode(lsa.id, lsa, self.sigma_z, point_on_lsa, point))
+            layers.append(layer)
+        start = MarkovModelNode("start", None, self.sigma_z, route_points[0], route_points[0])
+        end = MarkovModelNode("end", None, self.sigma_z, route_points[-1], route_points[-1])
+        return start, layers, end
+
+    def log_transition(self, origin, target):
+        return math.log(MarkovModelEdge(self.beta, origin, target).transition_probability)
+
+    def test_probabilities_equal_reference(self):
+        route_points = self.route_points()
+        model = MarkovModel.build_model(self.sigma_z, self.beta, route_points, self.mocked_lsas)
+        start, layers, end = self.reference_nodes(route_points)
+
+        self.assertEqual(model.lsa_ids, ["LSA1", "LSA2", "LSA3"])
+        self.assertAlmostEqual(model.log_start_end_emission, math.log(start.emission_probability))
+        for k, layer in enumerate(layers):
+            for i, node in enumerate(layer):
+                self.assertAlmostEqual(model.log_emissions[k, i], math.log(node.emission_probability))
+        for k, (layer_1, layer_2) in enumerate(zip(layers[:-1], layers[1:])):
+            for i, origin in enumerate(layer_1):
+                for j, target in enumerate(layer_2):
+                    self.assertAlmostEqual(model.log_transitions[k, i, j], self.log_transition(origin, target))
+        for j, node in enumerate(layers[0]):
+            self.assertAlmostEqual(model.log_start_transitions[j], self.log_transition(start, node))
+        for i, node in enumerate(layers[-1]):
+            self.assertAlmostEqual(model.log_end_transitions[i], self.log_transition(node, end))
+
+    def test_viterbi(self):
+        # The route runs along the first LSA
+        model = MarkovModel.build_model(self.sigma_z, self.beta, self.route_points(), self.mocked_lsas)
+        self.assertEqual(model.viterbi(), ["LSA1"] * 6)
+
+    def test_viterbi_far_from_the_lsas(self):
+        # The raw probabilities would underflow to zero at this distance
+        model = MarkovModel.build_model(self.sigma_z, self.beta, self.route_points(x_offset=60), self.mocked_lsas)
+        self.assertEqual(len(model.viterbi()), 6)
+
+    def test_viterbi_without_lsas(self):
+        model = MarkovModel.build_model(self.sigma_z, self.beta, self.route_points(), [])
+        self.assertEqual(model.viterbi(), [])
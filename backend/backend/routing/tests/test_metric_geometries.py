@@ -0,0 +1,57 @@
+from django.contrib.gis.geos import Point
+from django.test import TestCase
+from routing.matching.context import lsa_geometry, match_context
+from routing.matching_multi_lane.matcher import MultiLaneMatcher
+from routing.models import LSA, LSACrossing
+from routing.snapshot import LSASnapshot
+from routing.tests.utils import ROUTE, create_lsa
+
+
+class MetricGeometriesTest(TestCase):
+    route = ROUTE
+
+    def setUp(self):
+        # Like the load commands, create the geometries without a projection system
+        # On the route, going to the east
+        create_lsa("1", [(9.9910, 53.5600), (9.9920, 53.5600)], srid=None)
+        # On the route, going to the east, without metric geometries
+        create_lsa("2", [(9.9930, 53.5600), (9.9940, 53.5600)], metric=False, srid=None)
+        # On the route, going to the west
+        create_lsa("3", [(9.9970, 53.5600), (9.9960, 53.5600)], srid=None)
+        # Far away from the route
+        create_lsa("4", [(9.9000, 53.5000), (9.9010, 53.5000)], srid=None)
+
+        crossing = LSACrossing(name="A", point=Point(9.9950, 53.5602, srid=4326))
+        crossing.update_metric_point()
+        crossing.save()
+
+    def test_metric_geometries_are_stored(self):
+        lsa = LSA.objects.get(pk="1")
+        self.assertEqual(lsa.metric_geometry.srid, 3857)
+        expected = lsa.geometry.transform(3857, clone=True)
+        for coord, expected_coord in zip(lsa.metric_geometry.coords, expected.coords):
+            for c, e in zip(coord, expected_coord):
+                self.assertAlmostEqual(c, e, places=6)
+        self.assertIsNone(LSA.objects.get(pk="2").metric_geometry)
+
+        crossing = LSACrossing.objects.get(name="A")
+        self.assertEqual(crossing.metric_point.srid, 3857)
+        self.assertTrue(crossing.metric_point.equals_exact(crossing.point.transform(3857, clone=True), 1e-6))
+
+    def test_lsa_geometry_uses_stored_geometry(self):
+        lsa = LSA.objects.get(pk="1")
+        with match_context(self.route) as context:
+            self.assertIs(lsa_geometry(lsa, 3857), lsa.metric_geometry)
+            # Other systems and LSAs without metric geometries are still transformed
+            lsa_geometry(lsa, 4326)
+            lsa_geometry(LSA.objects.get(pk="2"), 3857)
+            self.assertEqual(context.n_transforms, 1)
+
+    def test_snapshot(self):
+        snapshot = LSASnapshot.build()
+        self.assertEqual(sorted(lsa.pk for lsa in snapshot.lsas_within(self.route, 10)), ["1", "2", "3"])
+        self.assertEqual([c.name for c in snapshot.crossings_within(self.route, 50)], ["A"])
+
+    def test_multi_lane_matcher(self):
+        matches = MultiLaneMatcher(self.route).match(distance_to_route=10, bearing_diff=45)
+        self.assertEqual(sorted(lsa.pk for lsa in matches), ["1", "2"])
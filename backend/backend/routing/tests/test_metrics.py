@@ -0,0 +1,100 @@
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from django.contrib.gis.geos import LineString
+from django.test import TestCase, override_settings
+from routing import metrics
+from routing.matching import RouteMatcher, get_matches
+from routing.matching.hypermodel import HypermodelMatcher
+from routing.matching.proximity import ProximityMatcher
+from routing.models import LSA
+
+
+class MetricsTest(TestCase):
+    def setUp(self):
+        self.metrics_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(METRICS_DIR=self.metrics_dir.name)
+        self.settings_override.enable()
+        # Not throttled by the flushes of the other tests
+        patcher = patch.object(metrics, "_last_flush", 0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for metric in metrics.METRICS:
+            if isinstance(metric, metrics.Histogram):
+                metric.reset()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.metrics_dir.cleanup()
+
+    def test_histogram(self):
+        histogram = metrics.Histogram("test_seconds", "A test histogram.", ["stage"], (0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 5.0):
+            histogram.observe(value, "a")
+        lines = list(histogram.render(histogram.dump() + histogram.dump()))
+        self.assertIn('test_seconds_bucket{stage="a",le="0.1"} 4', lines)
+        self.assertIn('test_seconds_bucket{stage="a",le="1.0"} 6', lines)
+        self.assertIn('test_seconds_bucket{stage="a",le="+Inf"} 8', lines)
+        self.assertIn('test_seconds_count{stage="a"} 8', lines)
+        self.assertIn("# TYPE test_seconds histogram", lines)
+
+    def test_request_metrics(self):
+        with metrics.request_metrics("test"):
+            # Repeated stages are summed up per request
+            for _ in range(3):
+                with metrics.stage("matcher:TestMatcher"):
+                    list(LSA.objects.all())
+            metrics.record_lsas("TestMatcher", [None] * 7)
+            # Querysets are not counted
+            metrics.record_lsas("OtherMatcher", LSA.objects.all())
+
+        self.assertEqual(metrics.STAGE_DURATION.values[("test", "matcher:TestMatcher")][2], 1)
+        self.assertEqual(metrics.DB_QUERIES.values[("test",)][1], 3)
+        self.assertEqual(metrics.MATCHER_LSAS.values[("test", "TestMatcher")][1], 7)
+        self.assertNotIn(("test", "OtherMatcher"), metrics.MATCHER_LSAS.values)
+
+        # Outside of a request, nothing is recorded
+        with metrics.stage("validation"):
+            pass
+        self.assertNotIn(("test", "validation"), metrics.STAGE_DURATION.values)
+
+    def test_hypermodel_stages(self):
+        route = LineString([(9.9900, 53.5600), (9.9950, 53.5600)], srid=4326)
+        sequential_model = [ProximityMatcher(search_radius_m=20), RouteMatcher()]
+        with patch.object(HypermodelMatcher, "get_sequential_model", return_value=sequential_model):
+            matcher = HypermodelMatcher({})
+        with metrics.request_metrics("test"):
+            get_matches(route, [matcher], LSA.objects.all())
+
+        # Each matcher of the sequential model is a stage of its own
+        for stage in ("candidates", "matcher:RouteMatcher"):
+            self.assertEqual(metrics.STAGE_DURATION.values[("test", stage)][2], 1)
+        # The hypermodel itself is not, so that the stages are not counted twice
+        self.assertNotIn(("test", "matcher:HypermodelMatcher"), metrics.STAGE_DURATION.values)
+
+    @override_settings(METRICS_FLUSH_INTERVAL_S=60)
+    def test_flush_interval(self):
+        for _ in range(2):
+            with metrics.request_metrics("test"):
+                pass
+
+        # Only the first request was written within the interval
+        with open(metrics.get_metrics_path(os.getpid())) as f:
+            content = json.load(f)
+        self.assertEqual(content[metrics.REQUEST_DURATION.name][0][3], 1)
+
+        # The metrics endpoint writes the metrics of its own worker anyway
+        content = self.client.get("/metrics").content.decode("utf8")
+        self.assertIn('routing_request_duration_seconds_count{view="test"} 2', content)
+
+    def test_render_sums_up_workers(self):
+        with metrics.request_metrics("test"):
+            pass
+        # The metrics of another worker
+        with open(os.path.join(self.metrics_dir.name, "1.json"), "w") as f:
+            json.dump({metrics.REQUEST_DURATION.name: metrics.REQUEST_DURATION.dump()}, f)
+
+        content = self.client.get("/metrics").content.decode("utf8")
+        self.assertIn('routing_request_duration_seconds_count{view="test"} 2', content)
@@ -0,0 +1,97 @@
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+from django.contrib.gis.geos import LineString
+from django.test import TestCase
+from routing.matching.ml.configs_production.datasets import \
+    config_data_and_features
+from routing.matching.ml.features import FeatureLayout, get_feature_layout
+from routing.matching.ml.features.feature_bearing_diffs import BearingDiffs
+from routing.matching.ml.features.feature_lsa_lane_type import LSALaneType
+from routing.matching.ml.features.feature_side import Side
+from routing.matching.ml.matcher import MLMatcher, MLPredictions
+from sklearn.neural_network import MLPClassifier
+
+
+class BatchedInferenceTest(TestCase):
+    route = LineString([(9.99, 53.56), (10.0, 53.56)], srid=4326)
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        X_train = rng.normal(size=(200, 4))
+        y_train = (X_train[:, 0] + X_train[:, 1] > 0).astype(int)
+
+        self.matcher = MLMatcher("osm")
+        self.matcher.clf = MLPClassifier(hidden_layer_sizes=(8,), max_iter=500, random_state=0).fit(X_train, y_train)
+        self.matcher.transformer = None
+
+        self.X = rng.normal(size=(50, 4))
+        self.lsas = [MagicMock(pk=str(i)) for i in range(len(self.X))]
+
+    def test_predict_equals_unbatched_predictions(self):
+        with patch("routing.matching.ml.matcher.get_feature_matrix", return_value=self.X):
+            predictions = self.matcher.predict(self.lsas, self.route)
+
+        expected_labels = self.matcher.clf.predict(self.X.tolist())
+        expected_probabilities = self.matcher.clf.predict_proba(self.X.tolist())
+        np.testing.assert_array_equal(predictions.labels, expected_labels == 1)
+        np.testing.assert_array_equal(predictions.probabilities, expected_probabilities[:, 1])
+
+        for lsa, label, probability in zip(self.lsas, expected_labels, expected_probabilities):
+            self.assertEqual(predictions.label(lsa.pk), bool(label))
+            self.assertEqual(predictions.probability(lsa.pk), probability[1])
+        self.assertEqual(
+            predictions.matched_ids(),
+            [lsa.pk for lsa, label in zip(self.lsas, expected_labels) if label],
+        )
+
+    def test_predict_batch_equals_predictions_per_route(self):
+        # Three routes, of which one has no candidates
+        sizes = [20, 0, 30]
+        matrices = [self.X[:20], np.zeros((0, 4)), self.X[20:]]
+        batch = [(self.lsas[:20], self.route), ([], self.route), (self.lsas[20:], self.route)]
+
+        with patch("routing.matching.ml.matcher.get_feature_matrix", side_effect=matrices), \
+                patch.object(self.matcher.clf, "predict_proba", wraps=self.matcher.clf.predict_proba) as predict_proba:
+            batch_predictions = self.matcher.predict_batch(batch)
+        # The candidates of all routes are classified in a single pass
+        self.assertEqual(predict_proba.call_count, 1)
+
+        self.assertEqual([len(predictions) for predictions in batch_predictions], sizes)
+        for (lsas, route), X, predictions in zip(batch, matrices, batch_predictions):
+            with patch("routing.matching.ml.matcher.get_feature_matrix", return_value=X):
+                expected = self.matcher.predict(lsas, route)
+            np.testing.assert_array_equal(predictions.labels, expected.labels)
+            np.testing.assert_allclose(predictions.probabilities, expected.probabilities)
+            self.assertEqual(predictions.matched_ids(), expected.matched_ids())
+
+    def test_predict_without_candidates(self):
+        with patch("routing.matching.ml.matcher.get_feature_matrix", return_value=np.array([])):
+            predictions = self.matcher.predict([], self.route)
+        self.assertEqual(len(predictions), 0)
+        self.assertEqual(predictions.matched_ids(), [])
+
+
+class MLPredictionsTest(TestCase):
+    def test_keyed_by_lsa_id(self):
+        predictions = MLPredictions(["a", "b", "c"], np.array([True, False, True]), np.array([0.9, 0.2, 0.6]))
+        self.assertEqual(predictions.matched_ids(), ["a", "c"])
+        self.assertEqual(predictions.probability("b"), 0.2)
+        self.assertFalse(predictions.label("b"))
+
+
+class FeatureLayoutTest(TestCase):
+    config = config_data_and_features[8603]
+
+    def test_offsets(self):
+        layout = FeatureLayout(self.config)
+        # BearingDiffs, RouteBearingChange, Lengths, LengthDiffs, PointDistances, Distance, Side, LSALaneType
+        self.assertEqual(layout.width, 2 + 1 + 1 + 1 + 2 + 1 + 3 + 5)
+        self.assertEqual(layout.offsets[BearingDiffs], 0)
+        self.assertEqual(layout.offsets[Side], 8)
+        self.assertEqual(layout.offsets[LSALaneType], 11)
+        self.assertEqual(layout.allocate(3).shape, (3, 16))
+        self.assertEqual(layout.allocate(3).dtype, np.float32)
+
+    def test_compiled_once(self):
+        self.assertIs(get_feature_layout(self.config), get_feature_layout(self.config))
@@ -0,0 +1,73 @@
+import random
+from unittest.mock import MagicMock
+
+from django.contrib.gis.geos import LineString
+from django.test import TestCase
+from routing.matching.bearing import calc_bearing_diffs
+from routing.matching.projection import project_onto_route
+from routing.matching_multi_lane.matcher import MultiLaneMatcher, calc_ingress_bearing_diffs
+from routing.tests.utils import ROUTE, create_lsa
+from routing.views import get_sg_distances_on_route
+
+
+class IngressBearingDiffsTest(TestCase):
+    # A route in Hamburg that goes to the east and then to the north
+    route = LineString([(9.9900, 53.5600, 0), (9.9950, 53.5600, 0), (9.9950, 53.5650, 0)], srid=4326)
+
+    def setUp(self):
+        random.seed(42)
+
+    def random_sg(self):
+        coords = [(random.uniform(9.989, 9.996), random.uniform(53.559, 53.566)) for _ in range(random.randint(2, 4))]
+        return MagicMock(ingress_geometry=LineString(coords, srid=4326))
+
+    def reference_diff(self, sg) -> float:
+        """
+        Calculate the bearing difference of the ingress tail like the previous per-SG implementation.
+        """
+        sg_start = LineString(sg.ingress_geometry.coords[-2:], srid=sg.ingress_geometry.srid)
+        return calc_bearing_diffs(sg_start, project_onto_route(sg_start, self.route))[0]
+
+    def test_equals_reference(self):
+        sgs = [self.random_sg() for _ in range(50)]
+        diffs = calc_ingress_bearing_diffs(sgs, self.route)
+        self.assertEqual(len(diffs), len(sgs))
+        for sg, diff in zip(sgs, diffs):
+            self.assertAlmostEqual(diff, self.reference_diff(sg), places=9)
+
+    def test_directions(self):
+        sgs = [
+            # Along the route, going to the east
+            MagicMock(ingress_geometry=LineString([(9.9910, 53.5601), (9.9920, 53.5601)], srid=4326)),
+            # Against the route, going to the west
+            MagicMock(ingress_geometry=LineString([(9.9920, 53.5601), (9.9910, 53.5601)], srid=4326)),
+        ]
+        diffs = calc_ingress_bearing_diffs(sgs, self.route)
+        self.assertLess(diffs[0], 1)
+        self.assertAlmostEqual(diffs[1], 180, delta=1)
+
+    def test_no_sgs(self):
+        self.assertEqual(len(calc_ingress_bearing_diffs([], self.route)), 0)
+
+
+class MultiLaneMatcherTest(TestCase):
+    route = ROUTE
+
+    def setUp(self):
+        # On the route, going to the east
+        create_lsa("1", [(9.9910, 53.5600), (9.9920, 53.5600)])
+        create_lsa("2", [(9.9960, 53.5601), (9.9970, 53.5601)])
+        # On the route, going to the west
+        create_lsa("3", [(9.9940, 53.5600), (9.9930, 53.5600)])
+        # Far away from the route
+        create_lsa("4", [(9.9000, 53.5000), (9.9010, 53.5000)])
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            matches = MultiLaneMatcher(self.route).match(distance_to_route=10, bearing_diff=45)
+            sg_distances = get_sg_distances_on_route(matches, self.route)
+
+        self.assertIsInstance(matches, list)
+        self.assertEqual(sorted(lsa.pk for lsa in matches), ["1", "2"])
+        self.assertEqual(sorted(sg["id"] for sg in sg_distances), ["1", "2"])
+        self.assertTrue(all(sg["laneType"] == "Radfahrer" for sg in sg_distances))
@@ -1,10 +1,14 @@
+import random
 from unittest.mock import MagicMock
 
 from django.contrib.gis.geos import LineString
 from django.test import TestCase
+from routing.matching.context import match_context
 from routing.matching.overlap import (OverlapMatcher, RouteSection,
                                       calc_distances, calc_sections,
-                                      calc_sides)
+                                      calc_sides, prefetch_overlap_candidates)
+from routing.models import LSA
+from routing.tests.utils import ROUTE, create_lsa
 
 
 class OverlapCalculationTest(TestCase):
@@ -57,3 +61,54 @@ class OverlapCalculationTest(TestCase):
         overlap = next(iter(overlaps))
         self.assertTrue("LSA1" in [overlap.lsa_1_id, overlap.lsa_2_id])
         self.assertTrue("LSA2" in [overlap.lsa_1_id, overlap.lsa_2_id])
+
+    def test_calc_overlaps_equals_pairwise(self):
+        """
+        Validate that the sweep finds the same overlaps as comparing all pairs,
+        for random sections and thresholds.
+        """
+        rng = random.Random(0)
+        for _ in range(500):
+            sections = {}
+            for i in range(rng.randint(0, 30)):
+                if rng.random() < 0.5:
+                    # Coarse fractions, to get touching, identical and empty sections
+                    fractions = [rng.randint(0, 10) / 10 for _ in range(2)]
+                else:
+                    fractions = [rng.random() for _ in range(2)]
+                sections[f"LSA{i}"] = RouteSection(min(fractions), max(fractions))
+            threshold = rng.choice([0, 0.1, 0.5, 1, -0.5, rng.random()])
+            matcher = OverlapMatcher(overlap_pct_threshold=threshold)
+            self.assertEqual(matcher.calc_overlaps(sections), matcher.calc_overlaps_pairwise(sections))
+
+
+class OverlapMatcherTest(TestCase):
+    route = ROUTE
+
+    def setUp(self):
+        # Three LSAs on the same section of the route, only one exclusively for bikes
+        create_lsa("1", [(9.9910, 53.5601), (9.9930, 53.5601)], "KFZ/Radfahrer", metric=False)
+        create_lsa("2", [(9.9910, 53.5600), (9.9930, 53.5600)], "Radfahrer", metric=False)
+        create_lsa("3", [(9.9911, 53.5599), (9.9929, 53.5599)], "KFZ/Radfahrer", metric=False)
+        # An LSA on another section of the route
+        create_lsa("4", [(9.9960, 53.5600), (9.9980, 53.5600)], "KFZ/Radfahrer", metric=False)
+
+    def test_prefetch_overlap_candidates(self):
+        lsas = LSA.objects.order_by("id")
+        with self.assertNumQueries(1):
+            candidates = prefetch_overlap_candidates(lsas, self.route)
+        self.assertEqual(candidates.ids, ["1", "2", "3", "4"])
+        self.assertEqual(candidates.lane_type("2"), "Radfahrer")
+        self.assertEqual(candidates.sections, calc_sections(lsas, self.route))
+        for lsa_id, distance in calc_distances(lsas, self.route).items():
+            self.assertAlmostEqual(candidates.distance(lsa_id), distance)
+        for lsa_id, side in calc_sides(lsas, self.route).items():
+            self.assertEqual(candidates.side(lsa_id), side)
+
+    def test_matches_with_a_single_query(self):
+        matcher = OverlapMatcher()
+        with match_context(self.route):
+            # The returned queryset is not evaluated by the matcher
+            with self.assertNumQueries(1):
+                lsas, _ = matcher.matches(LSA.objects.all(), self.route)
+        self.assertEqual(sorted(lsa.id for lsa in lsas), ["2", "4"])
@@ -1,6 +1,9 @@
-from django.contrib.gis.geos import LineString
+import numpy as np
+from django.contrib.gis.geos import LineString, Point
 from django.test import TestCase
-from routing.matching.projection import points_in_route_dir, project_onto_route
+from routing.matching.projection import (points_in_route_dir,
+                                         project_onto_route, snap_linestrings,
+                                         snap_points)
 
 
 class ProjectionCalculationTest(TestCase):
@@ -25,3 +28,29 @@ class ProjectionCalculationTest(TestCase):
         for (r_x, r_y), (x, y) in zip(route_points, points):
             self.assertAlmostEqual(r_x, x)
             self.assertAlmostEqual(r_y, y)        
+
+    def test_snap_points(self):
+        route = LineString([(0, 0), (0, 10), (10, 10)], srid=3857)
+        coords = np.array([(2, 5), (4, 12), (-5, -5)])
+        snaps = snap_points(coords, route, 3857)
+
+        for (x, y), fraction, distance, snapped_coords in zip(coords, snaps.fractions, snaps.distances, snaps.coords):
+            point = Point(x, y, srid=3857)
+            self.assertEqual(fraction, route.project_normalized(point))
+            self.assertEqual(distance, route.project(point))
+            self.assertEqual(tuple(snapped_coords), route.interpolate_normalized(fraction).coords)
+        np.testing.assert_array_equal(snaps.projected_lengths, [0, 0, 0])
+
+    def test_snap_linestrings(self):
+        route = LineString([(0, 0), (0, 10), (10, 10)], srid=3857)
+        linestrings = [
+            LineString([(2, 0), (2, 8)], srid=3857),
+            # Against the direction of the route, around the corner
+            LineString([(8, 12), (-1, 12), (-1, 4)], srid=3857),
+        ]
+        snaps = snap_linestrings(linestrings, route, 3857)
+
+        for linestring, fraction, projected_length in zip(linestrings, snaps.fractions, snaps.projected_lengths):
+            self.assertEqual(fraction, route.project_normalized(Point(*linestring.coords[0], srid=3857)))
+            self.assertAlmostEqual(projected_length, project_onto_route(linestring, route, system=3857).length)
+        self.assertAlmostEqual(snaps.projected_lengths[0], 8)
@@ -0,0 +1,47 @@
+import tempfile
+
+from django.test import TestCase, override_settings
+from routing import stamps
+from routing.matching.proximity import ProximityMatcher
+from routing.matching.registry import MatcherRegistry
+
+
+class MatcherRegistryTest(TestCase):
+    def setUp(self):
+        self.stamp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(STAMP_DIR=self.stamp_dir.name)
+        self.settings_override.enable()
+        self.n_builds = 0
+
+        def build_pipeline(route_data):
+            self.n_builds += 1
+            return [ ProximityMatcher(search_radius_m=20) ]
+
+        self.registry = MatcherRegistry(pipelines={ "test": build_pipeline })
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.stamp_dir.cleanup()
+
+    def test_get_builds_once(self):
+        matchers = self.registry.get("test", "osm")
+        self.assertIs(self.registry.get("test", "osm"), matchers)
+        self.assertEqual(self.n_builds, 1)
+
+        self.registry.get("test", "drn")
+        self.assertEqual(self.n_builds, 2)
+
+        description = self.registry.describe()
+        self.assertEqual(len(description), 2)
+        self.assertEqual(description[0]["matchers"], ["ProximityMatcher"])
+        self.assertGreater(description[0]["sizeBytes"], 0)
+
+    def test_get_unsupported(self):
+        self.assertRaises(KeyError, self.registry.get, "unknown", "osm")
+        self.assertRaises(KeyError, self.registry.get, "test", "unknown")
+
+    def test_reload_on_stamp(self):
+        matchers = self.registry.get("test", "osm")
+        stamps.touch(stamps.MATCHERS_STAMP)
+        self.assertIsNot(self.registry.get("test", "osm"), matchers)
+        self.assertEqual(self.n_builds, 2)
@@ -0,0 +1,103 @@
+from unittest.mock import MagicMock
+
+from django.contrib.gis.geos import LineString
+from django.test import TestCase
+from routing.matching import RouteMatcher
+from routing.models import LSA
+from routing.rematching import (MatchRecord, decode_record, encode_record,
+                                find_changed_section, rematch)
+
+
+class AllMatcher(RouteMatcher):
+    """
+    A matcher that matches all LSAs and records the routes.
+    """
+
+    def __init__(self):
+        super().__init__(system=3857)
+        self.routes = []
+
+    def matches(self, lsas, route):
+        lsas, route = super().matches(lsas, route)
+        self.routes.append(route)
+        return lsas, route
+
+
+class RematchingTest(TestCase):
+    # A straight route with a vertex every 100 meters, in the metrical system
+    previous_route = LineString([(x, 0) for x in range(0, 1100, 100)], srid=3857)
+    # The same route until 500 meters, then turning left
+    rerouted = LineString([(x, 0) for x in range(0, 600, 100)] + [(500 + d, d) for d in range(100, 600, 100)], srid=3857)
+
+    def make_lsa(self, pk, x, y=5):
+        geometry = LineString([(x, y), (x + 10, y)], srid=3857)
+        return LSA(id=pk, geometry=geometry, ingress_geometry=geometry, egress_geometry=geometry)
+
+    def test_find_changed_section(self):
+        self.assertEqual(find_changed_section(self.previous_route, self.previous_route, 1), (1000, 1000))
+
+        # The shared prefix ends at 500 meters
+        start, end = find_changed_section(self.previous_route, self.rerouted, 1)
+        self.assertAlmostEqual(start, 500)
+        self.assertAlmostEqual(end, self.rerouted.length)
+
+        # A reroute from another position, which joins the route at 500 meters
+        joining = LineString([(500 + d, -d) for d in range(500, 0, -100)] + [(x, 0) for x in range(500, 1100, 100)], srid=3857)
+        start, end = find_changed_section(self.previous_route, joining, 1)
+        self.assertAlmostEqual(start, 0)
+        self.assertAlmostEqual(end, 500 * 2 ** 0.5)
+
+        other_route = LineString([(0, 50), (1000, 50)], srid=3857)
+        self.assertIsNone(find_changed_section(self.previous_route, other_route, 1))
+
+    def test_rematch(self):
+        lsas = [self.make_lsa("a", 50), self.make_lsa("b", 450), self.make_lsa("c", 950)]
+        snapshot = MagicMock(lsas_by_pk={lsa.pk: lsa for lsa in lsas}, bike_lsas=lsas)
+        matcher = AllMatcher()
+        previous = MatchRecord(self.previous_route, ["a", "b", "c"])
+
+        matched_lsas, reuse = rematch(self.rerouted, previous, [matcher], snapshot, margin_m=100, tolerance_m=1)
+
+        # Only the changed part and the margin before it are matched again
+        self.assertEqual(len(matcher.routes), 1)
+        self.assertAlmostEqual(matcher.routes[0].coords[0][0], 400)
+        self.assertEqual([lsa.pk for lsa in matched_lsas], ["a", "b", "c"])
+        self.assertEqual((reuse.n_reused, reuse.n_rematched), (1, 2))
+        self.assertAlmostEqual(reuse.reused_length_m, 400)
+        self.assertAlmostEqual(reuse.route_length_m, self.rerouted.length)
+
+    def test_rematch_parallel_detour(self):
+        # A route that goes to the east and returns along a parallel street, 100 meters to the north
+        previous_route = LineString(
+            [(x, 0) for x in range(0, 1100, 100)] + [(x, 100) for x in range(1000, -100, -100)], srid=3857)
+        # The same route until 1000 meters, then continuing to the east instead of returning
+        rerouted = LineString([(x, 0) for x in range(0, 2100, 100)], srid=3857)
+        # "a" is along the shared prefix, "b" along the abandoned parallel street,
+        # close to the shared prefix of the reroute
+        lsas = [self.make_lsa("a", 50), self.make_lsa("b", 500, y=95)]
+        snapshot = MagicMock(lsas_by_pk={lsa.pk: lsa for lsa in lsas}, bike_lsas=lsas)
+        previous = MatchRecord(previous_route, ["a", "b"])
+
+        matched_lsas, reuse = rematch(rerouted, previous, [AllMatcher()], snapshot, margin_m=100, tolerance_m=1)
+
+        self.assertEqual([lsa.pk for lsa in matched_lsas], ["a"])
+        self.assertEqual((reuse.n_reused, reuse.n_rematched), (1, 0))
+
+    def test_rematch_same_route(self):
+        lsas = [self.make_lsa("a", 50), self.make_lsa("b", 995)]
+        snapshot = MagicMock(lsas_by_pk={lsa.pk: lsa for lsa in lsas}, bike_lsas=lsas)
+        matcher = AllMatcher()
+        previous = MatchRecord(self.previous_route, ["a", "b"])
+
+        matched_lsas, reuse = rematch(self.previous_route, previous, [matcher], snapshot, margin_m=100, tolerance_m=1)
+
+        self.assertEqual(matcher.routes, [])
+        self.assertEqual([lsa.pk for lsa in matched_lsas], ["a", "b"])
+        self.assertAlmostEqual(reuse.reused_length_m, 1000)
+
+    def test_record(self):
+        record = MatchRecord(self.previous_route, ["a", "b"])
+        decoded = decode_record(encode_record(record))
+        self.assertEqual(decoded.lsa_ids, ["a", "b"])
+        self.assertEqual(decoded.route, self.previous_route)
+        self.assertEqual(decoded.route.srid, 3857)
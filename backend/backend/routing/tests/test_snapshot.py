@@ -0,0 +1,60 @@
+from unittest.mock import patch
+
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.test import TestCase
+from routing.matching import get_matches
+from routing.matching.proximity import ProximityMatcher
+from routing.models import LSA, LSACrossing
+from routing.snapshot import LSASnapshot
+from routing.tests.utils import ROUTE, create_lsa
+
+
+class LSASnapshotTest(TestCase):
+    route = ROUTE
+
+    def setUp(self):
+        # On the route
+        create_lsa("1", [(9.9910, 53.5600), (9.9920, 53.5600)], metric=False)
+        # Roughly 11m north of the route
+        create_lsa("2", [(9.9930, 53.5601), (9.9940, 53.5601)], metric=False)
+        # Roughly 33m south of the route
+        create_lsa("3", [(9.9960, 53.5597), (9.9970, 53.5597)], metric=False)
+        # On the route, but not for cyclists
+        create_lsa("4", [(9.9980, 53.5600), (9.9990, 53.5600)], lane_type="KFZ", metric=False)
+        # Far away from the route
+        create_lsa("5", [(9.9000, 53.5000), (9.9010, 53.5000)], metric=False)
+
+        LSACrossing.objects.create(name="A", point=Point(9.9950, 53.5602, srid=4326))
+        LSACrossing.objects.create(name="B", point=Point(9.9950, 53.5610, srid=4326))
+
+    def test_bike_lsas(self):
+        snapshot = LSASnapshot.build()
+        self.assertEqual([lsa.id for lsa in snapshot.bike_lsas], ["1", "2", "3", "5"])
+
+    def test_lsas_within_equals_database(self):
+        snapshot = LSASnapshot.build()
+        for distance_m in [1, 10, 20, 50, 100]:
+            expected = set(
+                LSA.objects
+                    .filter(geometry__dwithin=(self.route, D(m=distance_m)))
+                    .values_list("pk", flat=True)
+            )
+            found = set(lsa.pk for lsa in snapshot.lsas_within(self.route, distance_m))
+            self.assertEqual(found, expected, f"Mismatch for {distance_m}m")
+
+    def test_crossings_within(self):
+        snapshot = LSASnapshot.build()
+        self.assertEqual([c.name for c in snapshot.crossings_within(self.route, 50)], ["A"])
+        self.assertEqual([c.name for c in snapshot.crossings_within(self.route, 200)], ["A", "B"])
+
+    def test_proximity_matcher(self):
+        snapshot = LSASnapshot.build()
+        matcher = ProximityMatcher(search_radius_m=20)
+        from_database = get_matches(self.route, [matcher])
+        with patch("routing.matching.proximity.get_snapshot", return_value=snapshot), self.assertNumQueries(0):
+            from_snapshot = get_matches(self.route, [matcher], snapshot.bike_lsas)
+        self.assertEqual(
+            sorted(lsa.pk for lsa in from_snapshot),
+            sorted(lsa.pk for lsa in from_database),
+        )
@@ -0,0 +1,107 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+import numpy as np
+from django.contrib.gis.geos import LineString
+from django.test import TestCase
+from routing.matching.ml.configs_production.datasets import \
+    config_data_and_features
+from routing.matching.ml.features import get_feature_matrix, get_features
+from routing.matching.ml.features.feature_route_streets import RouteStreets
+from routing.matching.ml.street_names import (GraphHopperStreetNameResolver,
+                                              StreetNameCache, geometry_key,
+                                              street_changed)
+from routing.models import LSA
+from routing.tests.fake_graphhopper import FakeGraphHopper
+
+
+def street_name(coord):
+    # Two streets, meeting at a longitude of 9.995
+    return "Weststraße" if coord[0] < 9.995 else "Oststraße"
+
+
+class StreetNamesTest(TestCase):
+    # On the "Weststraße"
+    west = LineString([(9.9910, 53.5600), (9.9920, 53.5600)], srid=4326)
+    # From the "Weststraße" onto the "Oststraße"
+    west_to_east = LineString([(9.9940, 53.5600), (9.9960, 53.5600)], srid=4326)
+
+    def setUp(self):
+        self.graphhopper = FakeGraphHopper(street_name)
+        self.graphhopper.__enter__()
+        self.addCleanup(self.graphhopper.__exit__)
+
+    def test_street_changed(self):
+        self.assertFalse(street_changed([]))
+        self.assertFalse(street_changed(["A", "A"]))
+        self.assertTrue(street_changed(["A", "B", "A"]))
+
+    def test_resolve(self):
+        resolver = GraphHopperStreetNameResolver(url=self.graphhopper.url)
+        self.assertEqual(resolver.resolve(self.west), ["Weststraße"])
+        self.assertEqual(resolver.resolve(self.west_to_east), ["Weststraße", "Oststraße"])
+        # Metrical linestrings are transformed for the map matching
+        self.assertEqual(resolver.resolve(self.west_to_east.transform(3857, clone=True)), ["Weststraße", "Oststraße"])
+        self.assertTrue(all(path.startswith("/match?") for path, _ in self.graphhopper.requests))
+
+    def test_resolve_many_concurrently(self):
+        resolver = GraphHopperStreetNameResolver(url=self.graphhopper.url, max_workers=4)
+        linestrings = [
+            LineString([(9.9900 + i * 0.0005, 53.56), (9.9905 + i * 0.0005, 53.56)], srid=4326) for i in range(20)
+        ]
+        street_names = resolver.resolve_many(linestrings)
+        self.assertEqual(street_names, [resolver.resolve(linestring) for linestring in linestrings])
+        self.assertEqual(street_names[0], ["Weststraße"])
+        self.assertEqual(street_names[-1], ["Oststraße"])
+
+    def test_cache(self):
+        resolver = GraphHopperStreetNameResolver(url=self.graphhopper.url, cache=StreetNameCache())
+        # Less than a centimeter away from the other linestring
+        west_to_east_shifted = LineString([(9.99400001, 53.5600), (9.9960, 53.56000001)], srid=4326)
+        self.assertEqual(geometry_key(west_to_east_shifted), geometry_key(self.west_to_east))
+
+        street_names = resolver.resolve_many([self.west, self.west_to_east, west_to_east_shifted])
+        self.assertEqual(street_names, [["Weststraße"], ["Weststraße", "Oststraße"], ["Weststraße", "Oststraße"]])
+        self.assertEqual(len(self.graphhopper.requests), 2)
+
+        self.assertEqual(resolver.resolve_many([self.west, self.west_to_east]), street_names[:2])
+        self.assertEqual(len(self.graphhopper.requests), 2)
+
+    def test_cache_is_persistent(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "street_names.sqlite3")
+            GraphHopperStreetNameResolver(url=self.graphhopper.url, cache=StreetNameCache(path)).resolve(self.west)
+            resolver = GraphHopperStreetNameResolver(url=self.graphhopper.url, cache=StreetNameCache(path))
+            self.assertEqual(resolver.resolve(self.west), ["Weststraße"])
+            self.assertEqual(len(self.graphhopper.requests), 1)
+            resolver.cache.connection.close()
+
+    def test_errors_are_not_cached(self):
+        resolver = GraphHopperStreetNameResolver(url=self.graphhopper.url, cache=StreetNameCache())
+        self.graphhopper.status_code = 500
+        with patch("builtins.print"):
+            self.assertEqual(resolver.resolve(self.west), [])
+        self.graphhopper.status_code = 200
+        self.assertEqual(resolver.resolve(self.west), ["Weststraße"])
+        self.assertEqual(len(self.graphhopper.requests), 2)
+
+    def test_route_streets_feature(self):
+        route = LineString([(9.9900, 53.5600), (10.0000, 53.5600)], srid=4326)
+        lsas = [
+            LSA(id=str(i), ingress_geometry=geometry, geometry=geometry, egress_geometry=geometry)
+            for i, geometry in enumerate([self.west, self.west_to_east, self.west_to_east])
+        ]
+        config = {**config_data_and_features[8603], "feature_extractor_combination": [RouteStreets]}
+        resolver = GraphHopperStreetNameResolver(url=self.graphhopper.url, cache=StreetNameCache())
+
+        with patch("routing.matching.ml.features.feature_route_streets.get_street_name_resolver", return_value=resolver):
+            unbatched = [get_features(lsa, route, config)[0] for lsa in lsas]
+            n_unbatched_requests = len(self.graphhopper.requests)
+            resolver.cache = StreetNameCache()
+            batched = get_feature_matrix(lsas, route, config)
+
+        np.testing.assert_array_equal(batched, np.array(unbatched))
+        np.testing.assert_array_equal(batched, [[0, 1], [1, 0], [1, 0]])
+        # The batch only map matches the distinct projected linestrings
+        self.assertEqual(len(self.graphhopper.requests) - n_unbatched_requests, 2)
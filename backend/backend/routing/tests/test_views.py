@@ -1,7 +1,18 @@
-from django.test import TestCase
+import json
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from routing.cache import get_selection_cache
 from routing.matching import LSA
 
 class ViewsTest(TestCase):
+    def setUp(self):
+        # Each test starts with an empty selection cache, since the cached
+        # responses outlive the database rollback between the tests
+        selection_cache_patch = patch("routing.cache._selection_cache", None)
+        selection_cache_patch.start()
+        self.addCleanup(selection_cache_patch.stop)
+
     def test_lsa_selection_view(self):
         payload = {
             "route": [
@@ -20,3 +31,80 @@ class ViewsTest(TestCase):
         response_json = response.json()
         self.assertEqual(len(response_json["route"]), 3)
         self.assertEqual(len(response_json["signalGroups"]), 0)
+
+    def test_lsa_selection_view_cached(self):
+        payload = {
+            "route": [
+                {"lon": 0, "lat": 0, "alt": 0},
+                {"lon": 1, "lat": 1, "alt": 1},
+            ]
+        }
+        responses = [
+            self.client.post('/routing/select?matcher=ml', content_type='application/json', data=payload)
+            for _ in range(2)
+        ]
+        self.assertEqual(responses[0].content, responses[1].content)
+        counters = get_selection_cache().describe()
+        self.assertEqual((counters["misses"], counters["localHits"]), (1, 1))
+        self.assertIn("misses", self.client.get('/routing/cache').json()["cache"])
+
+    def test_batch_lsa_selection_view(self):
+        route = [
+            {"lon": 0, "lat": 0, "alt": 0},
+            {"lon": 1, "lat": 1, "alt": 1},
+            {"lon": 2, "lat": 2, "alt": 2},
+        ]
+        payload = {
+            "routes": [
+                {"route": route, "matcher": "ml"},
+                {"route": []},
+                {"route": route[:2], "matcher": "ml", "routing": "osm"},
+                {"route": route, "matcher": "unknown"},
+            ]
+        }
+        response = self.client.post(
+            '/routing/select_batch', 
+            follow=True,
+            content_type='application/json',
+            data=payload,
+        )
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 4)
+        # The results are in the order of the routes
+        self.assertEqual(len(results[0]["route"]), 3)
+        self.assertIn("error", results[1])
+        self.assertEqual(len(results[2]["route"]), 2)
+        self.assertIn("error", results[3])
+        # Both valid routes were matched together
+        self.assertEqual(results[0]["timing"]["batchSize"], 2)
+        self.assertEqual(len(results[0]["signalGroups"]), 0)
+
+    def test_lsa_selection_view_format_version(self):
+        payload = {
+            "route": [
+                {"lon": 0, "lat": 0, "alt": 0},
+                {"lon": 1, "lat": 1, "alt": 1},
+            ]
+        }
+        response = self.client.post('/routing/select?matcher=ml&formatVersion=2', content_type='application/json', data=payload)
+        self.assertEqual(response.json()["route"]["lon"], [0, 1])
+        # The formats are cached separately
+        response = self.client.post('/routing/select?matcher=ml', content_type='application/json', data=payload)
+        self.assertEqual(len(response.json()["route"]), 2)
+
+        response = self.client.post('/routing/select?formatVersion=3', content_type='application/json', data=payload)
+        self.assertIn("error", response.json())
+
+    @override_settings(RESPONSE_STREAMING_MIN_ITEMS=2)
+    def test_lsa_selection_view_streamed(self):
+        payload = {
+            "route": [
+                {"lon": 3, "lat": 3, "alt": 0},
+                {"lon": 4, "lat": 4, "alt": 1},
+                {"lon": 5, "lat": 5, "alt": 2},
+            ]
+        }
+        response = self.client.post('/routing/select?matcher=ml', content_type='application/json', data=payload)
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(json.loads(b"".join(response.streaming_content))["route"]), 3)
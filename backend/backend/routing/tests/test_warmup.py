@@ -0,0 +1,48 @@
+from unittest.mock import MagicMock, patch
+
+from django.test import TestCase, override_settings
+from routing.snapshot import LSASnapshot
+from routing.warmup import Warmup, make_synthetic_route
+
+
+class WarmupTest(TestCase):
+    def test_run(self):
+        warmup = Warmup()
+        notify = MagicMock()
+        warmup.run(pipelines=[("ml", "osm")], notify=notify)
+
+        self.assertEqual(warmup.state, "done", warmup.error)
+        self.assertEqual(
+            [step.name for step in warmup.steps],
+            ["imports", "matchers", "snapshot", "pipeline:ml:osm"],
+        )
+        notify.assert_called_once()
+        self.assertFalse(warmup.describe()["preloadedInParent"])
+
+    def test_failed_pipeline(self):
+        warmup = Warmup()
+        warmup.run(pipelines=[("unknown", "osm")])
+        self.assertEqual(warmup.state, "failed")
+        self.assertIn("KeyError", warmup.describe()["error"])
+
+    def test_synthetic_route(self):
+        route = make_synthetic_route(LSASnapshot([], []))
+        self.assertEqual(route.srid, 4326)
+        self.assertEqual(len(route.coords[0]), 3)
+
+    @override_settings(HEALTHCHECK_TOKEN="")
+    def test_healthcheck(self):
+        warmup = Warmup()
+        run = warmup.run
+        warmup.run = lambda: run(pipelines=[("ml", "osm")])
+        with patch("backend.views.warmup", warmup):
+            response = self.client.get("/healthcheck")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["warmup"]["state"], "done")
+
+        # An unhealthy worker reports its warm-up
+        warmup.state, warmup.run = "running", lambda: None
+        with patch("backend.views.warmup", warmup):
+            response = self.client.get("/healthcheck")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "warming up")
@@ -1,9 +1,10 @@
 from unittest.mock import MagicMock
 
+import numpy as np
 from django.conf import settings
 from django.contrib.gis.geos import LineString, Point
 from django.test import TestCase
-from routing.views import make_waypoints, snap_lsas
+from routing.views import locate_waypoints, make_waypoints, snap_lsas
 
 
 class WaypointTest(TestCase):
@@ -55,3 +56,18 @@ class WaypointTest(TestCase):
         # The distance of the end waypoint should be unset, since no more lsas are along the route
         self.assertIsNone(end_waypoint["distanceToNextSignal"])
 
+    def test_locate_waypoints(self):
+        coords = [(13.7270, 51.0300, 0), (13.7275, 51.0301, 0), (13.7280, 51.0306, 0)]
+        routes = [
+            LineString(coords, srid=settings.LONLAT),
+            # A U-turn, where the route coordinates are closest to the route before
+            LineString(coords + coords[::-1][1:], srid=settings.LONLAT),
+            # A closed route, where the last coordinate is closest to the route start
+            LineString(coords + coords[:1], srid=settings.LONLAT),
+        ]
+        snap_coords = np.array([(13.7272, 51.0301), (13.7279, 51.0304)])
+        for route in routes:
+            fractions = locate_waypoints(route, np.array(route.coords), snap_coords)
+            points = [Point(x, y, srid=settings.LONLAT) for x, y in snap_coords] + \
+                [Point(x, y, srid=settings.LONLAT) for x, y, _ in route.coords]
+            self.assertEqual(list(fractions), [route.project_normalized(point) for point in points])
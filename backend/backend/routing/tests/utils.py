@@ -0,0 +1,27 @@
+from django.contrib.gis.geos import LineString
+from django.utils import timezone
+from routing.models import LSA, LSAMetadata
+
+# A route along a street in Hamburg, going to the east
+ROUTE = LineString([(9.9900, 53.5600, 0), (9.9950, 53.5600, 0), (10.0000, 53.5600, 0)], srid=4326)
+
+
+def create_lsa(id, coords, lane_type="Radfahrer", crossing_id="", metric=True, srid=4326) -> LSA:
+    """
+    Create an LSA with the coordinates as its ingress, connection and egress geometry, and its metadata.
+
+    :param crossing_id: The traffic lights id of the LSA.
+    :param metric: Whether to store the metric geometries of the LSA.
+    :param srid: The projection system of the geometries. The load commands create them without one (None).
+    """
+    geometry = LineString(coords, srid=srid)
+    lsa = LSA(id=id, ingress_geometry=geometry, geometry=geometry, egress_geometry=geometry)
+    if metric:
+        lsa.update_metric_geometries()
+    lsa.save()
+    LSAMetadata.objects.create(
+        lsa=lsa, topic="", asset_id="", lane_type=lane_type, language="", owner_thing="",
+        info_last_update=timezone.now(), connection_id="", egress_lane_id="",
+        ingress_lane_id="", traffic_lights_id=crossing_id, signal_group_id=id,
+    )
+    return lsa
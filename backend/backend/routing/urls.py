@@ -1,10 +1,15 @@
 from django.urls import path
 
-from routing.views import LSASelectionView, MultiLaneSelectionView
+from routing.views import (BatchLSASelectionView, LSASelectionView,
+                           MatcherRegistryView, MultiLaneSelectionView,
+                           SelectionCacheView)
 
 app_name = "routing"
 
 urlpatterns = [
     path("select", LSASelectionView.as_view(), name="select"),
+    path("select_batch", BatchLSASelectionView.as_view(), name="select_batch"),
     path("select_multi_lane", MultiLaneSelectionView.as_view(), name="select_bulk"),
+    path("matchers", MatcherRegistryView.as_view(), name="matchers"),
+    path("cache", SelectionCacheView.as_view(), name="cache"),
 ]
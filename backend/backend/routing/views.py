@@ -5,24 +5,30 @@ from collections import namedtuple
 from typing import Iterable, List
 import os
 
+import numpy as np
 import pyproj
 from django.conf import settings
 from django.contrib.gis.geos import LineString, Point
-from django.contrib.gis.measure import D
 from django.core.exceptions import ValidationError
 from django.http import JsonResponse, HttpResponseServerError
 from django.http.response import HttpResponse
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import View
-from routing.matching import get_matches
+from routing import metrics
+from routing.cache import get_selection_cache
+from routing.encoding import ResponseEncoder, make_signal_group
+from routing.matching import get_matches, get_matches_batch
 from routing.matching.bearing import get_bearing
-from routing.matching.hypermodel import TopologicHypermodelMatcher
-from routing.matching.ml.matcher import MLMatcher
-from routing.matching.projection import project_onto_route
-from routing.matching.proximity import ProximityMatcher
+from routing.matching.context import lsa_geometry, match_context, transform
+from routing.matching.linear_referencing import LinearRoute
+from routing.matching.projection import snap_linestrings, snap_points
+from routing.matching.registry import matcher_registry
 from routing.matching_multi_lane.matcher import MultiLaneMatcher
 from routing.models import LSA, LSACrossing
+from routing.rematching import (MatchRecord, decode_record, encode_record,
+                                record_key, rematch)
+from routing.snapshot import get_snapshot
 
 
 class RouteJsonValidator:
@@ -34,6 +40,17 @@ class RouteJsonValidator:
             route_data = json.loads(self.route_json)
         except json.JSONDecodeError:
             raise ValidationError("Invalid JSON")
+        # Keep the parsed data for further (optional) fields
+        self.route_data = route_data
+        return self.validate_data(route_data, proj)
+
+    @staticmethod
+    def validate_data(route_data: dict, proj=settings.LONLAT) -> LineString:
+        """
+        Validate the already parsed route data, e.g. one route of a batch.
+        """
+        if not isinstance(route_data, dict):
+            raise ValidationError("No route data")
 
         route = route_data.get("route")
         if not route:
@@ -62,13 +79,13 @@ def snap_lsas(lsas: Iterable[LSA], route: LineString) -> List[LSASnap]:
     """
     Snap the LSAs to the route. Returns an unordered list of Snaps.
     """
-    lonlat_route = route.transform(settings.LONLAT, clone=True)
-    snapped_points = []
-    for lsa in lsas:
-        start_point = lsa.start_point.transform(settings.LONLAT, clone=True)
-        snapped_point = lonlat_route.interpolate_normalized(lonlat_route.project_normalized(start_point))
-        snapped_points.append(snapped_point)
-    return [LSASnap(lsa, point) for lsa, point in zip(lsas, snapped_points)]
+    lsas = list(lsas)
+    start_coords = [transform(lsa.start_point, settings.LONLAT).coords[:2] for lsa in lsas]
+    snaps = snap_points(start_coords, route, settings.LONLAT)
+    return [
+        LSASnap(lsa, Point(*coords, srid=settings.LONLAT))
+        for lsa, coords in zip(lsas, snaps.coords.tolist())
+    ]
 
 def get_sg_distances_on_route(sgs: Iterable[LSA], route: LineString) -> List[dict]:
     """
@@ -86,17 +103,8 @@ def get_sg_distances_on_route(sgs: Iterable[LSA], route: LineString) -> List[dic
         "laneType": string,
     }]
     """
-    meter_route = route.transform(settings.METRICAL, clone=True)
-    sg_distances_on_route = []
-    sg_projected_lengths_on_route = []
-    for sg in sgs:
-        start_point = sg.start_point.transform(settings.METRICAL, clone=True)
-        distance_on_route = meter_route.project_normalized(start_point)
-        sg_distances_on_route.append(distance_on_route)
-        
-        sg = sg.geometry.transform(settings.METRICAL, clone=True)
-        sg_projected = project_onto_route(sg, route)
-        sg_projected_lengths_on_route.append(sg_projected.length)
+    sgs = list(sgs)
+    snaps = snap_linestrings([lsa_geometry(sg, settings.METRICAL) for sg in sgs], route, settings.METRICAL)
     return [
         {
             "id": sg.lsametadata.signal_group_id, 
@@ -110,7 +118,7 @@ def get_sg_distances_on_route(sgs: Iterable[LSA], route: LineString) -> List[dic
             "distanceOnRoute": distance,
             "laneType": sg.lsametadata.lane_type,
         }
-        for sg, distance, sg_projected_length_on_route in zip(sgs, sg_distances_on_route, sg_projected_lengths_on_route)]
+        for sg, distance, sg_projected_length_on_route in zip(sgs, snaps.fractions.tolist(), snaps.projected_lengths.tolist())]
 
 
 def get_crossing_distances_on_route(crossings: Iterable[LSACrossing], route: LineString) -> List[dict]:
@@ -126,12 +134,14 @@ def get_crossing_distances_on_route(crossings: Iterable[LSACrossing], route: Lin
         "connected": boolean,
     }]
     """
-    lonlat_route = route.transform(settings.METRICAL, clone=True)
-    crossing_distances_on_route = []
+    crossings = list(crossings)
+    metric_coords = []
     for crossing in crossings:
-        start_point = crossing.point.transform(settings.METRICAL, clone=True)
-        distance_on_route = lonlat_route.project(start_point)
-        crossing_distances_on_route.append(distance_on_route)
+        start_point = crossing.metric_point
+        if start_point is None:
+            start_point = transform(crossing.point, settings.METRICAL)
+        metric_coords.append(start_point.coords[:2])
+    snaps = snap_points(metric_coords, route, settings.METRICAL)
     return [
         {
             "name": crossing.name,
@@ -142,7 +152,7 @@ def get_crossing_distances_on_route(crossings: Iterable[LSACrossing], route: Lin
             "distanceOnRoute": distance,
             "connected": crossing.connected,
         }
-        for crossing, distance in zip(crossings, crossing_distances_on_route)]
+        for crossing, distance in zip(crossings, snaps.distances.tolist())]
 
 
 LSACrossingSnap = namedtuple("LSACrossingSnap", [
@@ -155,12 +165,36 @@ def snap_crossings(crossings: Iterable[LSACrossing], route: LineString) -> List[
     """
     Snap the crossings to the route. Returns an unordered list of Snaps.
     """
-    lonlat_route = route.transform(settings.LONLAT, clone=True)
-    snapped_points = []
-    for crossing in crossings:
-        snapped_point = lonlat_route.interpolate_normalized(lonlat_route.project_normalized(crossing.point))
-        snapped_points.append(snapped_point)
-    return [LSACrossingSnap(crossing, point) for crossing, point in zip(crossings, snapped_points)]
+    crossings = list(crossings)
+    coords = [transform(crossing.point, settings.LONLAT).coords[:2] for crossing in crossings]
+    snaps = snap_points(coords, route, settings.LONLAT)
+    return [
+        LSACrossingSnap(crossing, Point(*coords, srid=settings.LONLAT))
+        for crossing, coords in zip(crossings, snaps.coords.tolist())
+    ]
+
+
+# Use the WGS84 projection to calculate the distance between waypoints
+GEOD = pyproj.Geod(ellps="WGS84")
+
+
+def locate_waypoints(route: LineString, route_coords: np.ndarray, snap_coords: np.ndarray) -> np.ndarray:
+    """
+    Return the fractions of the route that are closest to the snapped points and the route coordinates,
+    as `route.project_normalized` would return them.
+
+    Only the snapped points are projected. Each route coordinate is closest to the route where it is
+    located by its index, unless the route touches itself. Routes that touch or close themselves are
+    projected completely, since GEOS takes the first of multiple closest segments.
+    """
+    linear_route = LinearRoute(route_coords, route.srid)
+    snap_fractions = linear_route.project_normalized(snap_coords) if len(snap_coords) else np.zeros(0)
+
+    if linear_route.length > 0 and route.simple and not route.closed:
+        route_fractions = np.concatenate(([0.0], linear_route.cum_ends)) / linear_route.length
+    else:
+        route_fractions = linear_route.project_normalized(route_coords)
+    return np.concatenate((snap_fractions, route_fractions))
 
 
 def make_waypoints(
@@ -183,51 +217,61 @@ def make_waypoints(
         return []
 
     # Throw snapped LSAs, disconnected crossings and route points into a list
-    waypoints = [
+    snap_waypoints = [
         {"lon": s.point.x, "lat": s.point.y, "alt": s.point.z, "signalGroupId": s.lsa.lsametadata.signal_group_id} 
         for s in lsa_snaps
     ] + [
         # Mark disconnected crossings for post processing
         {"lon": s.point.x, "lat": s.point.y, "alt": s.point.z, "signalGroupId": "DISCONNECTED"}
         for s in crossing_snaps if not s.crossing.connected
-    ] + [
+    ]
+    route_coords = route.coords
+    waypoints = snap_waypoints + [
         {"lon": x, "lat": y, "alt": z, "signalGroupId": None} 
-        for x, y, z in route.coords
+        for x, y, z in route_coords
     ]
     
-    # Order all waypoints by the direction of the route
-    waypoints.sort(key=lambda w: route.project_normalized(Point(w["lon"], w["lat"], srid=settings.LONLAT)))
-    
-    # Use the WGS84 projection to calculate the distance between waypoints
-    geod = pyproj.Geod(ellps="WGS84")
+    # Order all waypoints by the direction of the route (stable, like sorting the list)
+    fractions = locate_waypoints(
+        route,
+        np.array(route_coords, dtype=np.float64),
+        np.array([(w["lon"], w["lat"]) for w in snap_waypoints], dtype=np.float64).reshape(-1, 2),
+    )
+    waypoints = [waypoints[i] for i in np.argsort(fractions, kind="stable")]
 
     # Accumulate distances along the route
-    distance = 0
-    prev = None
-    for waypoint in waypoints:
-        if prev:
-            _, _, segment_distance = geod.inv(prev["lon"], prev["lat"], waypoint["lon"], waypoint["lat"])
-            distance += segment_distance
+    lons = np.array([w["lon"] for w in waypoints], dtype=np.float64)
+    lats = np.array([w["lat"] for w in waypoints], dtype=np.float64)
+    if len(waypoints) > 1:
+        _, _, segment_distances = GEOD.inv(lons[:-1], lats[:-1], lons[1:], lats[1:])
+        distances = np.concatenate(([0.0], np.cumsum(segment_distances)))
+    else:
+        distances = np.zeros(len(waypoints))
+    for waypoint, distance in zip(waypoints, distances.tolist()):
         waypoint["distanceOnRoute"] = distance
-        prev = waypoint
+    if waypoints:
+        # The route starts at an integer distance
+        waypoints[0]["distanceOnRoute"] = 0
     
     # Accumulate distances to the next signal. For example:
     #     0,  10, 20, signal at 25, 30,   signal at 50, 60
     # --> 25, 15, 5,  0,            20,   0,            None 
-    signal_waypoints = [w for w in waypoints if w["signalGroupId"]]
-    n_signals = len(signal_waypoints)
-    if signal_waypoints:
-        signal_idx = 0
-        for waypoint in waypoints:
+    signal_indices = np.flatnonzero([bool(w["signalGroupId"]) for w in waypoints])
+    n_signals = len(signal_indices)
+    if n_signals:
+        # The index of the next signal (in the signal waypoints) for each waypoint
+        next_signals = np.searchsorted(signal_indices, np.arange(len(waypoints)))
+        next_signal_indices = signal_indices[np.minimum(next_signals, n_signals - 1)]
+        distances_to_next_signal = (distances[next_signal_indices] - distances).tolist()
+        for i, waypoint in enumerate(waypoints):
             if waypoint["signalGroupId"]:
-                # If we come across a signal waypoint, set the distance to 0 and switch to the next signal
+                # If we come across a signal waypoint, set the distance to 0
                 waypoint["distanceToNextSignal"] = 0
-                signal_idx += 1
-            elif n_signals > signal_idx:
-                # When we have an upcoming signal, calculate the distance to the next signal
-                waypoint["distanceToNextSignal"] = signal_waypoints[signal_idx]["distanceOnRoute"] - waypoint["distanceOnRoute"]
+            elif next_signals[i] < n_signals:
+                # When we have an upcoming signal, use the distance to the next signal
+                waypoint["distanceToNextSignal"] = distances_to_next_signal[i]
                 # Annotate the waypoint with the signal group ID
-                waypoint["signalGroupId"] = signal_waypoints[signal_idx]["signalGroupId"]
+                waypoint["signalGroupId"] = waypoints[next_signal_indices[i]]["signalGroupId"]
             else:
                 # Otherwise, set the distance to None
                 waypoint["distanceToNextSignal"] = None
@@ -243,12 +287,65 @@ def make_waypoints(
     return waypoints
 
 
+def make_selection(unordered_lsas: Iterable[LSA], route: LineString, snapshot, encoder: ResponseEncoder = None) -> dict:
+    """
+    Make the response of the selection views for the matched LSAs of the route:
+    {
+        "route": [waypoint, ...], (see `make_waypoints`)
+        "signalGroups": {signal group id: signal group, ...}, (see `make_signal_group`)
+        "crossings": [crossing, ...],
+    }
+
+    If an encoder is given, the route and signal groups are prepared in its format.
+    """
+    # Snap the LSA positions to the route as marked waypoints
+    with metrics.stage("snapping"):
+        lsa_snaps = snap_lsas(unordered_lsas, route)
+
+    # Get the disconnected crossings along the route
+    with metrics.stage("crossings"):
+        crossings = snapshot.crossings_within(route, 50)
+        crossing_snaps = snap_crossings(crossings, route)
+
+    # Insert the snapped waypoints into the route
+    with metrics.stage("waypoints"):
+        waypoints = make_waypoints(lsa_snaps, crossing_snaps, route)
+
+    # Create some signal group data
+    with metrics.stage("signal_groups"):
+        if encoder is not None:
+            signal_groups_json = encoder.signal_groups(unordered_lsas)
+        else:
+            signal_groups_json = {}
+            for lsa in unordered_lsas:
+                signal_groups_json[lsa.lsametadata.signal_group_id] = make_signal_group(lsa)
+    
+    # Create some crossings data
+    crossings_json = [
+        {
+            "name": s.crossing.name,
+            "position": {
+                "lon": s.point.x,
+                "lat": s.point.y,
+            },
+            "connected": s.crossing.connected,
+        } for s in crossing_snaps
+    ]
+
+    return {
+        "route": encoder.route(waypoints) if encoder is not None else waypoints,
+        "signalGroups": signal_groups_json,
+        "crossings": crossings_json,
+    }
+
+
 @method_decorator(csrf_exempt, name='dispatch')
 class LSASelectionView(View):
     """
     View to find signal groups along a given route.
     """
 
+    @metrics.request_metrics("select")
     def post(self, request, *args, **kwargs):
         """
         Handle the POST request.
@@ -258,18 +355,34 @@ class LSASelectionView(View):
             "route": [
                 { "lon": <longitude>, "lat": <latitude>, "alt": <altitude> },
                 ...
-            ]
+            ],
+            "previousRoute": [ ... ], (optional, the previously matched route, e.g. before a reroute)
         }
+
+        Instead of the previous route, its key (the "X-Route-Key" header of the
+        previous response) can be given as the `previous` parameter. The route is
+        then only matched where it differs from the previous route, and the response
+        reports how much of the route was reused.
+
+        With the parameter `formatVersion=2`, the waypoints of the route are returned
+        as arrays of their fields, without whitespace (see `routing.encoding`).
         """
 
         # Start time for the measurment of the time needed for the matching endpoint.
         startT = time.time()
         logging.debug(f"Received sg selection request with body: {request.body}")
 
+        validator = RouteJsonValidator(request.body)
         try:
-            route_linestring = RouteJsonValidator(request.body).validate(proj=settings.LONLAT)
+            with metrics.stage("validation"):
+                route_linestring = validator.validate(proj=settings.LONLAT)
         except ValidationError as e:
             return JsonResponse({"error": str(e)})
+
+        try:
+            encoder = ResponseEncoder.from_request(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)})
         
         params = request.GET
         matcher = str(params.get("matcher", "legacy"))
@@ -278,68 +391,69 @@ class LSASelectionView(View):
         if usedRouting != "osm" and usedRouting != "drn":
             return JsonResponse({"error": "Unsupported value provided for the parameter 'routing'. Choose between 'osm' or 'drn'."})
             
-        if matcher == "ml":
-            unordered_lsas = get_matches(route_linestring, [ ProximityMatcher(search_radius_m=20), MLMatcher(usedRouting) ]) 
-        elif matcher == "legacy":
-            unordered_lsas = get_matches(route_linestring, [ TopologicHypermodelMatcher.from_config_file(f'config/topologic.hypermodel.{usedRouting}.updated.json') ])
-        else:
+        # The matchers are built once per worker and shared between requests
+        try:
+            matchers = matcher_registry.get(matcher, usedRouting)
+        except KeyError:
             return JsonResponse({"error": "Unsupported value provided for the parameter 'matcher'. Choose between 'ml' or 'legacy'."})
 
-        # Snap the LSA positions to the route as marked waypoints
-        lsa_snaps = snap_lsas(unordered_lsas, route_linestring)
-
-        # Get the disconnected crossings along the route
-        crossings = LSACrossing.objects.filter(point__dwithin=(route_linestring, D(m=50)))
-        crossing_snaps = snap_crossings(crossings, route_linestring)
-
-        # Insert the snapped waypoints into the route
-        waypoints = make_waypoints(lsa_snaps, crossing_snaps, route_linestring)
-
-        # Create some signal group data
-        signal_groups_json = {}
-        for lsa in unordered_lsas:
-            signal_groups_json[lsa.lsametadata.signal_group_id] = {
-                "label": lsa.lsametadata.signal_group_id,
-                "position": {
-                    "lon": lsa.start_point.x,
-                    "lat": lsa.start_point.y,
-                },
-                "bearing": lsa.bearing,
-                "geometry": lsa.geometry.coords,
-                # Used to subscribe to the signal group
-                "id": lsa.lsametadata.signal_group_id,
-                "lsaId": lsa.id,
-                "connectionId": lsa.lsametadata.connection_id,
-                "laneType": lsa.lsametadata.lane_type,
-                # Used by the app to subscribe to live data streams
-                "datastreamDetectorCar": lsa.lsametadata.datastream_detector_car_id,
-                "datastreamDetectorCyclists": lsa.lsametadata.datastream_detector_cyclists_id,
-                "datastreamCycleSecond": lsa.lsametadata.datastream_cycle_second_id,
-                "datastreamPrimarySignal": lsa.lsametadata.datastream_primary_signal_id,
-                "datastreamSignalProgram": lsa.lsametadata.datastream_signal_program_id,
+        # Many riders request the same routes, so the responses are cached by their content
+        selection_cache = get_selection_cache()
+        cache_key = selection_cache.key(route_linestring, matcher, usedRouting, encoder.format_version)
+        cached_response = selection_cache.get(cache_key)
+        if cached_response is not None:
+            return HttpResponse(cached_response, content_type="application/json", headers={"X-Route-Key": cache_key})
+
+        # The matches of the previous route, if it is referenced
+        previous_record = None
+        previous_key = params.get("previous")
+        previous_route_data = validator.route_data.get("previousRoute")
+        if previous_key is None and previous_route_data:
+            try:
+                previous_route = RouteJsonValidator.validate_data({"route": previous_route_data}, proj=settings.LONLAT)
+            except ValidationError as e:
+                return JsonResponse({"error": f"Invalid previous route: {e}"})
+            previous_key = selection_cache.key(previous_route, matcher, usedRouting, encoder.format_version)
+        if previous_key is not None:
+            previous_data, _ = selection_cache.lookup(record_key(previous_key))
+            if previous_data is not None:
+                previous_record = decode_record(previous_data)
+
+        # Share the transformed route and LSA geometries between the matching and snapping
+        with match_context(route_linestring) as context:
+            # Match against the in-memory snapshot of the LSAs instead of the database
+            with metrics.stage("snapshot"):
+                snapshot = get_snapshot()
+            rematched = None
+            if previous_record is not None:
+                rematched = rematch(route_linestring, previous_record, matchers, snapshot)
+            if rematched is not None:
+                unordered_lsas, reuse = rematched
+            else:
+                unordered_lsas = get_matches(route_linestring, matchers, snapshot.bike_lsas)
+
+            selection = make_selection(unordered_lsas, route_linestring, snapshot, encoder)
+        logging.debug(f"Performed {context.n_transforms} geometry transforms, reused {context.n_reused}")
+
+        if rematched is not None:
+            selection["reuse"] = {
+                "routeLengthM": reuse.route_length_m,
+                "reusedLengthM": reuse.reused_length_m,
+                "reusedFraction": reuse.reused_length_m / reuse.route_length_m if reuse.route_length_m else 1.0,
+                "reusedSignalGroups": reuse.n_reused,
+                "rematchedSignalGroups": reuse.n_rematched,
             }
+
+        # Only complete matchings are cached as responses, but all can be referenced by later reroutes
+        selection_cache.set(record_key(cache_key), encode_record(MatchRecord(route_linestring, [lsa.pk for lsa in unordered_lsas])))
         
-        # Create some crossings data
-        crossings_json = [
-            {
-                "name": s.crossing.name,
-                "position": {
-                    "lon": s.point.x,
-                    "lat": s.point.y,
-                },
-                "connected": s.crossing.connected,
-            } for s in crossing_snaps
-        ]
-
-        # Use the waypoint encoder to serialize the waypoints
-        response_json = json.dumps({
-            "route": waypoints,
-            "signalGroups": signal_groups_json,
-            "crossings": crossings_json,
-        }, indent=2 if settings.DEBUG else None, ensure_ascii=False)
-        
-        print(f'Matching time: {time.time() - startT}ms')
-        return HttpResponse(response_json, content_type="application/json")
+        logging.debug(f"Matching time: {(time.time() - startT) * 1000:.0f}ms")
+        return encoder.response(
+            selection,
+            stream=len(route_linestring.coords) >= settings.RESPONSE_STREAMING_MIN_ITEMS,
+            on_complete=(lambda content: selection_cache.set(cache_key, content)) if rematched is None else None,
+            headers={"X-Route-Key": cache_key},
+        )
     
 @method_decorator(csrf_exempt, name='dispatch')
 class MultiLaneSelectionView(View):
@@ -347,6 +461,7 @@ class MultiLaneSelectionView(View):
     View to find signal groups along a given route (multiple lanes).
     """
     
+    @metrics.request_metrics("select_multi_lane")
     def post(self, request, *args, **kwargs):
         """
         Handle the POST request.
@@ -363,9 +478,15 @@ class MultiLaneSelectionView(View):
         logging.debug(f"Received multi lane sg selection request with body: {request.body}")
 
         try:
-            route_linestring = RouteJsonValidator(request.body).validate(proj=settings.LONLAT)
+            with metrics.stage("validation"):
+                route_linestring = RouteJsonValidator(request.body).validate(proj=settings.LONLAT)
         except ValidationError as e:
             return JsonResponse({"error": str(e)})
+
+        try:
+            encoder = ResponseEncoder.from_request(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)})
         
         params = request.GET
         bearing_diff = int(params.get("bearingDiff", 30))
@@ -378,24 +499,140 @@ class MultiLaneSelectionView(View):
         matched_unordered_sgs = MultiLaneMatcher(route_linestring).match(distance_to_route, bearing_diff)
                 
         # Snap the SG positions to the route and get their distances on the route
-        sg_distances_on_route = get_sg_distances_on_route(matched_unordered_sgs, route_linestring)
-        sg_distances_on_route.sort(key=lambda x: x["distanceOnRoute"])
+        with metrics.stage("snapping"):
+            sg_distances_on_route = get_sg_distances_on_route(matched_unordered_sgs, route_linestring)
+            sg_distances_on_route.sort(key=lambda x: x["distanceOnRoute"])
         
         # Snap the disconnected crossings to the route and get their distances on the route
-        crossings = LSACrossing.objects.filter(point__dwithin=(route_linestring, D(m=distance_to_route)))
-        crossings_distances_on_route = get_crossing_distances_on_route(crossings, route_linestring)
-        crossings_distances_on_route.sort(key=lambda x: x["distanceOnRoute"])
+        with metrics.stage("crossings"):
+            crossings = get_snapshot().crossings_within(route_linestring, distance_to_route)
+            crossings_distances_on_route = get_crossing_distances_on_route(crossings, route_linestring)
+            crossings_distances_on_route.sort(key=lambda x: x["distanceOnRoute"])
 
          # Serialize the data
-        response_json = json.dumps({
+        return encoder.response({
             "signalGroups": sg_distances_on_route,
             "crossings": crossings_distances_on_route,
-        }, indent=2 if settings.DEBUG else None, ensure_ascii=False)
-        
-        return HttpResponse(response_json, content_type="application/json")
-    
-    
-    
-        
-        
-        
+        }, stream=len(sg_distances_on_route) >= settings.RESPONSE_STREAMING_MIN_ITEMS)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class BatchLSASelectionView(View):
+    """
+    View to find signal groups along multiple routes in one request, e.g. route alternatives.
+
+    The routes with the same matcher and routing are matched together, so that they share
+    the geometry transforms and a single pass of the ML model.
+    """
+
+    # The maximum number of routes per request
+    max_routes = 10
+
+    @metrics.request_metrics("select_batch")
+    def post(self, request, *args, **kwargs):
+        """
+        Handle the POST request.
+
+        The body of the POST request should contain the routes as follows:
+        {
+            "routes": [
+                {
+                    "route": [
+                        { "lon": <longitude>, "lat": <latitude>, "alt": <altitude> },
+                        ...
+                    ],
+                    "matcher": "ml" | "legacy", (optional, defaults to "legacy")
+                    "routing": "osm" | "drn", (optional, defaults to "osm")
+                },
+                ...
+            ]
+        }
+
+        The results are returned in the order of the routes. Each result is either
+        the response of `/routing/select` with an additional "timing", or an "error".
+        """
+        logging.debug(f"Received batch sg selection request with body: {request.body}")
+
+        try:
+            routes_data = json.loads(request.body).get("routes")
+        except (json.JSONDecodeError, AttributeError):
+            return JsonResponse({"error": "Invalid JSON"})
+        try:
+            encoder = ResponseEncoder.from_request(request)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)})
+        if not isinstance(routes_data, list) or not routes_data:
+            return JsonResponse({"error": "No routes data"})
+        if len(routes_data) > self.max_routes:
+            return JsonResponse({"error": f"Too many routes. At most {self.max_routes} routes are supported."})
+
+        results = [None] * len(routes_data)
+
+        # Group the valid routes by their matcher pipeline
+        groups = {}
+        for i, route_data in enumerate(routes_data):
+            try:
+                with metrics.stage("validation"):
+                    route_linestring = RouteJsonValidator.validate_data(route_data, proj=settings.LONLAT)
+            except ValidationError as e:
+                results[i] = {"error": str(e)}
+                continue
+            matcher = str(route_data.get("matcher", "legacy"))
+            used_routing = str(route_data.get("routing", "osm"))
+            try:
+                matchers = matcher_registry.get(matcher, used_routing)
+            except KeyError:
+                results[i] = {"error": "Unsupported value provided for 'matcher' or 'routing'. Choose between 'ml' or 'legacy' and 'osm' or 'drn'."}
+                continue
+            groups.setdefault((matcher, used_routing), (matchers, []))[1].append((i, route_linestring))
+
+        with metrics.stage("snapshot"):
+            snapshot = get_snapshot()
+        n_waypoints = 0
+        for matchers, indexed_routes in groups.values():
+            routes = [route_linestring for _, route_linestring in indexed_routes]
+            # Share the transformed LSA geometries between all routes of the group
+            with match_context(routes[0]):
+                start = time.perf_counter()
+                matched_lsas = get_matches_batch(routes, matchers, snapshot.bike_lsas)
+                matching_ms = (time.perf_counter() - start) * 1000
+
+                for (i, route_linestring), unordered_lsas in zip(indexed_routes, matched_lsas):
+                    start = time.perf_counter()
+                    selection = make_selection(unordered_lsas, route_linestring, snapshot, encoder)
+                    selection["timing"] = {
+                        # The matching is shared by all routes with the same matcher and routing
+                        "matchingMs": matching_ms,
+                        "batchSize": len(routes),
+                        "selectionMs": (time.perf_counter() - start) * 1000,
+                    }
+                    results[i] = encoder.embed(selection)
+                    n_waypoints += len(route_linestring.coords)
+
+        return encoder.response({
+            "results": results,
+        }, stream=n_waypoints >= settings.RESPONSE_STREAMING_MIN_ITEMS)
+
+
+class MatcherRegistryView(View):
+    """
+    View to introspect the matchers that were built by this worker.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handle the GET request.
+        """
+        return JsonResponse({"matchers": matcher_registry.describe()})
+
+
+class SelectionCacheView(View):
+    """
+    View to introspect the selection cache of this worker, with its hit and miss counters.
+    """
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handle the GET request.
+        """
+        return JsonResponse({"cache": get_selection_cache().describe()})
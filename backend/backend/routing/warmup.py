@@ -0,0 +1,150 @@
+import logging
+import os
+import threading
+import time
+import traceback
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Callable, List, Optional, Tuple
+
+from django.conf import settings
+from django.contrib.gis.geos import LineString
+from django.db import connections
+
+# A step of the warm-up and its duration in seconds
+WarmupStep = namedtuple("WarmupStep", ["name", "duration_s"])
+
+# The route that is matched if there are no LSAs to build a route from (in Hamburg)
+FALLBACK_ROUTE = [(9.9900, 53.5600, 0), (9.9950, 53.5600, 0), (9.9950, 53.5650, 0)]
+
+
+def make_synthetic_route(snapshot) -> LineString:
+    """
+    Make a route along the connection of the first LSA for cyclists, so that the
+    warm-up passes through all stages of the matching, including the ML features.
+    """
+    if not snapshot.bike_lsas:
+        return LineString(FALLBACK_ROUTE, srid=settings.LONLAT)
+    geometry = snapshot.bike_lsas[0].geometry.transform(settings.LONLAT, clone=True)
+    return LineString([(x, y, 0) for x, y, *_ in geometry.coords], srid=settings.LONLAT)
+
+
+class Warmup:
+    """
+    The warm-up of this process, so that the first requests after a deploy aren't slow.
+
+    The warm-up has two phases:
+    - `preload`: Import the views and build the matchers and the LSA snapshot. Under gunicorn,
+      this runs in the master process, so that the workers share the results copy-on-write.
+    - `run`: Match a synthetic route with each pipeline once, in each worker before it
+      handles requests (see `gunicorn.conf.py`). Runs the preload if it wasn't run before.
+
+    The state is one of "pending", "preloaded", "running", "done" or "failed".
+    """
+
+    def __init__(self):
+        self.state = "pending"
+        self.steps: List[WarmupStep] = []
+        self.error: Optional[str] = None
+        self.preload_pid: Optional[int] = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def step(self, name: str):
+        start = time.perf_counter()
+        yield
+        duration_s = time.perf_counter() - start
+        self.steps.append(WarmupStep(name, duration_s))
+        logging.info(f"Warm-up step {name} took {duration_s:.3f}s")
+
+    def fail(self, e: Exception):
+        self.state = "failed"
+        self.error = f"{type(e).__name__}: {e}"
+        logging.error(f"Warm-up failed: {traceback.format_exc()}")
+
+    def preload(self):
+        """
+        Import the views and build the matchers and the LSA snapshot of this process.
+
+        The database connections are closed afterwards, so that they are
+        not shared with forked worker processes.
+        """
+        from routing.matching.registry import matcher_registry
+        from routing.snapshot import get_snapshot
+
+        try:
+            with self.step("imports"):
+                import routing.urls  # noqa: F401
+            with self.step("matchers"):
+                matcher_registry.preload()
+            with self.step("snapshot"):
+                get_snapshot()
+        except Exception as e:
+            self.fail(e)
+            return
+        finally:
+            connections.close_all()
+        self.state = "preloaded"
+        self.preload_pid = os.getpid()
+
+    def run(self, pipelines: List[Tuple[str, str]] = None, notify: Callable[[], None] = None):
+        """
+        Match a synthetic route with each pipeline once.
+
+        :param pipelines: The (matcher, routing) pipelines to run. Defaults to all pipelines.
+        :param notify: Called after each step, e.g. to tell gunicorn that the worker is alive.
+        """
+        from routing.encoding import ResponseEncoder
+        from routing.matching import get_matches
+        from routing.matching.context import match_context
+        from routing.matching.registry import ROUTING_DATA, matcher_registry
+        from routing.snapshot import get_snapshot
+        from routing.views import make_selection
+
+        # Another thread is already warming up this process
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if self.state == "pending":
+                self.preload()
+                if self.state == "failed":
+                    return
+            self.state = "running"
+            if pipelines is None:
+                pipelines = [(matcher, route_data) for matcher in matcher_registry.pipelines for route_data in ROUTING_DATA]
+
+            snapshot = get_snapshot()
+            route = make_synthetic_route(snapshot)
+            encoder = ResponseEncoder()
+            for matcher, route_data in pipelines:
+                with self.step(f"pipeline:{matcher}:{route_data}"):
+                    matchers = matcher_registry.get(matcher, route_data)
+                    with match_context(route):
+                        lsas = get_matches(route, matchers, snapshot.bike_lsas)
+                        selection = make_selection(lsas, route, snapshot, encoder)
+                    "".join(encoder.iterencode(selection))
+                if notify is not None:
+                    notify()
+            self.state = "done"
+            # E.g. if the preload in the gunicorn master failed
+            self.error = None
+        except Exception as e:
+            self.fail(e)
+        finally:
+            self.lock.release()
+
+    def describe(self) -> dict:
+        """
+        Describe the warm-up of this process, for the healthcheck.
+        """
+        return {
+            "state": self.state,
+            "steps": [{"name": step.name, "durationS": step.duration_s} for step in self.steps],
+            "error": self.error,
+            # Whether the matchers and the snapshot are shared with the gunicorn master
+            "preloadedInParent": self.preload_pid is not None and self.preload_pid != os.getpid(),
+        }
+
+
+# The warm-up of this process.
+warmup = Warmup()
@@ -58,6 +58,16 @@ if [ $ret -ne 0 ]; then
     exit $ret
 fi
 
+# Precompute the route-independent features of the lsas
+poetry run python backend/manage.py precompute_lsa_features
+
+# Check if previous command failed. If it did, exit
+ret=$?
+if [ $ret -ne 0 ]; then
+    echo "Failed to precompute SG features."
+    exit $ret
+fi
+
 # Save all SGs to a gzipped json file in the static directory
 poetry run python backend/manage.py dump_sgs
 
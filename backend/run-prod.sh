@@ -5,4 +5,6 @@
 
 # Run gunicorn
 cd backend
-poetry run gunicorn backend.wsgi:application --workers 4 --bind 0.0.0.0:8000
\ No newline at end of file
+# The metrics of the previous workers are outdated
+rm -rf "${METRICS_DIR:-metrics}"
+poetry run gunicorn backend.wsgi:application --config gunicorn.conf.py --workers 4 --bind 0.0.0.0:8000
\ No newline at end of file